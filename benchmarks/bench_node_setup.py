@@ -0,0 +1,242 @@
+"""Benchmark the node setup hot paths of simple_material_helper.
+
+Without Blender, runs against the recording bpy stand-in (recording_bpy.py),
+which also reports RNA read/write counts and node/link creations:
+
+    python benchmarks/bench_node_setup.py --materials 500 --meshes 2000 --slots 3
+
+To run against real Blender instead (wall times only):
+
+    python benchmarks/bench_node_setup.py --blender /path/to/blender ...
+
+which runs this same script with `blender -b --factory-startup --python`.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--materials", type=int, default=200)
+    parser.add_argument("--meshes", type=int, default=1000)
+    parser.add_argument(
+        "--slots", type=int, default=2, help="materials per mesh (material slots)"
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=50,
+        help="number of materials to time single material entry points on",
+    )
+    parser.add_argument("--json", type=Path, help="also write the results to a file")
+    parser.add_argument(
+        "--blender", help="run in the given Blender executable instead of the stand-in"
+    )
+    return parser.parse_args(argv)
+
+
+def run_in_blender(args, argv):
+    command = [
+        args.blender,
+        "-b",
+        "--factory-startup",
+        "--python-exit-code",
+        "1",
+        "--python",
+        str(Path(__file__).resolve()),
+        "--",
+    ]
+    skip_next = False
+    for arg in argv:
+        if skip_next:
+            skip_next = False
+            continue
+        if arg == "--blender":
+            skip_next = True
+            continue
+        if arg.startswith("--blender="):
+            continue
+        command.append(arg)
+    return subprocess.run(command).returncode
+
+
+def import_bpy():
+    """Import the real bpy if running in Blender, or the recording stand-in"""
+    try:
+        import bpy
+
+        return bpy, False
+    except ImportError:
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        import recording_bpy
+
+        return recording_bpy.install(), True
+
+
+def make_scene(bpy, n_materials, n_meshes, n_slots):
+    materials = []
+    for i in range(n_materials):
+        mat = bpy.data.materials.new(f"Material {i}")
+        mat.use_nodes = True
+        materials.append(mat)
+    images = [bpy.data.images.new(f"Image {i}", 32, 32) for i in range(n_materials)]
+    for i in range(n_meshes):
+        mesh = bpy.data.meshes.new(f"Mesh {i}")
+        for j in range(n_slots):
+            mesh.materials.append(materials[(i * n_slots + j) % n_materials])
+        object = bpy.data.objects.new(f"Object {i}", mesh)
+        if hasattr(bpy.context, "collection") and bpy.context.collection is not None:
+            bpy.context.collection.objects.link(object)
+    return materials, images
+
+
+class Results:
+    def __init__(self, bpy, is_recording):
+        self.bpy = bpy
+        self.is_recording = is_recording
+        self.rows = []
+
+    def measure(self, name, function, calls=1):
+        if self.is_recording:
+            self.bpy.reset_counters()
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        row = {"name": name, "calls": calls, "seconds": duration}
+        if self.is_recording:
+            row.update(self.bpy.COUNTERS)
+        self.rows.append(row)
+
+    def print(self):
+        columns = (
+            "rna_reads",
+            "rna_writes",
+            "nodes_created",
+            "links_created",
+        )
+        header = f"{'entry point':<40} {'calls':>6} {'total ms':>10} {'ms/call':>9}"
+        for column in columns:
+            header += f" {column + '/call':>19}"
+        print(header)
+        for row in self.rows:
+            line = (
+                f"{row['name']:<40} {row['calls']:>6} "
+                f"{row['seconds'] * 1000:>10.2f} "
+                f"{row['seconds'] * 1000 / row['calls']:>9.3f}"
+            )
+            for column in columns:
+                if self.is_recording:
+                    line += f" {row.get(column, 0) / row['calls']:>19.1f}"
+                else:
+                    line += f" {'-':>19}"
+            print(line)
+
+
+def main(argv):
+    args = parse_args(argv)
+
+    if args.blender:
+        return run_in_blender(args, argv)
+
+    bpy, is_recording = import_bpy()
+
+    sys.path.insert(0, str(REPO_DIR))
+    import simple_material_helper as smh
+
+    smh.register()
+    try:
+        materials, images = make_scene(bpy, args.materials, args.meshes, args.slots)
+        samples = materials[: args.samples]
+        results = Results(bpy, is_recording)
+
+        results.measure(
+            "MATERIAL_USERS_INDEX.rebuild",
+            smh.MATERIAL_USERS_INDEX.rebuild,
+        )
+
+        # only schedules updates, which set_simple_materials then takes over
+        for mat, image in zip(materials, images):
+            mat.simple_material_helper.image = image
+        results.measure(
+            "set_simple_materials (first setup)",
+            lambda: smh.set_simple_materials(materials),
+            len(materials),
+        )
+        results.measure(
+            "set_simple_materials (up to date)",
+            lambda: smh.set_simple_materials(materials),
+            len(materials),
+        )
+
+        results.measure(
+            "ensure_setup_and_get_nodes",
+            lambda: [smh.ensure_setup_and_get_nodes(mat) for mat in samples],
+            len(samples),
+        )
+        results.measure(
+            "set_simple_material",
+            lambda: [smh.set_simple_material(mat) for mat in samples],
+            len(samples),
+        )
+
+        def set_uv_repeats():
+            for mat in samples:
+                props = mat.simple_material_helper
+                props.uv_repeat_u = "MIRROR"
+                props.uv_repeat_v = "CLAMP"
+                props.uv_repeat_u = "WRAP"
+                props.uv_repeat_v = "WRAP"
+            smh.flush_material_updates()
+
+        results.measure(
+            "uv repeat callbacks (4 writes) + flush",
+            set_uv_repeats,
+            len(samples),
+        )
+
+        def set_images():
+            for mat, image in zip(samples, reversed(images)):
+                mat.simple_material_helper.image = image
+            smh.flush_material_updates()
+
+        results.measure("image callback + flush", set_images, len(samples))
+
+        print(
+            f"{args.materials} materials, {args.meshes} meshes, {args.slots} slots, "
+            + ("recording stand-in" if is_recording else bpy.app.version_string)
+        )
+        results.print()
+
+        if args.json:
+            with args.json.open("w") as f:
+                json.dump(
+                    {
+                        "materials": args.materials,
+                        "meshes": args.meshes,
+                        "slots": args.slots,
+                        "recording": is_recording,
+                        "results": results.rows,
+                    },
+                    f,
+                    indent=1,
+                )
+    finally:
+        smh.unregister()
+
+    return 0
+
+
+if __name__ == "__main__":
+    if "--" in sys.argv:
+        # in Blender, arguments for the script are after "--"
+        argv = sys.argv[sys.argv.index("--") + 1 :]
+    else:
+        argv = sys.argv[1:]
+    sys.exit(main(argv))
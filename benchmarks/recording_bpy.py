@@ -0,0 +1,1329 @@
+"""A lightweight recording stand-in for the parts of bpy used by the addon.
+
+It implements just enough of bpy (data collections, materials, meshes, objects,
+images, node trees, nodes, sockets and links, properties, handlers, timers) for
+simple_material_helper to be imported, registered and driven without Blender.
+
+Every access to a public attribute of a bpy struct is counted as a RNA read or
+write, and node/link creations and removals are counted too, in COUNTERS.
+
+Use install() before importing the addon.
+"""
+
+import collections
+import itertools
+import os
+import sys
+import tempfile
+import types
+
+COUNTERS = collections.Counter()
+
+
+def reset_counters():
+    COUNTERS.clear()
+
+
+# Structs
+
+
+class StructMeta(type):
+    # Properties assigned to classes after their definition, like
+    # bpy.types.Material.simple_material_helper = bpy.props.PointerProperty(...)
+    def __setattr__(cls, name, value):
+        if isinstance(value, PropertyDef):
+            value = PropertyDescriptor(name, value)
+        super().__setattr__(name, value)
+
+
+class Struct(metaclass=StructMeta):
+    """Base of all recorded types, counts public attribute reads and writes"""
+
+    def __getattribute__(self, name):
+        if name[0] != "_":
+            COUNTERS["rna_reads"] += 1
+        return object.__getattribute__(self, name)
+
+    def __setattr__(self, name, value):
+        if name[0] != "_":
+            COUNTERS["rna_writes"] += 1
+        object.__setattr__(self, name, value)
+
+    @property
+    def id_data(self):
+        return self._id_data
+
+    def as_pointer(self):
+        return id(self)
+
+
+def _init(struct, **attrs):
+    """Set attributes without recording them, for initializing structs"""
+    for name, value in attrs.items():
+        object.__setattr__(struct, name, value)
+
+
+def _get(struct, name):
+    """Get an attribute without recording it"""
+    return object.__getattribute__(struct, name)
+
+
+# Properties
+
+
+class PropertyDef:
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        self.kwargs = kwargs
+
+    def get_default(self):
+        kwargs = self.kwargs
+        if self.kind == "PointerProperty":
+            return None
+        if "default" in kwargs:
+            return kwargs["default"]
+        if self.kind == "EnumProperty":
+            return kwargs["items"][0][0]
+        if self.kind == "BoolProperty":
+            return False
+        if self.kind in {"IntProperty", "FloatProperty"}:
+            return 0
+        if self.kind == "StringProperty":
+            return ""
+        if self.kind == "FloatVectorProperty":
+            return (0.0,) * kwargs.get("size", 3)
+        return None
+
+
+class PropertyDescriptor:
+    def __init__(self, name, definition: PropertyDef):
+        self.name = name
+        self.definition = definition
+
+    def _get_storage(self, instance):
+        try:
+            return object.__getattribute__(instance, "_props")
+        except AttributeError:
+            storage = dict()
+            object.__setattr__(instance, "_props", storage)
+            return storage
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        storage = self._get_storage(instance)
+        if self.name not in storage:
+            definition = self.definition
+            pointer_type = definition.kwargs.get("type")
+            if (
+                definition.kind == "PointerProperty"
+                and pointer_type is not None
+                and issubclass(pointer_type, PropertyGroup)
+            ):
+                group = pointer_type()
+                object.__setattr__(
+                    group, "_id_data", getattr(instance, "_id_data", instance)
+                )
+                storage[self.name] = group
+            else:
+                storage[self.name] = definition.get_default()
+        return storage[self.name]
+
+    def __set__(self, instance, value):
+        storage = self._get_storage(instance)
+        storage[self.name] = value
+        update = self.definition.kwargs.get("update")
+        if update is not None:
+            update(instance, context)
+
+
+def _make_prop_function(kind):
+    def prop_function(**kwargs):
+        return PropertyDef(kind, **kwargs)
+
+    prop_function.__name__ = kind
+    return prop_function
+
+
+props = types.ModuleType("bpy.props")
+for _kind in (
+    "BoolProperty",
+    "IntProperty",
+    "FloatProperty",
+    "FloatVectorProperty",
+    "StringProperty",
+    "EnumProperty",
+    "PointerProperty",
+    "CollectionProperty",
+):
+    setattr(props, _kind, _make_prop_function(_kind))
+
+
+# ID and collections
+
+
+class IDCollection(Struct):
+    def __init__(self, factory):
+        self._items = dict()
+        self._factory = factory
+
+    def _unique_name(self, name):
+        if name not in self._items:
+            return name
+        i = 1
+        while f"{name}.{i:03}" in self._items:
+            i += 1
+        return f"{name}.{i:03}"
+
+    def _rename(self, id, new_name):
+        del self._items[id._name]
+        new_name = self._unique_name(new_name)
+        id._name = new_name
+        self._items[new_name] = id
+
+    def new(self, name, *args, **kwargs):
+        id = self._factory(*args, **kwargs)
+        id._name = self._unique_name(name)
+        id._collection = self
+        self._items[id._name] = id
+        return id
+
+    def get(self, name, default=None):
+        return self._items.get(name, default)
+
+    def remove(self, id, do_unlink=True):
+        del self._items[id._name]
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self._items.values())[key]
+        return self._items[key]
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+
+class ImageCollection(IDCollection):
+    def load(self, filepath, check_existing=False):
+        if check_existing:
+            for image in self._items.values():
+                if _get(image, "filepath") == filepath:
+                    return image
+        image = self.new(os.path.basename(filepath), 1, 1)
+        _init(image, source="FILE", filepath=filepath, filepath_raw=filepath)
+        return image
+
+
+class IDPropertyGroup(dict):
+    def to_dict(self):
+        return {
+            key: value.to_dict() if isinstance(value, IDPropertyGroup) else value
+            for key, value in self.items()
+        }
+
+
+def _to_idprop(value):
+    """Copy values like Blender does when storing them in ID properties"""
+    if isinstance(value, dict):
+        return IDPropertyGroup((key, _to_idprop(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_to_idprop(item) for item in value]
+    return value
+
+
+class ID(Struct):
+    def __init__(self):
+        self._name = ""
+        self._collection = None
+        self._users = 0
+        self._idprops = dict()
+        self._id_data = self
+        _init(self, use_fake_user=False, library=None)
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._collection._rename(self, value)
+
+    @property
+    def users(self):
+        return self._users + int(_get(self, "use_fake_user"))
+
+    @property
+    def original(self):
+        return self
+
+    def get(self, key, default=None):
+        return self._idprops.get(key, default)
+
+    def __getitem__(self, key):
+        return self._idprops[key]
+
+    def __setitem__(self, key, value):
+        COUNTERS["rna_writes"] += 1
+        self._idprops[key] = _to_idprop(value)
+
+    def __delitem__(self, key):
+        COUNTERS["rna_writes"] += 1
+        del self._idprops[key]
+
+    def __contains__(self, key):
+        return key in self._idprops
+
+    def keys(self):
+        return self._idprops.keys()
+
+
+def _add_user(id):
+    if id is not None:
+        id._users += 1
+
+
+def _remove_user(id):
+    if id is not None:
+        id._users -= 1
+
+
+class Image(ID):
+    def __init__(self, width=0, height=0, alpha=False, **kwargs):
+        super().__init__()
+        _init(
+            self,
+            size=(width, height),
+            filepath="",
+            filepath_raw="",
+            source="GENERATED",
+            frame_duration=1,
+            is_dirty=False,
+            packed_file=None,
+            alpha_mode="STRAIGHT",
+            colorspace_settings=types.SimpleNamespace(name="sRGB"),
+            pixels=FloatBuffer(width * height * 4, 1.0),
+        )
+
+    def scale(self, width, height):
+        _init(self, size=(width, height), pixels=FloatBuffer(width * height * 4, 1.0))
+
+    def pack(self):
+        _init(self, packed_file=types.SimpleNamespace(size=len(_get(self, "pixels"))))
+
+
+class FloatBuffer(Struct):
+    """Like the pixels of images, with foreach_get/foreach_set"""
+
+    def __init__(self, length, value=0.0):
+        self._data = [value] * length
+
+    def __len__(self):
+        return len(self._data)
+
+    def foreach_get(self, seq):
+        seq[:] = self._data
+
+    def foreach_set(self, seq):
+        self._data[:] = list(seq)
+
+
+class Material(ID):
+    def __init__(self):
+        super().__init__()
+        self._node_tree = None
+        _init(
+            self,
+            use_backface_culling=False,
+            blend_method="OPAQUE",
+            alpha_threshold=0.5,
+        )
+
+    @property
+    def node_tree(self):
+        return self._node_tree
+
+    @property
+    def use_nodes(self):
+        return self._node_tree is not None
+
+    @use_nodes.setter
+    def use_nodes(self, value):
+        if value and self._node_tree is None:
+            node_tree = ShaderNodeTree()
+            node_tree._name = "Shader Nodetree"
+            node_tree._id_data = node_tree
+            self._node_tree = node_tree
+            shader_node = node_tree.nodes.new("ShaderNodeBsdfPrincipled")
+            output_node = node_tree.nodes.new("ShaderNodeOutputMaterial")
+            node_tree.links.new(shader_node.outputs["BSDF"], output_node.inputs[0])
+
+
+class MaterialList(Struct):
+    """The materials of a mesh"""
+
+    def __init__(self, owner):
+        self._owner = owner
+        self._materials = []
+
+    def append(self, material):
+        self._materials.append(material)
+        _add_user(material)
+
+    def __getitem__(self, i):
+        return self._materials[i]
+
+    def __setitem__(self, i, material):
+        _remove_user(self._materials[i])
+        self._materials[i] = material
+        _add_user(material)
+
+    def __iter__(self):
+        return iter(list(self._materials))
+
+    def __len__(self):
+        return len(self._materials)
+
+    def values(self):
+        return list(self._materials)
+
+
+class VertexColors(Struct):
+    def __init__(self):
+        self._layers = []
+        self._active = None
+
+    @property
+    def active(self):
+        return self._active
+
+    def new(self, name="Col", do_init=True):
+        layer = types.SimpleNamespace(name=name, data=AttributeArray())
+        self._layers.append(layer)
+        if self._active is None:
+            self._active = layer
+        return layer
+
+    def __len__(self):
+        return len(self._layers)
+
+    def __iter__(self):
+        return iter(list(self._layers))
+
+
+class AttributeArray(Struct):
+    """Like mesh.polygons or uv_layer.data, only supporting foreach_get/set"""
+
+    def __init__(self, length=0, **attributes):
+        self._length = length
+        # attribute name -> flat list of values
+        self._attributes = attributes
+
+    def __len__(self):
+        return self._length
+
+    def foreach_get(self, attribute, seq):
+        seq[:] = self._attributes[attribute]
+
+    def foreach_set(self, attribute, seq):
+        self._attributes[attribute] = list(seq)
+
+
+class UVLayers(Struct):
+    def __init__(self):
+        self._layers = []
+
+    @property
+    def active(self):
+        return self._layers[0] if self._layers else None
+
+    def new(self, name="UVMap", n_loops=0):
+        layer = types.SimpleNamespace(
+            name=name, data=AttributeArray(n_loops, uv=[0.0] * (2 * n_loops))
+        )
+        self._layers.append(layer)
+        return layer
+
+    def __len__(self):
+        return len(self._layers)
+
+    def __iter__(self):
+        return iter(list(self._layers))
+
+
+class ColorAttributes(Struct):
+    def __init__(self, mesh):
+        self._mesh = mesh
+        self._layers = []
+        self._active = None
+
+    @property
+    def active_color(self):
+        return self._active
+
+    @active_color.setter
+    def active_color(self, layer):
+        self._active = layer
+
+    def new(self, name, type, domain):
+        mesh = self._mesh
+        length = len(_get(mesh, "vertices" if domain == "POINT" else "loops"))
+        layer = types.SimpleNamespace(
+            name=name,
+            data_type=type,
+            domain=domain,
+            data=AttributeArray(length, color=[0.0] * (4 * length)),
+        )
+        self._layers.append(layer)
+        if self._active is None:
+            self._active = layer
+        return layer
+
+    def __len__(self):
+        return len(self._layers)
+
+    def __iter__(self):
+        return iter(list(self._layers))
+
+
+class Mesh(ID):
+    def __init__(self):
+        super().__init__()
+        _init(
+            self,
+            materials=MaterialList(self),
+            vertex_colors=VertexColors(),
+            polygons=AttributeArray(),
+            vertices=AttributeArray(),
+            loops=AttributeArray(),
+            edges=AttributeArray(),
+            uv_layers=UVLayers(),
+            color_attributes=ColorAttributes(self),
+        )
+
+    def update(self):
+        pass
+
+    def _reorder_faces(self, order):
+        """Reorder the faces and their loop data, order[i] being the old index
+        of the face at i
+        """
+        polygons = _get(self, "polygons")
+        attributes = polygons._attributes
+        loop_starts = attributes["loop_start"]
+        loop_totals = attributes["loop_total"]
+        loop_order = [
+            loop
+            for i in order
+            for loop in range(loop_starts[i], loop_starts[i] + loop_totals[i])
+        ]
+
+        def reorder(values, items, size):
+            return [values[item * size + k] for item in items for k in range(size)]
+
+        for name, values in list(attributes.items()):
+            if name != "loop_start":
+                attributes[name] = reorder(values, order, len(values) // len(order))
+        attributes["loop_start"] = [
+            0,
+            *itertools.accumulate(attributes["loop_total"]),
+        ][:-1]
+        loop_arrays = [layer.data for layer in _get(self, "uv_layers")._layers] + [
+            layer.data for layer in _get(self, "vertex_colors")._layers
+        ]
+        loop_arrays += [
+            layer.data
+            for layer in _get(self, "color_attributes")._layers
+            if layer.domain == "CORNER"
+        ]
+        loop_arrays.append(_get(self, "loops"))
+        for array in loop_arrays:
+            for name, values in list(array._attributes.items()):
+                if values:
+                    array._attributes[name] = reorder(
+                        values, loop_order, len(values) // len(loop_order)
+                    )
+
+    def set_faces(
+        self, loop_totals, material_indices, uvs, co=None, loop_vertex_indices=None
+    ):
+        """Set up faces with the given number of loops and their UVs,
+        as a flat list of (u, v) for all loops.
+
+        Optionally also the vertex positions, as a flat list of (x, y, z), and
+        the vertex of each loop. Normals all point up.
+        """
+        loop_starts = [0, *itertools.accumulate(loop_totals)][:-1]
+        n_loops = sum(loop_totals)
+        _init(
+            self,
+            polygons=AttributeArray(
+                len(loop_totals),
+                loop_start=loop_starts,
+                loop_total=list(loop_totals),
+                material_index=list(material_indices),
+                use_smooth=[True] * len(loop_totals),
+                normal=[0.0, 0.0, 1.0] * len(loop_totals),
+            ),
+        )
+        if co is not None:
+            n_vertices = len(co) // 3
+            edges = set()
+            for start, total in zip(loop_starts, loop_totals):
+                face = loop_vertex_indices[start : start + total]
+                for a, b in zip(face, face[1:] + face[:1]):
+                    edges.add((min(a, b), max(a, b)))
+            _init(
+                self,
+                vertices=AttributeArray(
+                    n_vertices, co=list(co), normal=[0.0, 0.0, 1.0] * n_vertices
+                ),
+                loops=AttributeArray(n_loops, vertex_index=list(loop_vertex_indices)),
+                edges=AttributeArray(
+                    len(edges), vertices=[i for edge in sorted(edges) for i in edge]
+                ),
+            )
+        uv_layers = UVLayers()
+        uv_layers.new(n_loops=len(uvs) // 2).data.foreach_set("uv", uvs)
+        _init(self, uv_layers=uv_layers)
+
+
+class MaterialSlot(Struct):
+    def __init__(self, object, index):
+        self._object = object
+        self._index = index
+
+    @property
+    def link(self):
+        return "DATA"
+
+    @property
+    def material(self):
+        return self._object._data.materials._materials[self._index]
+
+    @material.setter
+    def material(self, material):
+        self._object._data.materials[self._index] = material
+
+
+class Object(ID):
+    def __init__(self, data=None):
+        super().__init__()
+        self._data = data
+        _add_user(data)
+        _init(
+            self,
+            type="MESH" if isinstance(data, Mesh) else "EMPTY",
+            matrix_world=[
+                [1.0, 0.0, 0.0, 0.0],
+                [0.0, 1.0, 0.0, 0.0],
+                [0.0, 0.0, 1.0, 0.0],
+                [0.0, 0.0, 0.0, 1.0],
+            ],
+        )
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def material_slots(self):
+        if self._data is None:
+            return []
+        return [
+            MaterialSlot(self, i) for i in range(len(self._data.materials._materials))
+        ]
+
+    def select_get(self):
+        return False
+
+
+class ImageUser(Struct):
+    def __init__(self):
+        _init(
+            self,
+            frame_duration=1,
+            frame_start=1,
+            frame_offset=0,
+            use_cyclic=False,
+            use_auto_refresh=False,
+        )
+
+
+# Node trees
+
+
+class NodeSocket(Struct):
+    def __init__(self, node, name, is_output, default_value):
+        self._node = node
+        self._links = []
+        _init(self, name=name, is_output=is_output)
+        if default_value is not None:
+            _init(
+                self,
+                default_value=(
+                    list(default_value)
+                    if isinstance(default_value, tuple)
+                    else default_value
+                ),
+            )
+
+    @property
+    def node(self):
+        return self._node
+
+    @property
+    def is_linked(self):
+        return bool(self._links)
+
+    @property
+    def links(self):
+        return list(self._links)
+
+
+class NodeSockets(Struct):
+    def __init__(self, node, is_output, definitions):
+        self._sockets = [
+            NodeSocket(node, name, is_output, default_value)
+            for name, default_value in definitions
+        ]
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._sockets[key]
+        for socket in self._sockets:
+            if socket._props["name"] == key:
+                return socket
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(list(self._sockets))
+
+    def __len__(self):
+        return len(self._sockets)
+
+
+# Sockets' name is stored like properties to read it without counting
+NodeSocket.name = PropertyDescriptor("name", PropertyDef("StringProperty"))
+
+_COLOR = (0.8, 0.8, 0.8, 1.0)
+_VECTOR = (0.0, 0.0, 0.0)
+
+# bl_idname: (inputs, outputs, properties)
+NODE_TYPES = {
+    "ShaderNodeOutputMaterial": (
+        (("Surface", None), ("Volume", None), ("Displacement", _VECTOR)),
+        (),
+        {"target": "ALL", "is_active_output": True},
+    ),
+    "ShaderNodeBsdfPrincipled": (
+        (
+            ("Base Color", _COLOR),
+            ("Metallic", 0.0),
+            ("Specular", 0.5),
+            ("Roughness", 0.5),
+            ("Emission", (0.0, 0.0, 0.0, 1.0)),
+            ("Alpha", 1.0),
+            ("Normal", _VECTOR),
+        ),
+        (("BSDF", None),),
+        {"distribution": "GGX", "subsurface_method": "RANDOM_WALK"},
+    ),
+    "ShaderNodeTexImage": (
+        (("Vector", _VECTOR),),
+        (("Color", _COLOR), ("Alpha", 1.0)),
+        {
+            "image": None,
+            "extension": "REPEAT",
+            "interpolation": "Linear",
+            "projection": "FLAT",
+        },
+    ),
+    "ShaderNodeVertexColor": (
+        (),
+        (("Color", _COLOR), ("Alpha", 1.0)),
+        {"layer_name": ""},
+    ),
+    "ShaderNodeVectorMath": (
+        (("Vector", _VECTOR), ("Vector", _VECTOR), ("Vector", _VECTOR), ("Scale", 1.0)),
+        (("Vector", _VECTOR), ("Value", 0.0)),
+        {"operation": "ADD"},
+    ),
+    "ShaderNodeMath": (
+        (("Value", 0.5), ("Value", 0.5), ("Value", 0.5)),
+        (("Value", 0.0),),
+        {"operation": "ADD", "use_clamp": False},
+    ),
+    "ShaderNodeUVMap": (
+        (),
+        (("UV", _VECTOR),),
+        {"uv_map": "", "from_instancer": False},
+    ),
+    "ShaderNodeSeparateXYZ": (
+        (("Vector", _VECTOR),),
+        (("X", 0.0), ("Y", 0.0), ("Z", 0.0)),
+        {},
+    ),
+    "ShaderNodeCombineXYZ": (
+        (("X", 0.0), ("Y", 0.0), ("Z", 0.0)),
+        (("Vector", _VECTOR),),
+        {},
+    ),
+    "ShaderNodeClamp": (
+        (("Value", 1.0), ("Min", 0.0), ("Max", 1.0)),
+        (("Result", 0.0),),
+        {"clamp_type": "MINMAX"},
+    ),
+    "ShaderNodeMapRange": (
+        (
+            ("Value", 1.0),
+            ("From Min", 0.0),
+            ("From Max", 1.0),
+            ("To Min", 0.0),
+            ("To Max", 1.0),
+            ("Steps", 4.0),
+        ),
+        (("Result", 0.0),),
+        {"data_type": "FLOAT", "interpolation_type": "LINEAR", "clamp": True},
+    ),
+    "ShaderNodeValue": (
+        (),
+        (("Value", 0.5),),
+        {},
+    ),
+}
+
+# Nodes with sockets from the node group interface
+GROUP_NODE_TYPES = {"ShaderNodeGroup", "NodeGroupInput", "NodeGroupOutput"}
+
+
+class Node(Struct):
+    def __init__(self, node_tree, bl_idname):
+        self._node_tree = node_tree
+        self._id_data = node_tree
+        self._name = ""
+        self._group_tree = None
+        self._group_version = None
+        self._bl_idname = bl_idname
+        _init(self, bl_idname=bl_idname, location=(0, 0))
+        if bl_idname in GROUP_NODE_TYPES:
+            self._inputs = NodeSockets(self, False, ())
+            self._outputs = NodeSockets(self, True, ())
+        else:
+            inputs, outputs, properties = NODE_TYPES[bl_idname]
+            self._inputs = NodeSockets(self, False, inputs)
+            self._outputs = NodeSockets(self, True, outputs)
+            for name, value in properties.items():
+                object.__setattr__(self, name, value)
+        if bl_idname == "ShaderNodeTexImage":
+            object.__setattr__(self, "image_user", ImageUser())
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._node_tree._nodes._rename(self, value)
+
+    def _sync_group_sockets(self):
+        if self._bl_idname == "ShaderNodeGroup":
+            group_tree = self._group_tree
+        elif self._bl_idname in GROUP_NODE_TYPES:
+            group_tree = self._node_tree
+        else:
+            return
+        version = None if group_tree is None else group_tree._interface_version
+        if version == self._group_version:
+            return
+        self._group_version = version
+        if group_tree is None:
+            self._inputs = NodeSockets(self, False, ())
+            self._outputs = NodeSockets(self, True, ())
+            return
+        group_inputs = [
+            (_get(socket, "name"), None) for socket in group_tree._inputs._sockets
+        ]
+        group_outputs = [
+            (_get(socket, "name"), None) for socket in group_tree._outputs._sockets
+        ]
+        if self._bl_idname == "ShaderNodeGroup":
+            self._inputs = NodeSockets(self, False, group_inputs)
+            self._outputs = NodeSockets(self, True, group_outputs)
+        elif self._bl_idname == "NodeGroupInput":
+            self._outputs = NodeSockets(self, True, group_inputs)
+        else:
+            self._inputs = NodeSockets(self, False, group_outputs)
+        for socket in self._inputs._sockets + self._outputs._sockets:
+            _init(socket, default_value=0.0)
+
+    @property
+    def inputs(self):
+        self._sync_group_sockets()
+        return self._inputs
+
+    @property
+    def outputs(self):
+        self._sync_group_sockets()
+        return self._outputs
+
+    @property
+    def node_tree(self):
+        return self._group_tree
+
+    @node_tree.setter
+    def node_tree(self, value):
+        if self._group_tree is not None:
+            _remove_user(self._group_tree)
+        self._group_tree = value
+        _add_user(value)
+        self._group_version = -1
+
+
+class Nodes(Struct):
+    def __init__(self, node_tree):
+        self._node_tree = node_tree
+        self._nodes = dict()
+
+    def _unique_name(self, name):
+        if name not in self._nodes:
+            return name
+        i = 1
+        while f"{name}.{i:03}" in self._nodes:
+            i += 1
+        return f"{name}.{i:03}"
+
+    def _rename(self, node, new_name):
+        del self._nodes[node._name]
+        node._name = self._unique_name(new_name)
+        self._nodes[node._name] = node
+
+    def new(self, type):
+        COUNTERS["nodes_created"] += 1
+        node = Node(self._node_tree, type)
+        node._name = self._unique_name(type)
+        self._nodes[node._name] = node
+        return node
+
+    def remove(self, node):
+        COUNTERS["nodes_removed"] += 1
+        for socket in node._inputs._sockets + node._outputs._sockets:
+            for link in list(socket._links):
+                self._node_tree.links._remove(link)
+        del self._nodes[node._name]
+
+    def get(self, name, default=None):
+        return self._nodes.get(name, default)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self._nodes.values())[key]
+        return self._nodes[key]
+
+    def __iter__(self):
+        return iter(list(self._nodes.values()))
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+class NodeLink(Struct):
+    def __init__(self, from_socket, to_socket):
+        self._from_socket = from_socket
+        self._to_socket = to_socket
+
+    from_socket = property(lambda self: self._from_socket)
+    to_socket = property(lambda self: self._to_socket)
+    from_node = property(lambda self: self._from_socket._node)
+    to_node = property(lambda self: self._to_socket._node)
+
+
+class NodeLinks(Struct):
+    def __init__(self):
+        self._links = []
+
+    def new(self, input, output, verify_limits=True):
+        COUNTERS["links_created"] += 1
+        from_socket, to_socket = (
+            (input, output) if input._props["is_output"] else (output, input)
+        )
+        if verify_limits:
+            for link in list(to_socket._links):
+                self._remove(link)
+        link = NodeLink(from_socket, to_socket)
+        from_socket._links.append(link)
+        to_socket._links.append(link)
+        self._links.append(link)
+        return link
+
+    def _remove(self, link):
+        link._from_socket._links.remove(link)
+        link._to_socket._links.remove(link)
+        self._links.remove(link)
+
+    def remove(self, link):
+        COUNTERS["links_removed"] += 1
+        self._remove(link)
+
+    def __iter__(self):
+        return iter(list(self._links))
+
+    def __len__(self):
+        return len(self._links)
+
+
+NodeSocket.is_output = PropertyDescriptor("is_output", PropertyDef("BoolProperty"))
+
+
+class InterfaceSocket(Struct):
+    def __init__(self, name, bl_socket_idname):
+        _init(self, name=name, bl_socket_idname=bl_socket_idname)
+
+
+class InterfaceSockets(Struct):
+    """Node group inputs or outputs, as in Blender before 4.0"""
+
+    def __init__(self, node_tree):
+        self._node_tree = node_tree
+        self._sockets = []
+
+    def new(self, type, name):
+        self._sockets.append(InterfaceSocket(name, type))
+        self._node_tree._interface_version += 1
+
+    def clear(self):
+        self._sockets.clear()
+        self._node_tree._interface_version += 1
+
+    def __iter__(self):
+        return iter(list(self._sockets))
+
+    def __len__(self):
+        return len(self._sockets)
+
+
+class NodeTree(ID):
+    def __init__(self, type="ShaderNodeTree"):
+        super().__init__()
+        self._interface_version = 0
+        self._bl_idname = type
+        self._nodes = Nodes(self)
+        self._links = NodeLinks()
+        self._inputs = InterfaceSockets(self)
+        self._outputs = InterfaceSockets(self)
+
+    bl_idname = property(lambda self: self._bl_idname)
+    nodes = property(lambda self: self._nodes)
+    links = property(lambda self: self._links)
+    inputs = property(lambda self: self._inputs)
+    outputs = property(lambda self: self._outputs)
+
+
+class ShaderNodeTree(NodeTree):
+    pass
+
+
+# Property groups and registrable classes
+
+
+class PropertyGroup(Struct):
+    pass
+
+
+class AddonPreferences(Struct):
+    pass
+
+
+class Operator(Struct):
+    def report(self, type, message):
+        pass
+
+
+class Panel(Struct):
+    pass
+
+
+class UIList(Struct):
+    pass
+
+
+class Menu(Struct):
+    pass
+
+
+class WindowManager(Struct):
+    # no UI
+    windows = ()
+
+    def progress_begin(self, min, max):
+        pass
+
+    def progress_update(self, value):
+        pass
+
+    def progress_end(self):
+        pass
+
+
+class Scene(ID):
+    def __init__(self):
+        super().__init__()
+        _init(
+            self,
+            frame_current=1,
+            frame_start=1,
+            frame_subframe=0.0,
+            render=types.SimpleNamespace(fps=20, fps_base=1.0),
+        )
+
+
+class Context(Struct):
+    def __init__(self):
+        _init(
+            self,
+            window_manager=WindowManager(),
+            selected_objects=[],
+            material=None,
+            scene=None,
+            collection=None,
+            preferences=types.SimpleNamespace(addons=dict()),
+        )
+
+
+class _TypesModule(types.ModuleType):
+    def __getattr__(self, name):
+        # placeholder for types only used in annotations
+        cls = StructMeta(name, (Struct,), {})
+        setattr(self, name, cls)
+        return cls
+
+
+bpy_types = _TypesModule("bpy.types")
+for _cls in (
+    Struct,
+    ID,
+    Image,
+    Material,
+    Mesh,
+    Object,
+    Scene,
+    NodeTree,
+    ShaderNodeTree,
+    Node,
+    NodeSocket,
+    NodeLink,
+    PropertyGroup,
+    AddonPreferences,
+    Operator,
+    Panel,
+    UIList,
+    Menu,
+    WindowManager,
+    Context,
+):
+    setattr(bpy_types, _cls.__name__, _cls)
+bpy_types.bpy_struct = Struct
+
+
+# bpy.data
+
+
+class BlendData:
+    def __init__(self):
+        self.materials = IDCollection(Material)
+        self.meshes = IDCollection(Mesh)
+        self.objects = IDCollection(Object)
+        self.images = ImageCollection(Image)
+        self.node_groups = IDCollection(NodeTree)
+        self.curves = IDCollection(ID)
+        self.metaballs = IDCollection(ID)
+        self.scenes = IDCollection(Scene)
+        self.texts = IDCollection(ID)
+        self.filepath = ""
+
+
+data = BlendData()
+context = Context()
+
+
+def reset_data():
+    """Start over with empty data, like loading an empty file"""
+    global data
+    data = BlendData()
+    module.data = data
+    scene = data.scenes.new("Scene")
+    _init(context, scene=scene, selected_objects=[], material=None)
+
+
+# bpy.app
+
+
+def persistent(function):
+    function._bpy_persistent = True
+    return function
+
+
+class Timers:
+    def __init__(self):
+        self.functions = []
+
+    def register(self, function, first_interval=0, persistent=False):
+        if function not in self.functions:
+            self.functions.append(function)
+
+    def unregister(self, function):
+        self.functions.remove(function)
+
+    def is_registered(self, function):
+        return function in self.functions
+
+    def run_pending(self):
+        """Run the registered timers once, like Blender's event loop would"""
+        for function in list(self.functions):
+            self.functions.remove(function)
+            interval = function()
+            if interval is not None:
+                self.functions.append(function)
+
+
+handlers = types.SimpleNamespace(
+    persistent=persistent,
+    depsgraph_update_post=[],
+    depsgraph_update_pre=[],
+    load_post=[],
+    load_pre=[],
+    save_pre=[],
+    save_post=[],
+    undo_post=[],
+    redo_post=[],
+    frame_change_pre=[],
+    frame_change_post=[],
+)
+
+app = types.SimpleNamespace(
+    version=(3, 3, 0),
+    version_string="3.3.0 (recording stand-in)",
+    background=True,
+    binary_path="",
+    handlers=handlers,
+    timers=Timers(),
+)
+
+
+# bpy.utils
+
+
+def _register_annotations(cls):
+    for klass in reversed(cls.__mro__):
+        for name, annotation in klass.__dict__.get("__annotations__", {}).items():
+            if isinstance(annotation, PropertyDef):
+                type.__setattr__(cls, name, PropertyDescriptor(name, annotation))
+
+
+def register_class(cls):
+    _register_annotations(cls)
+
+
+def unregister_class(cls):
+    pass
+
+
+_resource_dir = tempfile.mkdtemp(prefix="recording_bpy_")
+
+
+def user_resource(resource_type, path="", create=False):
+    return _resource_dir
+
+
+utils = types.SimpleNamespace(
+    register_class=register_class,
+    unregister_class=unregister_class,
+    user_resource=user_resource,
+)
+
+
+# bpy.path
+
+
+def abspath(path, start=None, library=None):
+    return path[2:] if path.startswith("//") else path
+
+
+bpy_path = types.ModuleType("bpy.path")
+bpy_path.abspath = abspath
+bpy_path.basename = lambda path: path.replace("\\", "/").rsplit("/", 1)[-1]
+
+
+# bmesh, only face sorting
+
+
+class BMFace:
+    def __init__(self, index):
+        self.index = index
+        self.original_index = index
+
+
+class BMFaceSeq(list):
+    def ensure_lookup_table(self):
+        pass
+
+    def sort(self):
+        list.sort(self, key=lambda face: face.index)
+
+
+class BMesh:
+    def __init__(self):
+        self.faces = BMFaceSeq()
+
+    def from_mesh(self, mesh):
+        self.faces = BMFaceSeq(BMFace(i) for i in range(len(mesh.polygons)))
+
+    def to_mesh(self, mesh):
+        mesh._reorder_faces([face.original_index for face in self.faces])
+
+    def free(self):
+        pass
+
+
+bmesh = types.ModuleType("bmesh")
+bmesh.new = BMesh
+
+
+# The module
+
+
+module = types.ModuleType("bpy")
+module.__doc__ = __doc__
+module.types = bpy_types
+module.props = props
+module.app = app
+module.utils = utils
+module.path = bpy_path
+module.data = data
+module.context = context
+module.ops = types.SimpleNamespace()
+module.COUNTERS = COUNTERS
+module.reset_counters = reset_counters
+module.reset_data = reset_data
+
+
+def install():
+    """Make `import bpy` import this stand-in, returns it"""
+    sys.modules["bpy"] = module
+    sys.modules["bpy.types"] = bpy_types
+    sys.modules["bpy.props"] = props
+    sys.modules["bpy.path"] = bpy_path
+    sys.modules["bmesh"] = bmesh
+    reset_data()
+    return module
@@ -26,486 +26,5216 @@ bl_info = {
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import bpy
+import bmesh
 
 from pathlib import Path
+import argparse
+import collections
+import concurrent.futures
+import csv
+import functools
+import hashlib
 import json
+import os
+import sys
+import time
 import traceback
 
+import numpy as np
+
 import typing
 
-if typing.TYPE_CHECKING:
-    from typing import (
-        Optional,
+if typing.TYPE_CHECKING:
+    from typing import (
+        Optional,
+    )
+
+
+class ProfileStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+
+
+class Profiler:
+    """Records call counts and durations of addon operations, and counters
+    (such as the number of meshes scanned), when enabled.
+
+    Enabled from the addon preferences, saved in the config json.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stats: "dict[str, ProfileStats]" = dict()
+        self.counters: "dict[str, int]" = dict()
+
+    def record(self, name: str, duration: float):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = ProfileStats()
+        stats.calls += 1
+        stats.total_duration += duration
+        if duration > stats.max_duration:
+            stats.max_duration = duration
+
+    def count(self, name: str, n: int):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        self.stats.clear()
+        self.counters.clear()
+
+    def to_dict(self):
+        return {
+            "stats": {
+                name: {
+                    "calls": stats.calls,
+                    "total_duration": stats.total_duration,
+                    "max_duration": stats.max_duration,
+                }
+                for name, stats in self.stats.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+
+PROFILER = Profiler()
+
+
+def profiled(name: str):
+    """Decorator recording the calls to the function in PROFILER under name.
+
+    When profiling is disabled, the only overhead is checking PROFILER.enabled.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                PROFILER.record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class MaterialUsersIndex:
+    """Maps material names to the names of the meshes using them.
+
+    Meshes use a material either directly (mesh.materials) or through the
+    material slots of an object using the mesh. Each such source is indexed
+    separately so it can be re-indexed on its own when it changes.
+
+    The index is kept up to date from depsgraph updates, and rebuilt from
+    scratch when invalidated (file load, undo/redo) or when it looks stale.
+    """
+
+    def __init__(self):
+        self.valid = False
+        # (id type, id name) -> (mesh name, frozenset of material names)
+        self._sources: "dict[tuple[str, str], tuple[str, frozenset[str]]]" = dict()
+        # material name -> mesh name -> number of sources
+        self._mesh_names_by_material: "dict[str, dict[str, int]]" = dict()
+        self._counts = None
+        # names of materials found to have users but no mesh (only used by curves,
+        # texts, node groups...), so looking them up doesn't rebuild every time
+        self._meshless_material_names: "set[str]" = set()
+
+    def _clear(self):
+        self.valid = False
+        self._sources.clear()
+        self._mesh_names_by_material.clear()
+        self._counts = None
+
+    def invalidate(self):
+        self._clear()
+        self._meshless_material_names.clear()
+
+    def _get_counts(self):
+        return len(bpy.data.meshes), len(bpy.data.objects)
+
+    def _remove_source(self, key):
+        old = self._sources.pop(key, None)
+        if old is None:
+            return
+        mesh_name, material_names = old
+        for material_name in material_names:
+            mesh_names = self._mesh_names_by_material[material_name]
+            mesh_names[mesh_name] -= 1
+            if mesh_names[mesh_name] == 0:
+                del mesh_names[mesh_name]
+            if not mesh_names:
+                del self._mesh_names_by_material[material_name]
+
+    def _set_source(self, key, mesh_name: str, material_names: "frozenset[str]"):
+        self._remove_source(key)
+        if not material_names:
+            return
+        self._sources[key] = mesh_name, material_names
+        for material_name in material_names:
+            mesh_names = self._mesh_names_by_material.setdefault(material_name, dict())
+            mesh_names[mesh_name] = mesh_names.get(mesh_name, 0) + 1
+
+    def _index_mesh(self, mesh: bpy.types.Mesh):
+        self._set_source(
+            ("MESH", mesh.name),
+            mesh.name,
+            frozenset(
+                material.name for material in mesh.materials if material is not None
+            ),
+        )
+
+    def _index_object(self, object: bpy.types.Object):
+        key = "OBJECT", object.name
+        if object.type != "MESH" or object.data is None:
+            self._remove_source(key)
+            return
+        self._set_source(
+            key,
+            object.data.name,
+            frozenset(
+                material_slot.material.name
+                for material_slot in object.material_slots
+                if material_slot.material is not None
+            ),
+        )
+
+    @profiled("MaterialUsersIndex.rebuild")
+    def rebuild(self):
+        self._clear()
+        for mesh in bpy.data.meshes:
+            self._index_mesh(mesh)
+        for object in bpy.data.objects:
+            self._index_object(object)
+        self._counts = self._get_counts()
+        self.valid = True
+        if PROFILER.enabled:
+            PROFILER.count("meshes scanned", self._counts[0])
+            PROFILER.count("objects scanned", self._counts[1])
+
+    def update_id(self, id: bpy.types.ID):
+        if not self.valid:
+            return
+        if isinstance(id, bpy.types.Mesh):
+            self._index_mesh(id)
+        elif isinstance(id, bpy.types.Object):
+            self._index_object(id)
+        else:
+            return
+        self._counts = self._get_counts()
+
+    def _lookup(self, material: bpy.types.Material):
+        meshes = []
+        for mesh_name in self._mesh_names_by_material.get(material.name, ()):
+            mesh = bpy.data.meshes.get(mesh_name)
+            if mesh is None:
+                return None
+            meshes.append(mesh)
+        if (
+            not meshes
+            and material.users > int(material.use_fake_user)
+            and material.name not in self._meshless_material_names
+        ):
+            # the material has users the index doesn't know about
+            return None
+        return meshes
+
+    def get_indexed_meshes(
+        self, material: bpy.types.Material
+    ) -> "Optional[list[bpy.types.Mesh]]":
+        """Return the meshes using the material if the index knows them, None if
+        it needs rebuilding. Never rebuilds, so it's fine to call from draw().
+        """
+        if not self.valid or self._counts != self._get_counts():
+            return None
+        return self._lookup(material)
+
+    def get_meshes(self, material: bpy.types.Material) -> "list[bpy.types.Mesh]":
+        """Return the meshes using the material, directly or through objects."""
+        rebuilt = False
+        if not self.valid or self._counts != self._get_counts():
+            self.rebuild()
+            rebuilt = True
+        meshes = self._lookup(material)
+        if meshes is None and not rebuilt:
+            self.rebuild()
+            meshes = self._lookup(material)
+        if meshes is None:
+            # the index is up to date, the users aren't meshes
+            self._meshless_material_names.add(material.name)
+            meshes = []
+        return meshes
+
+
+MATERIAL_USERS_INDEX = MaterialUsersIndex()
+
+
+@bpy.app.handlers.persistent
+def on_depsgraph_update_post(scene, depsgraph=None):
+    if depsgraph is None:
+        # Blender 2.80 doesn't pass the depsgraph
+        MATERIAL_USERS_INDEX.invalidate()
+        UV_BOUNDS_CACHE.clear()
+        VALIDATION_INDEX.invalidate()
+        ANIMATED_MATERIALS.invalidate()
+        return
+    ANIMATED_MATERIALS.on_depsgraph_update(depsgraph)
+    for update in depsgraph.updates:
+        id = update.id.original
+        if ANIMATED_MATERIALS.is_frame_update(id):
+            # only animated socket values changed
+            continue
+        MATERIAL_USERS_INDEX.update_id(id)
+        VALIDATION_INDEX.mark_dirty(id)
+        if isinstance(id, bpy.types.Image):
+            # the pixels may have changed, see get_image_key
+            IMAGE_GENERATIONS[id.name] = IMAGE_GENERATIONS.get(id.name, 0) + 1
+            UPDATE_SCHEDULER.schedule(
+                mat
+                for mat in bpy.data.materials
+                if mat.simple_material_helper.image == id
+                and mat.simple_material_helper.preview_quantized
+                and is_editable(mat)
+            )
+        if update.is_updated_geometry:
+            if isinstance(id, bpy.types.Mesh):
+                UV_BOUNDS_CACHE.invalidate_mesh(id.name)
+            elif isinstance(id, bpy.types.Object) and id.type == "MESH":
+                UV_BOUNDS_CACHE.invalidate_mesh(id.data.name)
+
+
+@bpy.app.handlers.persistent
+def on_load_post(*args):
+    MATERIAL_USERS_INDEX.invalidate()
+    UV_BOUNDS_CACHE.clear()
+    VALIDATION_INDEX.invalidate()
+    ANIMATED_MATERIALS.invalidate()
+    UPDATE_SCHEDULER.cancel()
+    TEXTURE_ANALYZER.clear()
+    IMAGE_CONTENT_HASHES.clear()
+    IMAGE_GENERATIONS.clear()
+    IMAGE_CACHES_READ.clear()
+    QUANTIZED_PREVIEW_CACHE.clear()
+    # preview images are generated, their pixels aren't saved
+    UPDATE_SCHEDULER.schedule(
+        mat
+        for mat in bpy.data.materials
+        if is_editable(mat)
+        and not has_legacy_graph(mat)
+        and mat.simple_material_helper.preview_quantized
+    )
+
+
+@bpy.app.handlers.persistent
+def on_undo_redo_post(*args):
+    # updates may have been scheduled after the undo step was pushed, which then
+    # holds the new property values but the old node graphs
+    UPDATE_SCHEDULER.cancel()
+    UPDATE_SCHEDULER.schedule(
+        mat
+        for mat in bpy.data.materials
+        if is_editable(mat)
+        and mat.node_tree is not None
+        and is_simple_material(mat)
+        and not has_legacy_graph(mat)
+        and get_material_stale_node_count(mat)
+    )
+    MATERIAL_USERS_INDEX.invalidate()
+    UV_BOUNDS_CACHE.clear()
+    VALIDATION_INDEX.invalidate()
+    ANIMATED_MATERIALS.invalidate()
+
+
+@bpy.app.handlers.persistent
+def on_frame_change_pre(scene, depsgraph=None):
+    ANIMATED_MATERIALS.update(scene, depsgraph)
+
+
+@bpy.app.handlers.persistent
+def on_frame_change_post(scene, depsgraph=None):
+    ANIMATED_MATERIALS.end_frame()
+
+
+@bpy.app.handlers.persistent
+def on_save_pre(*args):
+    write_image_caches()
+    UV_BOUNDS_CACHE.write_caches()
+
+
+handlers = (
+    (bpy.app.handlers.depsgraph_update_post, on_depsgraph_update_post),
+    (bpy.app.handlers.load_post, on_load_post),
+    (bpy.app.handlers.undo_post, on_undo_redo_post),
+    (bpy.app.handlers.redo_post, on_undo_redo_post),
+    (bpy.app.handlers.frame_change_pre, on_frame_change_pre),
+    (bpy.app.handlers.frame_change_post, on_frame_change_post),
+    (bpy.app.handlers.save_pre, on_save_pre),
+)
+
+
+class NodeSpec(typing.NamedTuple):
+    """Describes a node of a node graph, see reconcile_node_tree"""
+
+    name: str
+    bl_idname: str
+    location: "tuple[float, float]"
+    # (attribute name, value) pairs
+    # values may be callables returning the value, called when reconciling, for
+    # values such as datablocks which can't be stored in specs
+    properties: "tuple[tuple[str, typing.Any], ...]" = ()
+    # (socket name or index, default value) pairs
+    inputs: "tuple[tuple[typing.Union[str, int], typing.Any], ...]" = ()
+    outputs: "tuple[tuple[typing.Union[str, int], typing.Any], ...]" = ()
+    # if set, other nodes of the same type are removed from the node tree
+    exclusive: bool = False
+
+
+class LinkSpec(typing.NamedTuple):
+    """Describes a link of a node graph, see reconcile_node_tree"""
+
+    from_node: str
+    from_socket: "typing.Union[str, int]"
+    to_node: str
+    to_socket: "typing.Union[str, int]"
+
+
+SMH_NODE_NAME_PREFIX = "SMH "
+
+SMH_NODES = (
+    NodeSpec(
+        "SMH Output Material",
+        "ShaderNodeOutputMaterial",
+        (-200, 0),
+        exclusive=True,
+    ),
+    NodeSpec(
+        "SMH Principled BSDF",
+        "ShaderNodeBsdfPrincipled",
+        (-500, 0),
+        inputs=(("Specular", 0),),
+    ),
+    NodeSpec(
+        "SMH Image Texture",
+        "ShaderNodeTexImage",
+        (-1300, 0),
+    ),
+    NodeSpec(
+        "SMH Vertex Color",
+        "ShaderNodeVertexColor",
+        (-1300, -500),
+    ),
+    NodeSpec(
+        "SMH Image Color * Vertex Color",
+        "ShaderNodeVectorMath",
+        (-800, 0),
+        properties=(("operation", "MULTIPLY"),),
+    ),
+    NodeSpec(
+        "SMH Image Alpha * Vertex Alpha",
+        "ShaderNodeMath",
+        (-800, -300),
+        properties=(("operation", "MULTIPLY"),),
+    ),
+    NodeSpec(
+        "SMH UV Map",
+        "ShaderNodeUVMap",
+        (-2000, -400),
+    ),
+    NodeSpec(
+        "SMH UV Repeat",
+        "ShaderNodeGroup",
+        (-1700, -400),
+        properties=(("node_tree", lambda: ensure_uv_repeat_node_group()),),
+    ),
+)
+
+SMH_LINKS = (
+    # UV
+    LinkSpec("SMH UV Map", "UV", "SMH UV Repeat", "UV"),
+    LinkSpec("SMH UV Repeat", "UV", "SMH Image Texture", 0),
+    # Color
+    LinkSpec("SMH Image Texture", "Color", "SMH Image Color * Vertex Color", 0),
+    LinkSpec("SMH Vertex Color", "Color", "SMH Image Color * Vertex Color", 1),
+    LinkSpec("SMH Image Color * Vertex Color", 0, "SMH Principled BSDF", "Base Color"),
+    # Alpha
+    LinkSpec("SMH Image Texture", "Alpha", "SMH Image Alpha * Vertex Alpha", 0),
+    LinkSpec("SMH Vertex Color", "Alpha", "SMH Image Alpha * Vertex Alpha", 1),
+    LinkSpec("SMH Image Alpha * Vertex Alpha", 0, "SMH Principled BSDF", "Alpha"),
+    # Output
+    LinkSpec("SMH Principled BSDF", "BSDF", "SMH Output Material", "Surface"),
+)
+
+# Shared by all SMH materials, picks between wrap/mirror/clamp for each of U, V
+# according to the "Repeat U" and "Repeat V" inputs (0: wrap, 1: mirror, 2: clamp)
+
+SMH_UV_REPEAT_GROUP_NAME = "SMH UV Repeat"
+# Values of the "Repeat U" and "Repeat V" inputs for each UV repeat type
+SMH_UV_REPEAT_VALUES = {
+    "WRAP": 0,
+    "MIRROR": 1,
+    "CLAMP": 2,
+}
+# Increment when changing the group, so existing groups get updated
+SMH_UV_REPEAT_GROUP_VERSION = 1
+
+SMH_UV_REPEAT_GROUP_INPUTS = (
+    ("UV", "NodeSocketVector"),
+    ("Repeat U", "NodeSocketFloat"),
+    ("Repeat V", "NodeSocketFloat"),
+)
+SMH_UV_REPEAT_GROUP_OUTPUTS = (("UV", "NodeSocketVector"),)
+
+SMH_UV_REPEAT_GROUP_NODES = (
+    NodeSpec(
+        "SMH Group Input",
+        "NodeGroupInput",
+        (-1100, -400),
+        exclusive=True,
+    ),
+    NodeSpec(
+        "SMH Group Output",
+        "NodeGroupOutput",
+        (200, -400),
+        exclusive=True,
+    ),
+    NodeSpec(
+        "SMH Separate UV",
+        "ShaderNodeSeparateXYZ",
+        (-900, -400),
+    ),
+    NodeSpec(
+        "SMH UV Mirror U",
+        "ShaderNodeMath",
+        (-600, 0),
+        properties=(("operation", "PINGPONG"),),
+        inputs=((1, 1),),
+    ),
+    NodeSpec(
+        "SMH UV Mirror V",
+        "ShaderNodeMath",
+        (-600, -200),
+        properties=(("operation", "PINGPONG"),),
+        inputs=((1, 1),),
+    ),
+    NodeSpec(
+        "SMH UV Clamp U",
+        "ShaderNodeClamp",
+        (-600, -500),
+        properties=(("clamp_type", "MINMAX"),),
+        inputs=(("Min", 0), ("Max", 1)),
+    ),
+    NodeSpec(
+        "SMH UV Clamp V",
+        "ShaderNodeClamp",
+        (-600, -700),
+        properties=(("clamp_type", "MINMAX"),),
+        inputs=(("Min", 0), ("Max", 1)),
+    ),
+    # picks wrap/mirror
+    NodeSpec(
+        "SMH UV Pick U 1",
+        "ShaderNodeMapRange",
+        (-300, -200),
+        inputs=(("From Min", 0), ("From Max", 1)),
+    ),
+    # picks pick1/clamp
+    NodeSpec(
+        "SMH UV Pick U 2",
+        "ShaderNodeMapRange",
+        (0, -200),
+        inputs=(("From Min", 1), ("From Max", 2)),
+    ),
+    # picks wrap/mirror
+    NodeSpec(
+        "SMH UV Pick V 1",
+        "ShaderNodeMapRange",
+        (-300, -800),
+        inputs=(("From Min", 0), ("From Max", 1)),
+    ),
+    # picks pick1/clamp
+    NodeSpec(
+        "SMH UV Pick V 2",
+        "ShaderNodeMapRange",
+        (0, -800),
+        inputs=(("From Min", 1), ("From Max", 2)),
+    ),
+    NodeSpec(
+        "SMH Combine UV",
+        "ShaderNodeCombineXYZ",
+        (0, -400),
+    ),
+)
+
+SMH_UV_REPEAT_GROUP_LINKS = (
+    # UV wrap, mirror, clamp
+    LinkSpec("SMH Group Input", "UV", "SMH Separate UV", 0),
+    LinkSpec("SMH Separate UV", 0, "SMH UV Mirror U", 0),
+    LinkSpec("SMH Separate UV", 1, "SMH UV Mirror V", 0),
+    LinkSpec("SMH Separate UV", 0, "SMH UV Clamp U", 0),
+    LinkSpec("SMH Separate UV", 1, "SMH UV Clamp V", 0),
+    # Pick U
+    LinkSpec("SMH Group Input", "Repeat U", "SMH UV Pick U 1", "Value"),
+    LinkSpec("SMH Separate UV", 0, "SMH UV Pick U 1", "To Min"),
+    LinkSpec("SMH UV Mirror U", 0, "SMH UV Pick U 1", "To Max"),
+    LinkSpec("SMH Group Input", "Repeat U", "SMH UV Pick U 2", "Value"),
+    LinkSpec("SMH UV Pick U 1", 0, "SMH UV Pick U 2", "To Min"),
+    LinkSpec("SMH UV Clamp U", 0, "SMH UV Pick U 2", "To Max"),
+    # Pick V
+    LinkSpec("SMH Group Input", "Repeat V", "SMH UV Pick V 1", "Value"),
+    LinkSpec("SMH Separate UV", 1, "SMH UV Pick V 1", "To Min"),
+    LinkSpec("SMH UV Mirror V", 0, "SMH UV Pick V 1", "To Max"),
+    LinkSpec("SMH Group Input", "Repeat V", "SMH UV Pick V 2", "Value"),
+    LinkSpec("SMH UV Pick V 1", 0, "SMH UV Pick V 2", "To Min"),
+    LinkSpec("SMH UV Clamp V", 0, "SMH UV Pick V 2", "To Max"),
+    # UV output
+    LinkSpec("SMH UV Pick U 2", 0, "SMH Combine UV", 0),
+    LinkSpec("SMH UV Pick V 2", 0, "SMH Combine UV", 1),
+    LinkSpec("SMH Combine UV", 0, "SMH Group Output", "UV"),
+)
+
+# Names of nodes only found in materials set up before the UV repeat node group
+SMH_LEGACY_UV_NODE_NAMES = ("SMH UV Repeat Type U", "SMH UV Repeat Type V")
+
+
+def _values_equal(current, value):
+    if isinstance(value, (tuple, list)):
+        return len(current) == len(value) and all(
+            _values_equal(current_elem, value_elem)
+            for current_elem, value_elem in zip(current, value)
+        )
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # float properties are stored as 32-bit floats
+        return abs(current - value) <= 1e-6
+    return current == value
+
+
+class ReconcileResult(typing.NamedTuple):
+    # nodes by name, in a dry run only the existing nodes which would be kept
+    nodes: "dict[str, bpy.types.Node]"
+    # nodes, property and socket values, and links that differed from the specs
+    differences: int
+
+
+@profiled("reconcile_node_tree")
+def reconcile_node_tree(
+    node_tree: bpy.types.NodeTree,
+    node_specs: "typing.Sequence[NodeSpec]",
+    link_specs: "typing.Sequence[LinkSpec]",
+    managed_prefix: str = SMH_NODE_NAME_PREFIX,
+    dry_run=False,
+) -> ReconcileResult:
+    """Make node_tree match the node and link specs, only writing what differs.
+
+    Nodes with a name starting with managed_prefix that aren't in node_specs
+    are removed. Nodes are only positioned when created, so users may move them.
+    Inputs given a default value by node_specs are unlinked, unless a link spec
+    links them. Links into sockets not mentioned by the specs are left alone.
+
+    With dry_run, nothing is changed and the differences are only counted, a
+    missing node counting once for everything it would be created with.
+    Property values computed at reconcile time (callables) are then only checked
+    to be set, as computing them may create data.
+    """
+    differences = 0
+    spec_names = {node_spec.name for node_spec in node_specs}
+    exclusive_types = {
+        node_spec.bl_idname: node_spec.name
+        for node_spec in node_specs
+        if node_spec.exclusive
+    }
+
+    obsolete_nodes = [
+        node
+        for node in node_tree.nodes
+        if (node.name.startswith(managed_prefix) and node.name not in spec_names)
+        or (
+            node.bl_idname in exclusive_types
+            and node.name != exclusive_types[node.bl_idname]
+        )
+    ]
+    differences += len(obsolete_nodes)
+    if not dry_run:
+        for node in obsolete_nodes:
+            node_tree.nodes.remove(node)
+
+    nodes = dict()
+
+    for node_spec in node_specs:
+        node = node_tree.nodes.get(node_spec.name)
+        if node is None or node.bl_idname != node_spec.bl_idname:
+            differences += 1
+            if dry_run:
+                continue
+            if node is not None:
+                node_tree.nodes.remove(node)
+            node = node_tree.nodes.new(node_spec.bl_idname)
+            node.name = node_spec.name
+            node.location = node_spec.location
+
+        for attr, value in node_spec.properties:
+            if callable(value):
+                if dry_run:
+                    if getattr(node, attr) is None:
+                        differences += 1
+                    continue
+                value = value()
+            if not _values_equal(getattr(node, attr), value):
+                differences += 1
+                if not dry_run:
+                    setattr(node, attr, value)
+        for key, value in node_spec.inputs:
+            socket = node.inputs[key]
+            if not _values_equal(socket.default_value, value):
+                differences += 1
+                if not dry_run:
+                    socket.default_value = value
+        for key, value in node_spec.outputs:
+            socket = node.outputs[key]
+            if not _values_equal(socket.default_value, value):
+                differences += 1
+                if not dry_run:
+                    socket.default_value = value
+
+        nodes[node_spec.name] = node
+
+    linked_sockets = {
+        (link_spec.to_node, link_spec.to_socket) for link_spec in link_specs
+    }
+    for node_spec in node_specs:
+        if node_spec.name not in nodes:
+            # only in a dry run, counted as created
+            continue
+        for key, value in node_spec.inputs:
+            if (node_spec.name, key) in linked_sockets:
+                continue
+            socket = nodes[node_spec.name].inputs[key]
+            if socket.is_linked:
+                differences += 1
+                if not dry_run:
+                    for link in list(socket.links):
+                        node_tree.links.remove(link)
+
+    for link_spec in link_specs:
+        if link_spec.from_node not in nodes or link_spec.to_node not in nodes:
+            continue
+        from_socket = nodes[link_spec.from_node].outputs[link_spec.from_socket]
+        to_socket = nodes[link_spec.to_node].inputs[link_spec.to_socket]
+        if to_socket.is_linked and any(
+            link.from_socket == from_socket for link in to_socket.links
+        ):
+            continue
+        differences += 1
+        if not dry_run:
+            node_tree.links.new(to_socket, from_socket, verify_limits=True)
+
+    return ReconcileResult(nodes, differences)
+
+
+def _ensure_node_group_sockets(
+    node_group: bpy.types.NodeTree,
+    in_out: str,
+    sockets: "typing.Sequence[tuple[str, str]]",
+):
+    """Make the node group inputs or outputs match sockets, (name, type) pairs"""
+    if hasattr(node_group, "interface"):
+        # Blender 4.0+
+        current_sockets = [
+            item
+            for item in node_group.interface.items_tree
+            if item.item_type == "SOCKET" and item.in_out == in_out
+        ]
+        if [(item.name, item.socket_type) for item in current_sockets] != list(sockets):
+            for item in current_sockets:
+                node_group.interface.remove(item)
+            for name, socket_type in sockets:
+                node_group.interface.new_socket(
+                    name, in_out=in_out, socket_type=socket_type
+                )
+    else:
+        collection = node_group.inputs if in_out == "INPUT" else node_group.outputs
+        if [(socket.name, socket.bl_socket_idname) for socket in collection] != list(
+            sockets
+        ):
+            collection.clear()
+            for name, socket_type in sockets:
+                collection.new(socket_type, name)
+
+
+def ensure_uv_repeat_node_group() -> bpy.types.ShaderNodeTree:
+    """Get the node group shared by SMH materials for repeating UVs,
+    creating or updating it if needed.
+    """
+    node_group = bpy.data.node_groups.get(SMH_UV_REPEAT_GROUP_NAME)
+    if node_group is not None and node_group.bl_idname != "ShaderNodeTree":
+        node_group.name += " (not SMH)"
+        node_group = None
+    if node_group is None:
+        node_group = bpy.data.node_groups.new(
+            SMH_UV_REPEAT_GROUP_NAME, "ShaderNodeTree"
+        )
+    if node_group.get("smh_version") == SMH_UV_REPEAT_GROUP_VERSION:
+        return node_group
+
+    _ensure_node_group_sockets(node_group, "INPUT", SMH_UV_REPEAT_GROUP_INPUTS)
+    _ensure_node_group_sockets(node_group, "OUTPUT", SMH_UV_REPEAT_GROUP_OUTPUTS)
+    reconcile_node_tree(
+        node_group, SMH_UV_REPEAT_GROUP_NODES, SMH_UV_REPEAT_GROUP_LINKS
+    )
+    node_group["smh_version"] = SMH_UV_REPEAT_GROUP_VERSION
+
+    return node_group
+
+
+class MaterialNodes:
+    shader_node: bpy.types.ShaderNodeBsdfPrincipled
+    image: bpy.types.ShaderNodeTexImage
+    # None if the graph is specialized for the UV repeat types
+    uv_repeat: "Optional[bpy.types.ShaderNodeGroup]"
+    # None if the material doesn't scroll
+    uv_scroll: "Optional[bpy.types.ShaderNodeVectorMath]"
+
+
+# Image node extension modes doing the UV repeat type on both U and V
+SMH_UV_REPEAT_IMAGE_EXTENSIONS = {
+    "WRAP": "REPEAT",
+    "CLAMP": "EXTEND",
+}
+if bpy.app.version >= (3, 5, 0):
+    SMH_UV_REPEAT_IMAGE_EXTENSIONS["MIRROR"] = "MIRROR"
+
+
+def _get_specialized_uv_graph_spec(
+    uv_repeat_u: str,
+    uv_repeat_v: str,
+) -> "tuple[tuple[NodeSpec, ...], tuple[LinkSpec, ...], str]":
+    """Get the nodes and links for only the UV repeat types used,
+    and the image node extension to use.
+    """
+    if uv_repeat_u == uv_repeat_v and uv_repeat_u in SMH_UV_REPEAT_IMAGE_EXTENSIONS:
+        return (
+            (),
+            (LinkSpec("SMH UV Map", "UV", "SMH Image Texture", 0),),
+            SMH_UV_REPEAT_IMAGE_EXTENSIONS[uv_repeat_u],
+        )
+
+    node_specs = [
+        NodeSpec(
+            "SMH Separate UV",
+            "ShaderNodeSeparateXYZ",
+            (-1900, -400),
+        ),
+        NodeSpec(
+            "SMH Combine UV",
+            "ShaderNodeCombineXYZ",
+            (-1500, -400),
+        ),
+    ]
+    link_specs = [
+        LinkSpec("SMH UV Map", "UV", "SMH Separate UV", 0),
+        LinkSpec("SMH Combine UV", 0, "SMH Image Texture", 0),
+    ]
+    for i, (component, uv_repeat, location_y) in enumerate(
+        (("U", uv_repeat_u, -200), ("V", uv_repeat_v, -600))
+    ):
+        if uv_repeat == "WRAP":
+            link_specs.append(LinkSpec("SMH Separate UV", i, "SMH Combine UV", i))
+            continue
+        if uv_repeat == "MIRROR":
+            node_spec = NodeSpec(
+                f"SMH UV Mirror {component}",
+                "ShaderNodeMath",
+                (-1700, location_y),
+                properties=(("operation", "PINGPONG"),),
+                inputs=((1, 1),),
+            )
+        else:
+            assert uv_repeat == "CLAMP"
+            node_spec = NodeSpec(
+                f"SMH UV Clamp {component}",
+                "ShaderNodeClamp",
+                (-1700, location_y),
+                properties=(("clamp_type", "MINMAX"),),
+                inputs=(("Min", 0), ("Max", 1)),
+            )
+        node_specs.append(node_spec)
+        link_specs.append(LinkSpec("SMH Separate UV", i, node_spec.name, 0))
+        link_specs.append(LinkSpec(node_spec.name, 0, "SMH Combine UV", i))
+
+    return tuple(node_specs), tuple(link_specs), "REPEAT"
+
+
+@functools.lru_cache(maxsize=None)
+def get_material_graph_spec(
+    has_image: bool,
+    uv_repeat_u: str = "WRAP",
+    uv_repeat_v: str = "WRAP",
+    use_specialized_uv_nodes: bool = False,
+    has_uv_scroll: bool = False,
+) -> "tuple[tuple[NodeSpec, ...], tuple[LinkSpec, ...]]":
+    """Get the nodes and links of a SMH material.
+
+    The UV repeat types are only used if use_specialized_uv_nodes is set,
+    otherwise the shared UV repeat node group is used and picks at render time.
+    If has_uv_scroll, the UVs go through a node adding the scroll offset first.
+    """
+    node_specs = SMH_NODES
+    link_specs = SMH_LINKS
+
+    if use_specialized_uv_nodes:
+        uv_node_specs, uv_link_specs, image_extension = _get_specialized_uv_graph_spec(
+            uv_repeat_u, uv_repeat_v
+        )
+        node_specs = (
+            tuple(
+                node_spec
+                for node_spec in node_specs
+                if node_spec.name != "SMH UV Repeat"
+            )
+            + uv_node_specs
+        )
+        link_specs = (
+            tuple(
+                link_spec
+                for link_spec in link_specs
+                if "SMH UV Repeat" not in {link_spec.from_node, link_spec.to_node}
+            )
+            + uv_link_specs
+        )
+    else:
+        image_extension = "REPEAT"
+
+    if has_uv_scroll:
+        # the offset is set on frame change, see AnimatedMaterials
+        node_specs = node_specs + (
+            NodeSpec(
+                "SMH UV Scroll",
+                "ShaderNodeVectorMath",
+                (-1850, -650),
+                properties=(("operation", "ADD"),),
+            ),
+        )
+        link_specs = tuple(
+            (
+                link_spec._replace(from_node="SMH UV Scroll", from_socket=0)
+                if link_spec.from_node == "SMH UV Map"
+                else link_spec
+            )
+            for link_spec in link_specs
+        ) + (
+            LinkSpec("SMH UV Map", "UV", "SMH UV Scroll", 0),
+        )
+
+    node_specs = tuple(
+        (
+            node_spec._replace(
+                properties=node_spec.properties + (("extension", image_extension),)
+            )
+            if node_spec.name == "SMH Image Texture"
+            else node_spec
+        )
+        for node_spec in node_specs
+    )
+
+    if not has_image:
+        # the shader node uses constants instead of the image color and alpha
+        node_specs = tuple(
+            (
+                node_spec._replace(
+                    inputs=node_spec.inputs
+                    + (("Base Color", (1, 0, 1, 1)), ("Alpha", 1))
+                )
+                if node_spec.name == "SMH Principled BSDF"
+                else node_spec
+            )
+            for node_spec in node_specs
+        )
+        link_specs = tuple(
+            link_spec
+            for link_spec in link_specs
+            if link_spec.to_node != "SMH Principled BSDF"
+            or link_spec.to_socket not in {"Base Color", "Alpha"}
+        )
+
+    return node_specs, link_specs
+
+
+def has_color_attribute(mesh: bpy.types.Mesh) -> bool:
+    color_attributes = getattr(mesh, "color_attributes", None)
+    if color_attributes is not None:
+        # Blender 3.2+, vertex_colors only lists byte colors on corners
+        return len(color_attributes) != 0
+    return mesh.vertex_colors.active is not None
+
+
+def get_active_color_layer(mesh: bpy.types.Mesh):
+    """The active color layer and its domain ("POINT" or "CORNER"), or None"""
+    color_attributes = getattr(mesh, "color_attributes", None)
+    if color_attributes is not None:
+        layer = color_attributes.active_color
+        if layer is None and len(color_attributes) != 0:
+            layer = next(iter(color_attributes))
+        return (layer, layer.domain) if layer is not None else None
+    layer = mesh.vertex_colors.active
+    return (layer, "CORNER") if layer is not None else None
+
+
+@profiled("provision_color_attributes")
+def provision_color_attributes(
+    meshes: "typing.Iterable[bpy.types.Mesh]",
+    domain: "Optional[str]" = None,
+    data_type: "Optional[str]" = None,
+    init_white: "Optional[bool]" = None,
+) -> int:
+    """Add a color layer to the meshes without any, returns how many were added.
+
+    With color attributes (Blender 3.2+), the layer has the given domain ("POINT"
+    or "CORNER") and data type ("BYTE_COLOR" or "FLOAT_COLOR"), by default those
+    from the addon preferences, and is filled with white if init_white.
+    """
+    if domain is None:
+        domain = CONFIG.vertex_color_domain
+    if data_type is None:
+        data_type = CONFIG.vertex_color_type
+    if init_white is None:
+        init_white = CONFIG.vertex_color_init_white
+
+    missing_meshes = [mesh for mesh in meshes if not has_color_attribute(mesh)]
+    white = np.ones(0, dtype=np.float32)
+    for mesh in missing_meshes:
+        if not hasattr(mesh, "color_attributes"):
+            mesh.vertex_colors.new(do_init=False)
+            continue
+        layer = mesh.color_attributes.new("Col", data_type, domain)
+        mesh.color_attributes.active_color = layer
+        if init_white:
+            n = 4 * len(layer.data)
+            if len(white) < n:
+                white = np.ones(n, dtype=np.float32)
+            layer.data.foreach_set("color", white[:n])
+    return len(missing_meshes)
+
+
+@profiled("ensure_vertex_colors")
+def ensure_vertex_colors(materials: "typing.Iterable[bpy.types.Material]"):
+    """Ensure the meshes using any of the materials have vertex colors data"""
+    meshes: "dict[str, bpy.types.Mesh]" = dict()
+    for material in materials:
+        for mesh in MATERIAL_USERS_INDEX.get_meshes(material):
+            meshes[mesh.name] = mesh
+
+    provision_color_attributes(meshes.values())
+
+    if PROFILER.enabled:
+        PROFILER.count("meshes checked for vertex colors", len(meshes))
+
+
+@profiled("ensure_setup_and_get_nodes")
+def ensure_setup_and_get_nodes(
+    material: bpy.types.Material,
+    do_ensure_vertex_colors=True,
+):
+    node_tree = material.node_tree
+    props: MaterialProperties = material.simple_material_helper
+
+    # ensure vertex colors data exists
+
+    if do_ensure_vertex_colors:
+        ensure_vertex_colors((material,))
+
+    # nodes and links
+
+    node_specs, link_specs = get_material_graph_spec(
+        props.image is not None,
+        props.uv_repeat_u,
+        props.uv_repeat_v,
+        CONFIG.use_specialized_uv_nodes,
+        has_uv_scroll(props),
+    )
+    nodes_by_name = reconcile_node_tree(node_tree, node_specs, link_specs).nodes
+
+    # return nodes
+
+    nodes = MaterialNodes()
+    nodes.shader_node = nodes_by_name["SMH Principled BSDF"]
+    nodes.image = nodes_by_name["SMH Image Texture"]
+    nodes.uv_repeat = nodes_by_name.get("SMH UV Repeat")
+    nodes.uv_scroll = nodes_by_name.get("SMH UV Scroll")
+
+    return nodes
+
+
+@profiled("set_simple_material")
+def set_simple_material(mat: bpy.types.Material, do_ensure_vertex_colors=True):
+    props: MaterialProperties = mat.simple_material_helper
+
+    if mat.node_tree is None:
+        mat.use_nodes = True
+
+    nodes = ensure_setup_and_get_nodes(mat, do_ensure_vertex_colors)
+
+    set_simple_material_image(mat, nodes, props)
+
+    set_simple_material_uv_repeats(nodes, props)
+
+    set_simple_material_animation(nodes, props)
+
+
+def set_simple_material_image(
+    mat: bpy.types.Material,
+    nodes: MaterialNodes,
+    props,  # type: MaterialProperties
+):
+    # the shader node being unlinked when there is no image is part of the graph spec
+    image = get_displayed_image(props)
+    if nodes.image.image != image:
+        nodes.image.image = image
+
+
+def set_simple_material_uv_repeats(
+    nodes: MaterialNodes,
+    props,  # type: MaterialProperties
+):
+    if nodes.uv_repeat is None:
+        # the graph is specialized for the UV repeat types
+        return
+
+    for socket, value in (
+        (nodes.uv_repeat.inputs["Repeat U"], SMH_UV_REPEAT_VALUES[props.uv_repeat_u]),
+        (nodes.uv_repeat.inputs["Repeat V"], SMH_UV_REPEAT_VALUES[props.uv_repeat_v]),
+    ):
+        if socket.default_value != value:
+            socket.default_value = value
+
+
+def set_simple_material_animation(
+    nodes: MaterialNodes,
+    props,  # type: MaterialProperties
+):
+    """Set the scroll offset and flipbook frame for the current frame,
+    afterwards AnimatedMaterials keeps them updated on frame change.
+    """
+    if nodes.uv_scroll is None and not has_flipbook(nodes.image.image, props):
+        return
+
+    seconds = get_scene_time(bpy.context.scene)
+
+    if nodes.uv_scroll is not None:
+        offset = get_uv_scroll_offsets(
+            np.array((props.scroll_u, props.scroll_v)),
+            np.array(get_uv_scroll_periods(props)),
+            seconds,
+        )
+        socket = nodes.uv_scroll.inputs[1]
+        value = (float(offset[0]), float(offset[1]), 0.0)
+        if tuple(socket.default_value) != value:
+            socket.default_value = value
+
+    if has_flipbook(nodes.image.image, props):
+        image_user = nodes.image.image_user
+        for attribute, value in SMH_FLIPBOOK_IMAGE_USER_SETTINGS:
+            if getattr(image_user, attribute) != value:
+                setattr(image_user, attribute, value)
+        frame_offset = int(
+            get_flipbook_frame_offsets(
+                np.array((get_image_sequence_first_frame(nodes.image.image),)),
+                np.array((nodes.image.image.frame_duration,)),
+                np.array((props.flipbook_fps,)),
+                seconds,
+            )[0]
+        )
+        if image_user.frame_offset != frame_offset:
+            image_user.frame_offset = frame_offset
+
+
+@profiled("set_simple_materials")
+def set_simple_materials(
+    materials: "typing.Iterable[bpy.types.Material]",
+    window_manager: "Optional[bpy.types.WindowManager]" = None,
+):
+    """Set up or refresh many materials at once.
+
+    Vertex colors are ensured in a single pass for all materials.
+    If window_manager is given, it is used to report progress.
+    """
+    materials = list(materials)
+
+    UPDATE_SCHEDULER.discard(materials)
+
+    ensure_vertex_colors(materials)
+
+    if window_manager is not None:
+        window_manager.progress_begin(0, len(materials))
+    try:
+        for i, mat in enumerate(materials):
+            set_simple_material(mat, do_ensure_vertex_colors=False)
+            if window_manager is not None:
+                window_manager.progress_update(i + 1)
+    finally:
+        if window_manager is not None:
+            window_manager.progress_end()
+
+    # the nodes may have been replaced
+    ANIMATED_MATERIALS.invalidate()
+
+
+class UpdateScheduler:
+    """Collects materials needing an update, to update each only once per tick.
+
+    Property update callbacks schedule materials instead of updating them right
+    away, so that many property writes (from scripts, drivers, copy to selected,
+    ...) to the same materials only update them once.
+    The materials are updated from a timer, or when calling flush.
+    """
+
+    def __init__(self):
+        # materials are identified by pointer, which unlike names survives renames
+        self._dirty_material_pointers: "set[int]" = set()
+
+    def schedule(self, materials: "typing.Iterable[bpy.types.Material]"):
+        self._dirty_material_pointers.update(mat.as_pointer() for mat in materials)
+        if self._dirty_material_pointers and not bpy.app.timers.is_registered(
+            on_update_scheduler_timer
+        ):
+            bpy.app.timers.register(on_update_scheduler_timer, first_interval=0)
+
+    def discard(self, materials: "typing.Iterable[bpy.types.Material]"):
+        if self._dirty_material_pointers:
+            self._dirty_material_pointers.difference_update(
+                mat.as_pointer() for mat in materials
+            )
+
+    @profiled("UpdateScheduler.flush")
+    def flush(self):
+        """Update the scheduled materials now"""
+        if not self._dirty_material_pointers:
+            return
+        material_pointers = self._dirty_material_pointers
+        self._dirty_material_pointers = set()
+        # removed materials are skipped
+        set_simple_materials(
+            mat for mat in bpy.data.materials if mat.as_pointer() in material_pointers
+        )
+
+    def cancel(self):
+        self._dirty_material_pointers.clear()
+        if bpy.app.timers.is_registered(on_update_scheduler_timer):
+            bpy.app.timers.unregister(on_update_scheduler_timer)
+
+
+UPDATE_SCHEDULER = UpdateScheduler()
+
+
+def on_update_scheduler_timer():
+    UPDATE_SCHEDULER.flush()
+    # don't repeat the timer
+    return None
+
+
+def flush_material_updates():
+    """Update the materials with pending changes right away.
+
+    Scripts setting SMH properties should call this if they need the node graphs
+    to be up to date before control returns to Blender.
+    """
+    UPDATE_SCHEDULER.flush()
+
+
+def is_simple_material(mat: bpy.types.Material):
+    """Check if the material has been set up by Simple Material Helper,
+    or has an image set and should be.
+    """
+    return mat.simple_material_helper.image is not None or (
+        mat.node_tree is not None
+        and mat.node_tree.nodes.get("SMH Output Material") is not None
+    )
+
+
+def is_editable(id: bpy.types.ID) -> bool:
+    """Check that the datablock isn't linked from a library, or a library
+    override that can't be edited (Blender rejects writes to those).
+    """
+    if id.library is not None:
+        return False
+    override_library = getattr(id, "override_library", None)
+    return override_library is None or not getattr(
+        override_library, "is_system_override", False
+    )
+
+
+def get_simple_materials_in_objects(
+    objects: "typing.Iterable[bpy.types.Object]",
+    include_all=False,
+) -> "list[bpy.types.Material]":
+    """Get the SMH materials (all materials if include_all) used by the objects"""
+    materials: "dict[str, bpy.types.Material]" = dict()
+    for object in objects:
+        for material_slot in object.material_slots:
+            mat = material_slot.material
+            if mat is not None and mat.name not in materials:
+                if include_all or is_simple_material(mat):
+                    materials[mat.name] = mat
+    return list(materials.values())
+
+
+def has_legacy_graph(mat: bpy.types.Material):
+    """Check if the material uses the UV repeat nodes from before the node group"""
+    return mat.node_tree is not None and any(
+        mat.node_tree.nodes.get(node_name) is not None
+        for node_name in SMH_LEGACY_UV_NODE_NAMES
+    )
+
+
+def get_material_problems(mat: bpy.types.Material) -> "list[str]":
+    """Describe what is wrong with a SMH material, if anything"""
+    problems = []
+    props = mat.simple_material_helper  # type: MaterialProperties
+    if has_legacy_graph(mat):
+        problems.append("uses legacy UV repeat nodes (run migrate)")
+    if mat.node_tree is None or mat.node_tree.nodes.get("SMH Output Material") is None:
+        problems.append("nodes not set up (run refresh)")
+    elif not has_legacy_graph(mat) and get_material_stale_node_count(mat):
+        problems.append("nodes out of date (run refresh)")
+    image = props.image
+    if image is None:
+        problems.append("no image set")
+    elif image.source == "FILE" and image.packed_file is None:
+        if not Path(bpy.path.abspath(image.filepath, library=image.library)).exists():
+            problems.append(f"image file not found: {image.filepath}")
+    elif image.size[0] == 0 or image.size[1] == 0:
+        problems.append("image has no pixels")
+    uv_bounds = analyze_material_uvs(mat)
+    if uv_bounds is not None and uv_bounds.overflowing_faces:
+        problems.append(
+            f"{uv_bounds.overflowing_faces} face(s) out of "
+            "the N64 texture coordinates range"
+        )
+    return problems
+
+
+def migrate_legacy_graphs():
+    """Convert materials with per-material UV repeat nodes to the shared node group
+
+    Returns the number of migrated materials.
+    """
+    materials = [
+        mat for mat in bpy.data.materials if is_editable(mat) and has_legacy_graph(mat)
+    ]
+    set_simple_materials(materials)
+    return len(materials)
+
+
+class MigrateOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_migrate"
+    bl_label = "Migrate SMH Materials"
+    bl_description = (
+        "Convert materials set up by older versions of Simple Material Helper "
+        "to use the shared UV repeat node group"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        count = migrate_legacy_graphs()
+        self.report({"INFO"}, f"Migrated {count} material(s)")
+        return {"FINISHED"}
+
+
+class ApplyOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_apply"
+    bl_label = "Refresh SMH Materials"
+    bl_description = (
+        "Set up or refresh the nodes of all Simple Material Helper materials "
+        "used by the selected objects, the active collection or the whole file"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    scope: bpy.props.EnumProperty(
+        items=[
+            (
+                "SELECTED",
+                "Selected Objects",
+                "Materials used by the selected objects",
+            ),
+            (
+                "COLLECTION",
+                "Active Collection",
+                "Materials used by objects in the active collection and its children",
+            ),
+            (
+                "FILE",
+                "Whole File",
+                "All materials in the file",
+            ),
+        ],
+        name="Scope",
+        default="SELECTED",
+    )
+
+    def execute(self, context):
+        if self.scope == "SELECTED":
+            materials = get_simple_materials_in_objects(context.selected_objects)
+        elif self.scope == "COLLECTION":
+            materials = get_simple_materials_in_objects(context.collection.all_objects)
+        else:
+            assert self.scope == "FILE"
+            materials = bpy.data.materials
+        materials = [
+            mat for mat in materials if is_editable(mat) and is_simple_material(mat)
+        ]
+
+        set_simple_materials(materials, context.window_manager)
+
+        self.report({"INFO"}, f"Refreshed {len(materials)} material(s)")
+        return {"FINISHED"}
+
+
+def get_simple_material_key(mat: bpy.types.Material) -> tuple:
+    """Get a hashable key of everything defining how a SMH material looks,
+    materials with equal keys are equivalent.
+    """
+    props: MaterialProperties = mat.simple_material_helper
+    image = props.image
+    return (
+        (
+            None
+            if image is None
+            else (image.name, None if image.library is None else image.library.filepath)
+        ),
+        props.uv_repeat_u,
+        props.uv_repeat_v,
+        props.use_transparency,
+        props.use_transparency and props.use_blend_transparency,
+        mat.use_backface_culling,
+        props.scroll_u,
+        props.scroll_v,
+        props.use_flipbook and props.flipbook_fps,
+    )
+
+
+def find_equivalent_simple_materials() -> "list[list[bpy.types.Material]]":
+    """Group equivalent SMH materials, returns groups of more than one material.
+
+    The first material of each group is the one to keep.
+    """
+    groups: "dict[tuple, list[bpy.types.Material]]" = dict()
+    for mat in bpy.data.materials:
+        if is_editable(mat) and is_simple_material(mat):
+            groups.setdefault(get_simple_material_key(mat), []).append(mat)
+    duplicate_groups = []
+    for group in groups.values():
+        if len(group) > 1:
+            # prefer keeping "name" over "name.001"
+            group.sort(key=lambda mat: (len(mat.name), mat.name))
+            duplicate_groups.append(group)
+    return duplicate_groups
+
+
+def remap_materials(remap: "dict[str, bpy.types.Material]"):
+    """Make users of materials named in remap's keys use the mapped material
+    instead, in one pass over the datablocks with materials.
+    """
+    for id_collection in (bpy.data.meshes, bpy.data.curves, bpy.data.metaballs):
+        for id in id_collection:
+            if id.library is not None:
+                continue
+            for i, mat in enumerate(id.materials):
+                if mat is not None and mat.name in remap:
+                    id.materials[i] = remap[mat.name]
+    for object in bpy.data.objects:
+        if object.library is not None:
+            continue
+        for material_slot in object.material_slots:
+            mat = material_slot.material
+            if material_slot.link == "OBJECT" and mat is not None and mat.name in remap:
+                material_slot.material = remap[mat.name]
+
+    MATERIAL_USERS_INDEX.invalidate()
+
+
+class DedupeOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_dedupe"
+    bl_label = "Merge Equivalent SMH Materials"
+    bl_description = (
+        "Make objects use a single material for each group of Simple Material Helper "
+        "materials with the same image and settings"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    dry_run: bpy.props.BoolProperty(
+        name="Dry Run",
+        description="Only report the equivalent materials, without merging them",
+        default=False,
+    )
+    remove_duplicates: bpy.props.BoolProperty(
+        name="Remove Duplicates",
+        description="Delete the merged materials once unused",
+        default=True,
+    )
+
+    def execute(self, context):
+        groups = find_equivalent_simple_materials()
+        n_duplicates = sum(len(group) - 1 for group in groups)
+
+        verb = "Would merge" if self.dry_run else "Merging"
+        for group in groups:
+            names = ", ".join(mat.name for mat in group[1:])
+            self.report({"INFO"}, f"{verb} {names} into {group[0].name}")
+
+        if self.dry_run:
+            self.report(
+                {"INFO"},
+                f"{n_duplicates} material(s) can be merged into {len(groups)} "
+                "material(s)",
+            )
+            return {"FINISHED"}
+
+        remap = {mat.name: group[0] for group in groups for mat in group[1:]}
+        remap_materials(remap)
+
+        n_removed = 0
+        if self.remove_duplicates:
+            for group in groups:
+                for mat in group[1:]:
+                    if mat.users - int(mat.use_fake_user) == 0:
+                        bpy.data.materials.remove(mat)
+                        n_removed += 1
+
+        self.report(
+            {"INFO"},
+            f"Merged {n_duplicates} material(s) into {len(groups)} material(s), "
+            f"removed {n_removed}",
+        )
+        return {"FINISHED"}
+
+
+# Persistent cache
+
+# Data derived from images and meshes is also stored in an ID property of the
+# datablock it was derived from, so reopening a file doesn't start cold.
+# Written on save, read on first use, and only used if its key still matches
+SMH_CACHE_PROPERTY = "smh_cache"
+# Increment when changing what is stored, so older caches are ignored
+SMH_CACHE_VERSION = 1
+
+
+def read_cache_property(
+    id: bpy.types.ID, get_key: "typing.Callable[[], Optional[str]]"
+) -> "Optional[dict]":
+    """Get the data stored on the datablock, if it was stored with the same key.
+
+    get_key is only called if there is stored data.
+    """
+    cache = id.get(SMH_CACHE_PROPERTY)
+    if cache is None:
+        return None
+    cache = cache.to_dict()
+    if cache.get("version") != SMH_CACHE_VERSION or cache.get("key") != get_key():
+        return None
+    return cache
+
+
+def write_cache_property(id: bpy.types.ID, key: str, data: dict):
+    if id.library is not None:
+        # linked datablocks aren't saved
+        return
+    data = dict(data, version=SMH_CACHE_VERSION, key=key)
+    cache = id.get(SMH_CACHE_PROPERTY)
+    if cache is None or cache.to_dict() != data:
+        id[SMH_CACHE_PROPERTY] = data
+
+
+def remove_cache_property(id: bpy.types.ID):
+    if id.library is None and SMH_CACHE_PROPERTY in id:
+        del id[SMH_CACHE_PROPERTY]
+
+
+# N64 textures
+
+N64_TMEM_SIZE = 4096
+
+# format: bits per texel, in the order formats are preferred for the same size
+N64_TEXTURE_FORMAT_BITS = {
+    "I4": 4,
+    "IA4": 4,
+    "CI4": 4,
+    "I8": 8,
+    "IA8": 8,
+    "CI8": 8,
+    "IA16": 16,
+    "RGBA16": 16,
+    "RGBA32": 32,
+}
+
+# Largest error (in 0-255 units, on any channel) for a format to be considered
+# near-lossless: half a step of 5 bits per channel, so RGBA16 qualifies
+N64_NEAR_LOSSLESS_MAX_ERROR = 4
+
+
+class TextureAnalysis(typing.NamedTuple):
+    width: int
+    height: int
+    unique_colors: int
+    # "OPAQUE", "BINARY" (fully opaque or fully transparent) or "FULL"
+    alpha: str
+    grayscale: bool
+    # format: largest error on any channel, in 0-255 units
+    format_errors: "dict[str, int]"
+    best_lossless_format: str
+    best_near_lossless_format: str
+
+    def get_size(self, format: str):
+        return get_n64_texture_size(self.width, self.height, format)
+
+    def fits_tmem(self, format: str):
+        return n64_texture_fits_tmem(self.width, self.height, format)
+
+
+def get_n64_texture_size(width: int, height: int, format: str):
+    """Size in bytes of a texture in TMEM, with lines padded to 64 bits"""
+    line_size = width * N64_TEXTURE_FORMAT_BITS[format] // 8
+    line_size = (line_size + 7) // 8 * 8
+    return line_size * height
+
+
+def n64_texture_fits_tmem(width: int, height: int, format: str):
+    size = get_n64_texture_size(width, height, format)
+    if format in {"CI4", "CI8"}:
+        # the palette uses the upper half of TMEM
+        return size <= N64_TMEM_SIZE // 2
+    return size <= N64_TMEM_SIZE
+
+
+def _quantize_error(values: "np.ndarray", bits: int) -> int:
+    """Largest error on 8-bit values from storing them with fewer bits"""
+    if bits >= 8:
+        return 0
+    levels = (1 << bits) - 1
+    expanded = np.rint(np.rint(values * (levels / 255)) * (255 / levels))
+    return int(np.abs(expanded - values).max(initial=0))
+
+
+def analyze_pixels(pixels: "np.ndarray", width: int, height: int) -> TextureAnalysis:
+    """Analyze RGBA float pixels (as from Image.pixels) for N64 texture formats"""
+    rgba8 = np.rint(np.clip(pixels, 0, 1) * 255).astype(np.uint8).reshape(-1, 4)
+
+    # work on unique colors only, usually much fewer than pixels
+    unique_rgba8 = np.unique(rgba8.view(np.uint32)).view(np.uint8).reshape(-1, 4)
+    unique = unique_rgba8.astype(np.int32)
+    rgb = unique[:, :3]
+    a = unique[:, 3]
+
+    if np.all(a == 255):
+        alpha = "OPAQUE"
+    elif np.all((a == 0) | (a == 255)):
+        alpha = "BINARY"
+    else:
+        alpha = "FULL"
+    grayscale = bool(np.all((rgb[:, 0] == rgb[:, 1]) & (rgb[:, 1] == rgb[:, 2])))
+
+    intensity = np.rint(rgb.mean(axis=1))
+    intensity_error = int(np.abs(rgb - intensity[:, np.newaxis]).max(initial=0))
+    # with I formats, alpha is the intensity
+    intensity_alpha_error = (
+        0 if alpha == "OPAQUE" else int(np.abs(a - intensity).max(initial=0))
+    )
+
+    rgba16_error = max(
+        _quantize_error(rgb, 5),
+        _quantize_error(a, 1),
+    )
+
+    format_errors = {
+        "I4": max(
+            intensity_error, _quantize_error(intensity, 4), intensity_alpha_error
+        ),
+        "I8": max(intensity_error, intensity_alpha_error),
+        "IA4": max(
+            intensity_error, _quantize_error(intensity, 3), _quantize_error(a, 1)
+        ),
+        "IA8": max(
+            intensity_error, _quantize_error(intensity, 4), _quantize_error(a, 4)
+        ),
+        "IA16": intensity_error,
+        "RGBA16": rgba16_error,
+        "RGBA32": 0,
+    }
+    # the palette is RGBA16 colors
+    if len(unique) <= 16:
+        format_errors["CI4"] = rgba16_error
+    if len(unique) <= 256:
+        format_errors["CI8"] = rgba16_error
+
+    def pick(max_error):
+        return next(
+            format
+            for format in N64_TEXTURE_FORMAT_BITS
+            if format_errors.get(format, max_error + 1) <= max_error
+        )
+
+    return TextureAnalysis(
+        width=width,
+        height=height,
+        unique_colors=len(unique),
+        alpha=alpha,
+        grayscale=grayscale,
+        format_errors=format_errors,
+        best_lossless_format=pick(0),
+        best_near_lossless_format=pick(N64_NEAR_LOSSLESS_MAX_ERROR),
+    )
+
+
+def get_image_pixels(image: bpy.types.Image) -> "np.ndarray":
+    """Read the RGBA float pixels of an image, must be called from the main thread"""
+    pixels = np.empty(len(image.pixels), dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels
+
+
+def hash_pixels(pixels: "np.ndarray", width: int, height: int) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(np.array((width, height), dtype=np.int64).tobytes())
+    hasher.update(pixels.tobytes())
+    return hasher.hexdigest()
+
+
+# image name -> number of depsgraph updates of the image (painted, reloaded...)
+IMAGE_GENERATIONS: "dict[str, int]" = dict()
+
+
+def get_image_key(image: bpy.types.Image) -> tuple:
+    """Identifies an image's contents without reading pixels"""
+    return (
+        image.name,
+        image.filepath,
+        image.source,
+        tuple(image.size),
+        image.packed_file is not None,
+        IMAGE_GENERATIONS.get(image.name, 0),
+    )
+
+
+# image key (see get_image_key) -> content hash (see hash_pixels)
+IMAGE_CONTENT_HASHES: "dict[tuple, str]" = dict()
+
+
+def get_image_content_hash(image: bpy.types.Image) -> str:
+    """Get the hash of the image's pixels, only reading them if not known yet"""
+    key = get_image_key(image)
+    read_image_cache(image)
+    content_hash = IMAGE_CONTENT_HASHES.get(key)
+    if content_hash is None:
+        width, height = image.size
+        content_hash = hash_pixels(get_image_pixels(image), width, height)
+        IMAGE_CONTENT_HASHES[key] = content_hash
+    return content_hash
+
+
+# absolute file path -> (modification time in ns, size, hash of the file's bytes)
+IMAGE_FILE_HASHES: "dict[str, tuple[int, int, str]]" = dict()
+
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def get_image_file_stat(
+    image: bpy.types.Image,
+) -> "Optional[tuple[Path, os.stat_result]]":
+    """The absolute path of the image's file and its stat, if it has one"""
+    if image.source not in {"FILE", "SEQUENCE", "MOVIE"} or not image.filepath:
+        return None
+    path = Path(bpy.path.abspath(image.filepath, library=image.library))
+    try:
+        return path, path.stat()
+    except OSError:
+        return None
+
+
+def get_cached_file_hash(path: Path, stat: os.stat_result) -> "Optional[str]":
+    cached = IMAGE_FILE_HASHES.get(str(path))
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    return None
+
+
+def set_cached_file_hash(path: Path, stat: os.stat_result, file_hash: str):
+    IMAGE_FILE_HASHES[str(path)] = stat.st_mtime_ns, stat.st_size, file_hash
+    if PROFILER.enabled:
+        PROFILER.count("image files hashed", 1)
+
+
+def get_image_file_hash(image: bpy.types.Image) -> "Optional[str]":
+    """Get the hash of the bytes of the image's packed data or file, if any.
+
+    Hashes of files are cached by path, modification time and size.
+    """
+    if image.packed_file is not None:
+        return hash_bytes(image.packed_file.data)
+    file_stat = get_image_file_stat(image)
+    if file_stat is None:
+        return None
+    read_image_cache(image)
+    file_hash = get_cached_file_hash(*file_stat)
+    if file_hash is None:
+        file_hash = hash_file(file_stat[0])
+        set_cached_file_hash(*file_stat, file_hash)
+    return file_hash
+
+
+def get_image_cache_key(image: bpy.types.Image) -> "Optional[str]":
+    """Identifies the contents of an image across sessions, see SMH_CACHE_PROPERTY.
+
+    None if the image isn't from a file or packed, or is edited and not saved.
+    """
+    if image.is_dirty:
+        return None
+    if image.packed_file is not None:
+        version = ("packed", image.packed_file.size)
+    elif image.source in {"FILE", "SEQUENCE"} and image.filepath:
+        path = Path(bpy.path.abspath(image.filepath, library=image.library))
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+    else:
+        return None
+    return json.dumps((image.filepath, image.source, tuple(image.size)) + version)
+
+
+# image keys (see get_image_key) of images which cache property was read
+IMAGE_CACHES_READ: "set[tuple]" = set()
+
+
+def read_image_cache(image: bpy.types.Image):
+    """Fill the in-memory caches from the image's cache property, once per image"""
+    key = get_image_key(image)
+    if key in IMAGE_CACHES_READ:
+        return
+    IMAGE_CACHES_READ.add(key)
+    cache = read_cache_property(image, lambda: get_image_cache_key(image))
+    if cache is None:
+        return
+    content_hash = cache["content_hash"]
+    IMAGE_CONTENT_HASHES.setdefault(key, content_hash)
+    if "analysis" in cache:
+        analysis = TextureAnalysis(**cache["analysis"])
+        # ID properties store booleans as integers in older Blender versions
+        analysis = analysis._replace(grayscale=bool(analysis.grayscale))
+        TEXTURE_ANALYZER.add_result(content_hash, analysis)
+    if "file_hash" in cache and image.packed_file is None:
+        path = Path(bpy.path.abspath(image.filepath, library=image.library))
+        stat = path.stat()
+        IMAGE_FILE_HASHES.setdefault(
+            str(path), (stat.st_mtime_ns, stat.st_size, cache["file_hash"])
+        )
+    if PROFILER.enabled:
+        PROFILER.count("image caches read", 1)
+
+
+@profiled("write_image_caches")
+def write_image_caches():
+    """Store what is known about each image in its cache property"""
+    for image in bpy.data.images:
+        if image.library is not None:
+            continue
+        cache_key = get_image_cache_key(image)
+        if cache_key is None:
+            remove_cache_property(image)
+            continue
+        read_image_cache(image)
+        content_hash = IMAGE_CONTENT_HASHES.get(get_image_key(image))
+        if content_hash is None:
+            # not analyzed in this session, the property is checked when read
+            continue
+        data = {"content_hash": content_hash}
+        analysis = TEXTURE_ANALYZER.get(image)
+        if analysis is not None:
+            data["analysis"] = analysis._asdict()
+        if image.packed_file is None:
+            path = Path(bpy.path.abspath(image.filepath, library=image.library))
+            file_hash = IMAGE_FILE_HASHES.get(str(path))
+            if file_hash is not None and json.loads(cache_key)[-2:] == list(
+                file_hash[:2]
+            ):
+                data["file_hash"] = file_hash[2]
+        write_cache_property(image, cache_key, data)
+
+
+def _analyze_texture_job(pixels: "np.ndarray", width: int, height: int):
+    content_hash = hash_pixels(pixels, width, height)
+    return content_hash, analyze_pixels(pixels, width, height)
+
+
+def _quantize_preview_job(
+    pixels: "np.ndarray", width: int, height: int, format: str, dither: bool
+):
+    content_hash = hash_pixels(pixels, width, height)
+    return content_hash, quantize_pixels(pixels, width, height, format, dither)
+
+
+class TextureAnalyzer:
+    """Analyzes images in a background thread and caches the results.
+
+    Results are cached by content hash, and images are mapped to content hashes
+    by a key (see IMAGE_CONTENT_HASHES) so getting a result never reads pixels.
+    Pixels are read from the main thread in a timer, a few images at a time,
+    then hashed and analyzed in a thread pool.
+
+    Quantized previews (see QuantizedPreviewCache) are computed the same way.
+    """
+
+    # images to read pixels of, per timer call
+    BATCH_SIZE = 4
+
+    def __init__(self):
+        self._results_by_hash: "dict[str, TextureAnalysis]" = dict()
+        self._pending_image_names: "list[str]" = []
+        self._pending_keys: "set[tuple]" = set()
+        self._futures: "list[tuple[tuple, concurrent.futures.Future]]" = []
+        # (image name, format, dither) and (image key, format, dither)
+        self._pending_previews: "list[tuple[str, str, bool]]" = []
+        self._pending_preview_keys: "set[tuple]" = set()
+        self._preview_futures: (
+            "list[tuple[tuple, tuple[int, int], concurrent.futures.Future]]"
+        ) = []
+        self._executor: "Optional[concurrent.futures.ThreadPoolExecutor]" = None
+
+    def get(self, image: bpy.types.Image) -> "Optional[TextureAnalysis]":
+        read_image_cache(image)
+        content_hash = IMAGE_CONTENT_HASHES.get(get_image_key(image))
+        if content_hash is None:
+            return None
+        return self._results_by_hash.get(content_hash)
+
+    def add_result(self, content_hash: str, result: TextureAnalysis):
+        self._results_by_hash.setdefault(content_hash, result)
+
+    def is_pending(self, image: bpy.types.Image):
+        return get_image_key(image) in self._pending_keys
+
+    def request(self, image: bpy.types.Image):
+        """Schedule analyzing the image, if not already analyzed or scheduled"""
+        key = get_image_key(image)
+        if key in self._pending_keys or self.get(image) is not None:
+            return
+        self._pending_keys.add(key)
+        self._pending_image_names.append(image.name)
+        self._register_timer()
+
+    def request_preview(self, image: bpy.types.Image, format: str, dither: bool):
+        """Schedule quantizing the image for a preview, if not already scheduled"""
+        key = get_image_key(image), format, dither
+        if key in self._pending_preview_keys:
+            return
+        self._pending_preview_keys.add(key)
+        self._pending_previews.append((image.name, format, dither))
+        self._register_timer()
+
+    def _register_timer(self):
+        if not bpy.app.timers.is_registered(on_texture_analyzer_timer):
+            bpy.app.timers.register(on_texture_analyzer_timer, first_interval=0)
+
+    def forget(self, image: bpy.types.Image):
+        """Drop the image's result, for it to be analyzed again"""
+        IMAGE_CONTENT_HASHES.pop(get_image_key(image), None)
+
+    def analyze_now(self, image: bpy.types.Image) -> TextureAnalysis:
+        """Analyze the image synchronously, using the cache if possible"""
+        result = self.get(image)
+        if result is not None:
+            return result
+        content_hash = get_image_content_hash(image)
+        result = self._results_by_hash.get(content_hash)
+        if result is None:
+            width, height = image.size
+            result = analyze_pixels(get_image_pixels(image), width, height)
+            self._results_by_hash[content_hash] = result
+        return result
+
+    def _submit_pending(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                thread_name_prefix="SMH texture analysis"
+            )
+        batch = self._pending_image_names[: self.BATCH_SIZE]
+        del self._pending_image_names[: self.BATCH_SIZE]
+        for image_name in batch:
+            image = bpy.data.images.get(image_name)
+            if image is None:
+                continue
+            key = get_image_key(image)
+            width, height = image.size
+            if width == 0 or height == 0:
+                # no image data (missing file...)
+                self._pending_keys.discard(key)
+                continue
+            pixels = get_image_pixels(image)
+            future = self._executor.submit(_analyze_texture_job, pixels, width, height)
+            self._futures.append((key, future))
+
+        n_previews = self.BATCH_SIZE - len(batch)
+        preview_batch = self._pending_previews[:n_previews]
+        del self._pending_previews[:n_previews]
+        for image_name, format, dither in preview_batch:
+            image = bpy.data.images.get(image_name)
+            if image is None:
+                continue
+            key = get_image_key(image), format, dither
+            width, height = image.size
+            if width == 0 or height == 0:
+                self._pending_preview_keys.discard(key)
+                continue
+            pixels = get_image_pixels(image)
+            future = self._executor.submit(
+                _quantize_preview_job, pixels, width, height, format, dither
+            )
+            self._preview_futures.append((key, (width, height), future))
+
+    def _collect_done(self):
+        n_done = 0
+        still_running = []
+        for key, future in self._futures:
+            if not future.done():
+                still_running.append((key, future))
+                continue
+            self._pending_keys.discard(key)
+            try:
+                content_hash, result = future.result()
+            except Exception:
+                traceback.print_exc()
+                continue
+            self._results_by_hash.setdefault(content_hash, result)
+            IMAGE_CONTENT_HASHES[key] = content_hash
+            n_done += 1
+        self._futures = still_running
+        return n_done
+
+    def _collect_done_previews(self):
+        still_running = []
+        for key, size, future in self._preview_futures:
+            if not future.done():
+                still_running.append((key, size, future))
+                continue
+            self._pending_preview_keys.discard(key)
+            try:
+                content_hash, (indices, palette) = future.result()
+            except Exception:
+                traceback.print_exc()
+                continue
+            image_key, format, dither = key
+            IMAGE_CONTENT_HASHES[image_key] = content_hash
+            QUANTIZED_PREVIEW_CACHE.add(
+                content_hash, format, dither, *size, indices, palette
+            )
+            # display the preview instead of the original image
+            UPDATE_SCHEDULER.schedule(
+                mat
+                for mat in bpy.data.materials
+                if mat.simple_material_helper.preview_quantized
+                and mat.simple_material_helper.image is not None
+                and get_image_key(mat.simple_material_helper.image) == image_key
+                and mat.simple_material_helper.preview_format == format
+                and mat.simple_material_helper.preview_dither == dither
+            )
+        self._preview_futures = still_running
+
+    def on_timer(self) -> "Optional[float]":
+        self._submit_pending()
+        if self._collect_done():
+            tag_redraw_properties()
+        self._collect_done_previews()
+        if (
+            self._pending_image_names
+            or self._futures
+            or self._pending_previews
+            or self._preview_futures
+        ):
+            return 0.1
+        return None
+
+    def clear(self):
+        self._pending_image_names.clear()
+        self._pending_keys.clear()
+        for key, future in self._futures:
+            future.cancel()
+        self._futures.clear()
+        self._pending_previews.clear()
+        self._pending_preview_keys.clear()
+        for key, size, future in self._preview_futures:
+            future.cancel()
+        self._preview_futures.clear()
+        if bpy.app.timers.is_registered(on_texture_analyzer_timer):
+            bpy.app.timers.unregister(on_texture_analyzer_timer)
+
+    def shutdown(self):
+        self.clear()
+        self._results_by_hash.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+TEXTURE_ANALYZER = TextureAnalyzer()
+
+
+def on_texture_analyzer_timer():
+    return TEXTURE_ANALYZER.on_timer()
+
+
+def tag_redraw_properties():
+    window_manager = bpy.context.window_manager
+    if window_manager is None:
+        return
+    for window in window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == "PROPERTIES":
+                area.tag_redraw()
+
+
+def draw_texture_analysis(layout: bpy.types.UILayout, image: bpy.types.Image):
+    """Draw the N64 texture analysis of the image, requesting it if needed.
+
+    Never analyzes the image itself, so it's fine to call from draw().
+    """
+    analysis = TEXTURE_ANALYZER.get(image)
+    if analysis is None:
+        TEXTURE_ANALYZER.request(image)
+        layout.label(text="Analyzing texture...", icon="TIME")
+        return
+
+    box = layout.box()
+    row = box.row()
+    row.label(
+        text=f"Lossless: {analysis.best_lossless_format}, "
+        f"near-lossless: {analysis.best_near_lossless_format}"
+    )
+    row.operator(AnalyzeTexturesOperator.bl_idname, text="", icon="FILE_REFRESH")
+    alpha_texts = {
+        "OPAQUE": "opaque",
+        "BINARY": "binary alpha",
+        "FULL": "alpha",
+    }
+    box.label(
+        text=f"{analysis.unique_colors} color(s)"
+        + (", grayscale" if analysis.grayscale else "")
+        + f", {alpha_texts[analysis.alpha]}"
+    )
+    format = analysis.best_near_lossless_format
+    size = analysis.get_size(format)
+    if analysis.fits_tmem(format):
+        box.label(text=f"{format}: {size} bytes, fits in TMEM")
+    else:
+        box.label(text=f"{format}: {size} bytes, too big for TMEM", icon="ERROR")
+
+
+class AnalyzeTexturesOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_analyze_textures"
+    bl_label = "Analyze Textures"
+    bl_description = (
+        "Analyze again the image of the material, or with Shift the images of all "
+        "Simple Material Helper materials, in the background"
+    )
+
+    all_materials: bpy.props.BoolProperty(
+        name="All Materials",
+        default=False,
+    )
+
+    def invoke(self, context, event):
+        self.all_materials = event.shift
+        return self.execute(context)
+
+    def execute(self, context):
+        if self.all_materials:
+            materials = [mat for mat in bpy.data.materials if is_simple_material(mat)]
+        else:
+            materials = [context.material] if context.material is not None else []
+        images = {
+            mat.simple_material_helper.image.name: mat.simple_material_helper.image
+            for mat in materials
+            if mat.simple_material_helper.image is not None
+        }
+        for image in images.values():
+            TEXTURE_ANALYZER.forget(image)
+            TEXTURE_ANALYZER.request(image)
+        return {"FINISHED"}
+
+
+# Palette quantization (CI4/CI8)
+
+N64_PALETTE_SIZES = {
+    "CI4": 16,
+    "CI8": 256,
+}
+
+# 4x4 Bayer matrix, normalized to [-0.5, 0.5)
+BAYER_4X4 = (
+    np.array(
+        (
+            (0, 8, 2, 10),
+            (12, 4, 14, 6),
+            (3, 11, 1, 9),
+            (15, 7, 13, 5),
+        ),
+        dtype=np.float32,
+    )
+    / 16
+    - 0.5
+)
+
+
+def to_rgba5551(colors: "np.ndarray") -> "np.ndarray":
+    """Round 8-bit RGBA colors to what RGBA16 (5551) can represent"""
+    colors = np.asarray(colors, dtype=np.float32)
+    rgb = np.rint(np.rint(colors[:, :3] * (31 / 255)) * (255 / 31))
+    a = np.where(colors[:, 3:] >= 128, 255, 0)
+    return np.concatenate((rgb, a), axis=1).astype(np.uint8)
+
+
+def median_cut_palette(
+    colors: "np.ndarray", counts: "np.ndarray", n_colors: int
+) -> "np.ndarray":
+    """Pick a palette of at most n_colors for the unique RGBA colors,
+    weighted by counts, by median cut.
+    """
+    colors = colors.astype(np.float32)
+    if len(colors) <= n_colors:
+        return colors
+
+    def get_ranges(box):
+        return np.ptp(colors[box], axis=0) if len(box) > 1 else np.zeros(4)
+
+    boxes = [np.arange(len(colors))]
+    ranges = [get_ranges(boxes[0])]
+    while len(boxes) < n_colors:
+        # split the box with the widest channel range
+        i = max(range(len(boxes)), key=lambda i: ranges[i].max())
+        if ranges[i].max() == 0:
+            break
+        box = boxes[i]
+        channel = int(np.argmax(ranges[i]))
+        box = box[np.argsort(colors[box, channel], kind="stable")]
+        cumulative_counts = np.cumsum(counts[box])
+        split = int(np.searchsorted(cumulative_counts, cumulative_counts[-1] / 2))
+        split = min(max(split, 1), len(box) - 1)
+        boxes[i] = box[:split]
+        boxes.append(box[split:])
+        ranges[i] = get_ranges(boxes[i])
+        ranges.append(get_ranges(boxes[-1]))
+
+    return np.array(
+        [np.average(colors[box], axis=0, weights=counts[box]) for box in boxes],
+        dtype=np.float32,
+    )
+
+
+def nearest_palette_indices(
+    colors: "np.ndarray", palette: "np.ndarray", chunk_size=16384
+) -> "np.ndarray":
+    """Index of the nearest palette color for each color"""
+    palette = palette.astype(np.float32)
+    palette_norms = (palette * palette).sum(axis=1)
+    indices = np.empty(len(colors), dtype=np.intp)
+    for start in range(0, len(colors), chunk_size):
+        chunk = colors[start : start + chunk_size].astype(np.float32)
+        # |c - p|^2 without the |c|^2 term, constant for each color
+        distances = palette_norms[np.newaxis, :] - 2 * (chunk @ palette.T)
+        indices[start : start + chunk_size] = distances.argmin(axis=1)
+    return indices
+
+
+def quantize_pixels(
+    pixels: "np.ndarray",
+    width: int,
+    height: int,
+    format: str,
+    dither: bool,
+) -> "tuple[np.ndarray, np.ndarray]":
+    """Quantize RGBA float pixels (as from Image.pixels) to a CI4/CI8 palette.
+
+    Returns the palette indices of the pixels and the palette,
+    as 8-bit RGBA colors representable by RGBA16 (as N64 palettes are).
+    """
+    n_colors = N64_PALETTE_SIZES[format]
+    rgba8 = np.rint(np.clip(pixels, 0, 1) * 255).astype(np.uint8).reshape(-1, 4)
+
+    unique_packed, inverse, counts = np.unique(
+        rgba8.view(np.uint32), return_inverse=True, return_counts=True
+    )
+    unique = unique_packed.view(np.uint8).reshape(-1, 4)
+    palette = median_cut_palette(to_rgba5551(unique), counts, n_colors)
+    palette = np.unique(to_rgba5551(palette).view(np.uint32)).view(np.uint8)
+    palette = palette.reshape(-1, 4)
+
+    if dither:
+        # spread the threshold over about the distance between palette colors
+        spread = 255 / max(len(palette) ** (1 / 3), 1)
+        thresholds = np.tile(BAYER_4X4, ((height + 3) // 4, (width + 3) // 4))[
+            :height, :width
+        ].reshape(-1, 1)
+        dithered = rgba8.astype(np.float32)
+        dithered[:, :3] += thresholds * spread
+        indices = nearest_palette_indices(dithered, palette)
+    else:
+        # map unique colors only
+        indices = nearest_palette_indices(unique, palette)[inverse.reshape(-1)]
+
+    return indices.astype(np.uint8), palette
+
+
+class QuantizedPreview(typing.NamedTuple):
+    image_name: str
+    indices: "np.ndarray"
+    palette: "np.ndarray"
+
+
+class QuantizedPreviewCache:
+    """Least recently used cache of quantized previews, by (content hash, format,
+    dither), evicting the preview images of dropped entries if unused.
+
+    Previews are quantized by TEXTURE_ANALYZER in the background, the preview
+    images are named after the content hash so entries never share an image.
+    """
+
+    MAX_ENTRIES = 32
+
+    def __init__(self):
+        self._entries: "collections.OrderedDict[tuple, QuantizedPreview]" = (
+            collections.OrderedDict()
+        )
+
+    def get_preview_image(
+        self, image: bpy.types.Image, format: str, dither: bool
+    ) -> "Optional[bpy.types.Image]":
+        """Get the preview image, or None and request it if not quantized yet"""
+        read_image_cache(image)
+        content_hash = IMAGE_CONTENT_HASHES.get(get_image_key(image))
+        if content_hash is not None:
+            key = content_hash, format, dither
+            entry = self._entries.get(key)
+            if entry is not None:
+                preview_image = bpy.data.images.get(entry.image_name)
+                if preview_image is not None:
+                    self._entries.move_to_end(key)
+                    return preview_image
+        TEXTURE_ANALYZER.request_preview(image, format, dither)
+        return None
+
+    def add(
+        self,
+        content_hash: str,
+        format: str,
+        dither: bool,
+        width: int,
+        height: int,
+        indices: "np.ndarray",
+        palette: "np.ndarray",
+    ) -> bpy.types.Image:
+        """Store a quantized preview, (re)filling its preview image"""
+        key = content_hash, format, dither
+        preview_image_name = f"SMH Preview {content_hash} {format}" + (
+            " Dither" if dither else ""
+        )
+        preview_image = bpy.data.images.get(preview_image_name)
+        if preview_image is None:
+            preview_image = bpy.data.images.new(
+                preview_image_name, width, height, alpha=True
+            )
+        preview_image.pixels.foreach_set(
+            (palette[indices].astype(np.float32) / 255).reshape(-1)
+        )
+
+        self._entries[key] = QuantizedPreview(preview_image.name, indices, palette)
+        self._entries.move_to_end(key)
+        self._evict()
+        return preview_image
+
+    def get_quantized(
+        self, image: bpy.types.Image, format: str, dither: bool
+    ) -> "Optional[QuantizedPreview]":
+        return self._entries.get((get_image_content_hash(image), format, dither))
+
+    def _evict(self):
+        while len(self._entries) > self.MAX_ENTRIES:
+            _, entry = self._entries.popitem(last=False)
+            preview_image = bpy.data.images.get(entry.image_name)
+            if preview_image is not None and preview_image.users == 0:
+                bpy.data.images.remove(preview_image)
+
+    def clear(self):
+        self._entries.clear()
+
+
+QUANTIZED_PREVIEW_CACHE = QuantizedPreviewCache()
+
+
+def get_displayed_image(
+    props,  # type: MaterialProperties
+) -> "Optional[bpy.types.Image]":
+    """The image to use in the material's image node.
+
+    The original image is displayed until the preview is quantized.
+    """
+    if props.image is None or not props.preview_quantized:
+        return props.image
+    if props.image.size[0] == 0 or props.image.size[1] == 0:
+        return props.image
+    preview_image = QUANTIZED_PREVIEW_CACHE.get_preview_image(
+        props.image, props.preview_format, props.preview_dither
+    )
+    return preview_image if preview_image is not None else props.image
+
+
+# N64 texture export
+
+
+def _to_bits(values: "np.ndarray", bits: int) -> "np.ndarray":
+    """Scale 8-bit values to fewer bits, rounding like _quantize_error"""
+    return np.rint(values * (((1 << bits) - 1) / 255)).astype(np.uint16)
+
+
+def _pack_nibbles(nibbles: "np.ndarray") -> "np.ndarray":
+    """Pack 4-bit values two per byte, first value in the high nibble"""
+    if len(nibbles) % 2:
+        nibbles = np.append(nibbles, 0)
+    nibbles = nibbles.astype(np.uint8).reshape(-1, 2)
+    return (nibbles[:, 0] << 4) | nibbles[:, 1]
+
+
+def _encode_rgba16(rgba8: "np.ndarray") -> "np.ndarray":
+    rgba16 = (
+        (_to_bits(rgba8[:, 0], 5) << 11)
+        | (_to_bits(rgba8[:, 1], 5) << 6)
+        | (_to_bits(rgba8[:, 2], 5) << 1)
+        | _to_bits(rgba8[:, 3], 1)
+    )
+    return rgba16.astype(">u2")
+
+
+def encode_n64_texture(
+    pixels: "np.ndarray", width: int, height: int, format: str
+) -> "tuple[bytes, Optional[bytes]]":
+    """Convert RGBA float pixels (as from Image.pixels) to N64 texel data,
+    and for CI formats the palette (TLUT) as RGBA16 colors.
+    """
+    rgba8 = np.rint(np.clip(pixels, 0, 1) * 255).astype(np.uint8)
+    # Blender stores rows bottom to top, N64 textures top to bottom
+    rgba8 = rgba8.reshape(height, width, 4)[::-1].reshape(-1, 4)
+    intensity = np.rint(rgba8[:, :3].mean(axis=1))
+    a = rgba8[:, 3]
+
+    tlut = None
+    if format == "RGBA32":
+        texels = rgba8
+    elif format == "RGBA16":
+        texels = _encode_rgba16(rgba8)
+    elif format == "IA16":
+        texels = np.stack((intensity, a), axis=1).astype(np.uint8)
+    elif format == "IA8":
+        texels = ((_to_bits(intensity, 4) << 4) | _to_bits(a, 4)).astype(np.uint8)
+    elif format == "IA4":
+        texels = _pack_nibbles((_to_bits(intensity, 3) << 1) | _to_bits(a, 1))
+    elif format == "I8":
+        texels = intensity.astype(np.uint8)
+    elif format == "I4":
+        texels = _pack_nibbles(_to_bits(intensity, 4))
+    elif format in N64_PALETTE_SIZES:
+        indices, palette = quantize_pixels(
+            rgba8.astype(np.float32) / 255, width, height, format, False
+        )
+        texels = _pack_nibbles(indices) if format == "CI4" else indices
+        tlut = _encode_rgba16(palette).tobytes()
+    else:
+        raise ValueError(f"Unknown N64 texture format {format!r}")
+
+    return texels.tobytes(), tlut
+
+
+def format_inc_c(data: bytes) -> str:
+    """Format data as 64-bit words for including in a u64 array"""
+    if len(data) % 8:
+        data += bytes(8 - len(data) % 8)
+    words = np.frombuffer(data, dtype=">u8")
+    lines = (
+        ", ".join(f"0x{word:016X}" for word in words[i : i + 4])
+        for i in range(0, len(words), 4)
+    )
+    return ",\n".join(lines) + ",\n"
+
+
+def get_c_identifier(name: str) -> str:
+    identifier = "".join(c if c.isalnum() else "_" for c in name)
+    if not identifier or identifier[0].isdigit():
+        identifier = "_" + identifier
+    return identifier
+
+
+def _export_texture_job(
+    pixels: "np.ndarray",
+    width: int,
+    height: int,
+    format: str,
+    directory: str,
+    c_name: str,
+) -> "dict":
+    if format == "AUTO":
+        format = analyze_pixels(pixels, width, height).best_near_lossless_format
+    texels, tlut = encode_n64_texture(pixels, width, height, format)
+
+    outputs = [(f"{c_name}.{format.lower()}", texels)]
+    if tlut is not None:
+        outputs.append((f"{c_name}.tlut.rgba16", tlut))
+    files = []
+    for base_name, data in outputs:
+        base_path = Path(directory) / base_name
+        base_path.with_name(base_name + ".bin").write_bytes(data)
+        base_path.with_name(base_name + ".inc.c").write_text(format_inc_c(data))
+        files += [base_name + ".bin", base_name + ".inc.c"]
+    return {"format": format, "files": files}
+
+
+def get_worker_count(max_workers: "Optional[int]" = None) -> int:
+    """Number of worker threads for CPU bound jobs, by default one per core.
+
+    Threads rather than processes: Blender runs threads of its own so forking it
+    isn't safe, and numpy releases the GIL for most of the work anyway.
+    """
+    if max_workers is not None:
+        return max_workers
+    return os.cpu_count() or 1
+
+
+N64_TEXTURE_EXPORT_MANIFEST_NAME = "smh_textures.json"
+N64_TEXTURE_EXPORT_MANIFEST_VERSION = 1
+
+
+class TextureExportResult(typing.NamedTuple):
+    exported: "list[str]"
+    skipped: "list[str]"
+    manifest_path: Path
+
+
+def get_export_format(
+    props,  # type: MaterialProperties
+) -> str:
+    """N64 texture format to export the material's image with"""
+    if props.preview_quantized:
+        return props.preview_format
+    return "AUTO"
+
+
+@profiled("export_n64_textures")
+def export_n64_textures(
+    directory,
+    materials: "Optional[typing.Iterable[bpy.types.Material]]" = None,
+    force=False,
+    max_workers: "Optional[int]" = None,
+    window_manager: "Optional[bpy.types.WindowManager]" = None,
+) -> TextureExportResult:
+    """Export the images of SMH materials (by default all of them) to N64 texture
+    binaries (.bin) and C includes (.inc.c) in directory.
+
+    Images with the same contents and format as listed in the manifest from a
+    previous export are skipped, unless force is set. Files of the previous
+    export of a texture which aren't written again (after its format changed)
+    are removed.
+    """
+    directory = Path(bpy.path.abspath(str(directory)))
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / N64_TEXTURE_EXPORT_MANIFEST_NAME
+
+    old_entries = dict()
+    if manifest_path.exists():
+        with manifest_path.open() as f:
+            manifest = json.load(f)
+        if manifest.get("version") == N64_TEXTURE_EXPORT_MANIFEST_VERSION:
+            old_entries = manifest["textures"]
+
+    if materials is None:
+        materials = bpy.data.materials
+    # image name -> (image, format)
+    images: "dict[str, tuple[bpy.types.Image, str]]" = dict()
+    for mat in materials:
+        if not is_simple_material(mat):
+            continue
+        props = mat.simple_material_helper  # type: MaterialProperties
+        image = props.image
+        if image is None or image.name in images:
+            continue
+        if image.size[0] == 0 or image.size[1] == 0:
+            print("Simple Material Helper: skipping empty image", image.name)
+            continue
+        images[image.name] = image, get_export_format(props)
+
+    c_names = set()
+    entries = dict()
+    exported = []
+    skipped = []
+    futures: "dict[concurrent.futures.Future, tuple[str, dict]]" = dict()
+
+    def collect(done):
+        for future in done:
+            c_name, entry = futures.pop(future)
+            entry.update(future.result())
+            entries[c_name] = entry
+            exported.append(entry["image"])
+
+    if window_manager is not None:
+        window_manager.progress_begin(0, len(images))
+    n_workers = get_worker_count(max_workers)
+    with concurrent.futures.ThreadPoolExecutor(
+        n_workers, thread_name_prefix="SMH texture export"
+    ) as executor:
+        # bound the pixels held in memory for pending jobs
+        max_pending = 2 * n_workers
+        for i, (image, format) in enumerate(images.values()):
+            c_name = get_c_identifier(image.name)
+            while c_name in c_names:
+                c_name += "_"
+            c_names.add(c_name)
+
+            width, height = image.size
+            key = get_image_key(image)
+            pixels = None
+            content_hash = IMAGE_CONTENT_HASHES.get(key)
+            if content_hash is None:
+                pixels = get_image_pixels(image)
+                content_hash = hash_pixels(pixels, width, height)
+                IMAGE_CONTENT_HASHES[key] = content_hash
+
+            entry = {
+                "image": image.name,
+                "hash": content_hash,
+                "requested_format": format,
+            }
+            old_entry = old_entries.get(c_name)
+            if (
+                not force
+                and old_entry is not None
+                and old_entry["hash"] == content_hash
+                and old_entry["requested_format"] == format
+                and all((directory / file).exists() for file in old_entry["files"])
+            ):
+                entries[c_name] = old_entry
+                skipped.append(image.name)
+            else:
+                if pixels is None:
+                    pixels = get_image_pixels(image)
+                while len(futures) >= max_pending:
+                    done, _ = concurrent.futures.wait(
+                        futures, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    collect(done)
+                future = executor.submit(
+                    _export_texture_job,
+                    pixels,
+                    width,
+                    height,
+                    format,
+                    str(directory),
+                    c_name,
+                )
+                futures[future] = c_name, entry
+
+            if window_manager is not None:
+                window_manager.progress_update(i + 1)
+        collect(list(futures))
+    if window_manager is not None:
+        window_manager.progress_end()
+
+    written_files = {file for entry in entries.values() for file in entry["files"]}
+    for c_name, old_entry in old_entries.items():
+        if c_name not in entries:
+            continue
+        for file in old_entry["files"]:
+            if file not in written_files:
+                try:
+                    (directory / file).unlink()
+                except FileNotFoundError:
+                    pass
+
+    with manifest_path.open("w") as f:
+        json.dump(
+            {
+                "version": N64_TEXTURE_EXPORT_MANIFEST_VERSION,
+                "textures": entries,
+            },
+            f,
+            indent=1,
+            sort_keys=True,
+        )
+
+    return TextureExportResult(exported, skipped, manifest_path)
+
+
+class ExportTexturesOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_export_textures"
+    bl_label = "Export N64 Textures"
+    bl_description = (
+        "Convert the images of all Simple Material Helper materials to N64 texture "
+        "formats, skipping those unchanged since the last export to the directory"
+    )
+
+    directory: bpy.props.StringProperty(subtype="DIR_PATH")
+    force: bpy.props.BoolProperty(
+        name="Export All",
+        description="Also export the textures unchanged since the last export",
+        default=False,
+    )
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        result = export_n64_textures(
+            self.directory, force=self.force, window_manager=context.window_manager
+        )
+        self.report(
+            {"INFO"},
+            f"Exported {len(result.exported)} textures "
+            f"({len(result.skipped)} unchanged) to {self.directory}",
+        )
+        return {"FINISHED"}
+
+
+# Material manifest export
+
+MATERIAL_MANIFEST_VERSION = 1
+
+
+def get_material_manifest_entry(mat: bpy.types.Material) -> "dict":
+    """The SMH settings of a material, as needed by level toolchains"""
+    props = mat.simple_material_helper  # type: MaterialProperties
+    image = props.image
+    return {
+        "name": mat.name,
+        "image": image.name if image is not None else None,
+        "image_path": (
+            bpy.path.abspath(image.filepath, library=image.library)
+            if image is not None and image.filepath
+            else None
+        ),
+        "uv_repeat_u": props.uv_repeat_u,
+        "uv_repeat_v": props.uv_repeat_v,
+        "transparency": mat.blend_method,
+        "alpha_threshold": round(mat.alpha_threshold, 6),
+        "backface_culling": mat.use_backface_culling,
+        "scroll": [round(props.scroll_u, 6), round(props.scroll_v, 6)],
+        "flipbook_fps": round(props.flipbook_fps, 6) if props.use_flipbook else None,
+    }
+
+
+class MaterialManifestResult(typing.NamedTuple):
+    written: "list[str]"
+    unchanged: "list[str]"
+    rewritten_file: bool
+
+
+def _read_material_manifest(path: Path) -> "dict[str, tuple[str, str]]":
+    """Read a manifest written by export_material_manifest,
+    as material name -> (hash, line)
+    """
+    lines_by_name = dict()
+    try:
+        with path.open(encoding="utf-8") as f:
+            header = json.loads(next(f, "{}"))
+            if header.get("version") != MATERIAL_MANIFEST_VERSION:
+                return lines_by_name
+            for line in f:
+                entry = json.loads(line)
+                lines_by_name[entry["name"]] = entry["hash"], line
+    except (OSError, ValueError, KeyError):
+        traceback.print_exc()
+    return lines_by_name
+
+
+@profiled("export_material_manifest")
+def export_material_manifest(
+    filepath,
+    materials: "Optional[typing.Iterable[bpy.types.Material]]" = None,
+) -> MaterialManifestResult:
+    """Write the settings of SMH materials (by default all of them) to filepath,
+    as JSON lines: a header line then one line per material.
+
+    Each entry has a hash of its settings, entries with the same hash in the
+    existing file are copied as is instead of being encoded again. If no entry
+    changed, the file isn't written.
+    """
+    path = Path(bpy.path.abspath(str(filepath)))
+    old_lines = _read_material_manifest(path) if path.exists() else dict()
+
+    if materials is None:
+        materials = bpy.data.materials
+    written = []
+    unchanged = []
+    lines = []
+    for mat in materials:
+        if not is_simple_material(mat):
+            continue
+        entry = get_material_manifest_entry(mat)
+        entry_hash = hashlib.blake2b(
+            json.dumps(entry, sort_keys=True).encode(), digest_size=8
+        ).hexdigest()
+        old_hash, old_line = old_lines.get(mat.name, (None, None))
+        if old_hash == entry_hash:
+            lines.append(old_line)
+            unchanged.append(mat.name)
+        else:
+            entry["hash"] = entry_hash
+            lines.append(json.dumps(entry, separators=(",", ":")) + "\n")
+            written.append(mat.name)
+
+    if not written and len(unchanged) == len(old_lines):
+        return MaterialManifestResult(written, unchanged, False)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + ".tmp")
+    with temp_path.open("w", encoding="utf-8") as f:
+        json.dump({"version": MATERIAL_MANIFEST_VERSION}, f)
+        f.write("\n")
+        f.writelines(lines)
+    temp_path.replace(path)
+    return MaterialManifestResult(written, unchanged, True)
+
+
+class ExportManifestOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_export_manifest"
+    bl_label = "Export Material Manifest"
+    bl_description = (
+        "Write the settings of all Simple Material Helper materials to a JSON lines "
+        "file, for level toolchains"
+    )
+
+    filepath: bpy.props.StringProperty(subtype="FILE_PATH")
+    filter_glob: bpy.props.StringProperty(default="*.jsonl", options={"HIDDEN"})
+
+    def invoke(self, context, event):
+        if not self.filepath:
+            self.filepath = "smh_materials.jsonl"
+        context.window_manager.fileselect_add(self)
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        result = export_material_manifest(self.filepath)
+        self.report(
+            {"INFO"},
+            f"Wrote {len(result.written)} materials "
+            f"({len(result.unchanged)} unchanged) to {self.filepath}",
+        )
+        return {"FINISHED"}
+
+
+# UV bounds analysis
+
+# N64 texture coordinates are s10.5 fixed point texels, so within [-1024, 1024)
+N64_TEXCOORD_LIMIT = 1024
+
+UV_BOUNDS_EPSILON = 1e-4
+
+
+class MeshUVStats(typing.NamedTuple):
+    """UV statistics of the faces of a mesh using one material index"""
+
+    uv_min: "np.ndarray"
+    uv_max: "np.ndarray"
+    face_span_max: "np.ndarray"
+    # largest absolute (u, v) coordinates of each face
+    face_abs_max: "np.ndarray"
+
+
+def read_mesh_uv_data(
+    mesh: bpy.types.Mesh,
+) -> "Optional[tuple[np.ndarray, np.ndarray, np.ndarray]]":
+    """Read the material indices and loop starts of faces, and the active UVs.
+
+    None if the mesh has no UVs or faces.
+    """
+    uv_layer = mesh.uv_layers.active
+    n_polygons = len(mesh.polygons)
+    if uv_layer is None or n_polygons == 0:
+        return None
+
+    material_indices = np.empty(n_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    loop_starts = np.empty(n_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    uvs = np.empty(len(uv_layer.data) * 2, dtype=np.float32)
+    uv_layer.data.foreach_get("uv", uvs)
+    return material_indices, loop_starts, uvs.reshape(-1, 2)
+
+
+def hash_mesh_uv_data(
+    uv_data: "Optional[tuple[np.ndarray, np.ndarray, np.ndarray]]",
+) -> str:
+    hasher = hashlib.blake2b(digest_size=16)
+    for array in uv_data or ():
+        hasher.update(np.array(array.shape, dtype=np.int64).tobytes())
+        hasher.update(array.tobytes())
+    return hasher.hexdigest()
+
+
+def compute_mesh_uv_stats(
+    uv_data: "Optional[tuple[np.ndarray, np.ndarray, np.ndarray]]",
+) -> "dict[int, MeshUVStats]":
+    """Compute the UV statistics by material index, see read_mesh_uv_data"""
+    if uv_data is None:
+        return dict()
+
+    material_indices, loop_starts, uvs = uv_data
+    n_polygons = len(material_indices)
+
+    # the loops of each face are contiguous, reduce them face by face
+    order = np.argsort(loop_starts, kind="stable")
+    face_min = np.empty((n_polygons, 2), dtype=np.float32)
+    face_max = np.empty((n_polygons, 2), dtype=np.float32)
+    face_min[order] = np.minimum.reduceat(uvs, loop_starts[order], axis=0)
+    face_max[order] = np.maximum.reduceat(uvs, loop_starts[order], axis=0)
+    face_abs_max = np.maximum(np.abs(face_min), np.abs(face_max))
+
+    stats = dict()
+    for material_index in np.unique(material_indices):
+        mask = material_indices == material_index
+        stats[int(material_index)] = MeshUVStats(
+            uv_min=face_min[mask].min(axis=0),
+            uv_max=face_max[mask].max(axis=0),
+            face_span_max=(face_max[mask] - face_min[mask]).max(axis=0),
+            face_abs_max=face_abs_max[mask],
+        )
+    return stats
+
+
+class UVBoundsCache:
+    """Caches UV statistics by mesh, invalidated by depsgraph geometry updates.
+
+    The statistics are also stored in the meshes' cache property on save, keyed
+    by a hash of the UV data (see SMH_CACHE_PROPERTY).
+    """
+
+    # Faces within [-1, 1] can't overflow textures of up to 1024 texels, only the
+    # largest coordinates of other faces are stored
+    STORED_FACE_ABS_MIN = 1.0
+
+    def __init__(self):
+        # mesh name -> ((uv layer name, number of faces), stats by material index,
+        #               hash of the UV data)
+        self._stats_by_mesh: "dict[str, tuple[tuple, dict[int, MeshUVStats], str]]"
+        self._stats_by_mesh = dict()
+        # names of meshes which cache property may be out of date
+        self._stale_mesh_names: "set[str]" = set()
+        # names of the materials to load the stored statistics of, see request
+        self._requested_material_names: "set[str]" = set()
+
+    def _get_check(self, mesh: bpy.types.Mesh):
+        uv_layer = mesh.uv_layers.active
+        return uv_layer.name if uv_layer is not None else None, len(mesh.polygons)
+
+    def is_cached(self, mesh: bpy.types.Mesh):
+        check = self._get_check(mesh)
+        cached = self._stats_by_mesh.get(mesh.name)
+        if cached is not None:
+            return cached[0] == check
+        # stored stats are only checked against the UV data by get
+        return (
+            mesh.name not in self._stale_mesh_names
+            and self._get_stored_check(mesh) == check
+        )
+
+    def _get_stored_check(self, mesh: bpy.types.Mesh):
+        cache = mesh.get(SMH_CACHE_PROPERTY)
+        if cache is None or cache.get("version") != SMH_CACHE_VERSION:
+            return None
+        return cache.get("uv_layer"), cache.get("faces")
+
+    def get_loaded(self, mesh: bpy.types.Mesh) -> "Optional[dict[int, MeshUVStats]]":
+        """The statistics of the mesh if in memory, without reading anything"""
+        cached = self._stats_by_mesh.get(mesh.name)
+        if cached is None or cached[0] != self._get_check(mesh):
+            return None
+        return cached[1]
+
+    def request(self, mat: bpy.types.Material):
+        """Schedule loading the stored statistics of the meshes using the material,
+        see analyze_material_uvs.
+        """
+        self._requested_material_names.add(mat.name)
+        if not bpy.app.timers.is_registered(on_uv_bounds_timer):
+            bpy.app.timers.register(on_uv_bounds_timer, first_interval=0)
+
+    def on_timer(self) -> "Optional[float]":
+        loaded = False
+        for material_name in self._requested_material_names:
+            mat = bpy.data.materials.get(material_name)
+            if mat is not None:
+                analyze_material_uvs(mat, cached_only=True)
+                loaded |= get_loaded_material_uvs(mat)[0]
+        self._requested_material_names.clear()
+        if loaded:
+            tag_redraw_properties()
+        return None
+
+    def get(self, mesh: bpy.types.Mesh) -> "dict[int, MeshUVStats]":
+        check = self._get_check(mesh)
+        cached = self._stats_by_mesh.get(mesh.name)
+        if cached is not None and cached[0] == check:
+            return cached[1]
+        uv_data = read_mesh_uv_data(mesh)
+        uv_hash = hash_mesh_uv_data(uv_data)
+        cache = read_cache_property(mesh, lambda: uv_hash)
+        if cache is not None:
+            stats = self._from_cache(cache["stats"])
+            if PROFILER.enabled:
+                PROFILER.count("mesh caches read", 1)
+        else:
+            stats = compute_mesh_uv_stats(uv_data)
+            if PROFILER.enabled:
+                PROFILER.count("meshes UV analyzed", 1)
+        self._stats_by_mesh[mesh.name] = check, stats, uv_hash
+        return stats
+
+    def _to_cache(self, stats: "dict[int, MeshUVStats]") -> dict:
+        data = dict()
+        for material_index, material_stats in stats.items():
+            face_abs_max = material_stats.face_abs_max
+            stored_face_abs_max = face_abs_max[
+                np.any(face_abs_max >= self.STORED_FACE_ABS_MIN, axis=1)
+            ]
+            data[str(material_index)] = {
+                "uv_min": material_stats.uv_min.tolist(),
+                "uv_max": material_stats.uv_max.tolist(),
+                "face_span_max": material_stats.face_span_max.tolist(),
+                "faces": len(face_abs_max),
+                "face_abs_max": stored_face_abs_max.reshape(-1).tolist(),
+            }
+        return data
+
+    def _from_cache(self, data: dict) -> "dict[int, MeshUVStats]":
+        stats = dict()
+        for material_index, material_data in data.items():
+            stored_face_abs_max = np.array(
+                material_data["face_abs_max"], dtype=np.float32
+            ).reshape(-1, 2)
+            face_abs_max = np.zeros((material_data["faces"], 2), dtype=np.float32)
+            face_abs_max[: len(stored_face_abs_max)] = stored_face_abs_max
+            stats[int(material_index)] = MeshUVStats(
+                uv_min=np.array(material_data["uv_min"], dtype=np.float32),
+                uv_max=np.array(material_data["uv_max"], dtype=np.float32),
+                face_span_max=np.array(
+                    material_data["face_span_max"], dtype=np.float32
+                ),
+                face_abs_max=face_abs_max,
+            )
+        return stats
+
+    @profiled("UVBoundsCache.write_caches")
+    def write_caches(self):
+        """Store the statistics of meshes in their cache property"""
+        for mesh_name in self._stale_mesh_names - self._stats_by_mesh.keys():
+            mesh = bpy.data.meshes.get(mesh_name)
+            if mesh is not None:
+                remove_cache_property(mesh)
+        self._stale_mesh_names.clear()
+        for mesh_name, (check, stats, uv_hash) in self._stats_by_mesh.items():
+            mesh = bpy.data.meshes.get(mesh_name)
+            if mesh is None or self._get_check(mesh) != check:
+                continue
+            uv_layer_name, faces = check
+            write_cache_property(
+                mesh,
+                uv_hash,
+                {
+                    "uv_layer": uv_layer_name,
+                    "faces": faces,
+                    "stats": self._to_cache(stats),
+                },
+            )
+
+    def invalidate_mesh(self, mesh_name: str):
+        self._stats_by_mesh.pop(mesh_name, None)
+        self._stale_mesh_names.add(mesh_name)
+
+    def clear(self):
+        self._stats_by_mesh.clear()
+        self._stale_mesh_names.clear()
+        self._requested_material_names.clear()
+        if bpy.app.timers.is_registered(on_uv_bounds_timer):
+            bpy.app.timers.unregister(on_uv_bounds_timer)
+
+
+UV_BOUNDS_CACHE = UVBoundsCache()
+
+
+def on_uv_bounds_timer():
+    return UV_BOUNDS_CACHE.on_timer()
+
+
+class MaterialUVBounds(typing.NamedTuple):
+    faces: int
+    uv_min: "tuple[float, float]"
+    uv_max: "tuple[float, float]"
+    face_span_max: "tuple[float, float]"
+    # faces with texel coordinates out of the N64 range (None without image)
+    overflowing_faces: "Optional[int]"
+    suggested_uv_repeat_u: str
+    suggested_uv_repeat_v: str
+
+
+def get_material_slot_indices(
+    mat: bpy.types.Material, mesh: bpy.types.Mesh
+) -> "set[int]":
+    """Material indices of the faces of the mesh using the material"""
+    indices = {i for i, other_mat in enumerate(mesh.materials) if other_mat == mat}
+    if not indices:
+        # the material is only used through object linked material slots
+        for object in bpy.data.objects:
+            if object.data == mesh:
+                indices.update(
+                    i
+                    for i, material_slot in enumerate(object.material_slots)
+                    if material_slot.link == "OBJECT" and material_slot.material == mat
+                )
+    return indices
+
+
+def suggest_uv_repeat(uv_min: float, uv_max: float, current: str) -> str:
+    """The cheapest repeat mode for UVs within [uv_min, uv_max].
+
+    CLAMP if the UVs don't go out of the texture, which allows drawing without
+    wrapping. Otherwise, MIRROR is kept as it changes how the texture looks,
+    and WRAP is used instead of CLAMP.
+    """
+    if uv_min >= -UV_BOUNDS_EPSILON and uv_max <= 1 + UV_BOUNDS_EPSILON:
+        return "CLAMP"
+    if current == "MIRROR":
+        return "MIRROR"
+    return "WRAP"
+
+
+@profiled("analyze_material_uvs")
+def analyze_material_uvs(
+    mat: bpy.types.Material, cached_only=False
+) -> "Optional[MaterialUVBounds]":
+    """Compute the UV bounds of the faces using the material in all meshes.
+
+    Returns None if no face uses the material, or if cached_only and some
+    mesh isn't analyzed yet.
+    """
+    meshes = MATERIAL_USERS_INDEX.get_meshes(mat)
+    if cached_only and not all(UV_BOUNDS_CACHE.is_cached(mesh) for mesh in meshes):
+        return None
+    return get_material_uv_bounds(
+        mat, meshes, [UV_BOUNDS_CACHE.get(mesh) for mesh in meshes]
+    )
+
+
+def get_loaded_material_uvs(
+    mat: bpy.types.Material,
+) -> "tuple[bool, Optional[MaterialUVBounds]]":
+    """The UV bounds of the material from the statistics in memory, without
+    indexing or reading anything, so it's fine to call from draw().
+
+    Returns whether all meshes using the material are loaded, and the bounds
+    (None if no face uses the material, or not loaded).
+    """
+    meshes = MATERIAL_USERS_INDEX.get_indexed_meshes(mat)
+    if meshes is None:
+        return False, None
+    mesh_stats = [UV_BOUNDS_CACHE.get_loaded(mesh) for mesh in meshes]
+    if any(stats is None for stats in mesh_stats):
+        return False, None
+    return True, get_material_uv_bounds(mat, meshes, mesh_stats)
+
+
+def get_material_uv_bounds(
+    mat: bpy.types.Material,
+    meshes: "list[bpy.types.Mesh]",
+    mesh_stats: "list[dict[int, MeshUVStats]]",
+) -> "Optional[MaterialUVBounds]":
+    """Combine the statistics of the meshes (in the same order) into the UV bounds
+    of the faces using the material, None if there are none.
+    """
+    all_stats = [
+        stats
+        for mesh, stats_by_index in zip(meshes, mesh_stats)
+        for material_index in get_material_slot_indices(mat, mesh)
+        for stats in (stats_by_index.get(material_index),)
+        if stats is not None
+    ]
+    if not all_stats:
+        return None
+
+    uv_min = np.min([stats.uv_min for stats in all_stats], axis=0)
+    uv_max = np.max([stats.uv_max for stats in all_stats], axis=0)
+    face_span_max = np.max([stats.face_span_max for stats in all_stats], axis=0)
+
+    props = mat.simple_material_helper  # type: MaterialProperties
+    overflowing_faces = None
+    if props.image is not None and props.image.size[0] and props.image.size[1]:
+        limits = N64_TEXCOORD_LIMIT / np.array(props.image.size, dtype=np.float32)
+        overflowing_faces = sum(
+            int(np.any(stats.face_abs_max >= limits, axis=1).sum())
+            for stats in all_stats
+        )
+
+    return MaterialUVBounds(
+        faces=sum(len(stats.face_abs_max) for stats in all_stats),
+        uv_min=(float(uv_min[0]), float(uv_min[1])),
+        uv_max=(float(uv_max[0]), float(uv_max[1])),
+        face_span_max=(float(face_span_max[0]), float(face_span_max[1])),
+        overflowing_faces=overflowing_faces,
+        suggested_uv_repeat_u=suggest_uv_repeat(
+            uv_min[0], uv_max[0], props.uv_repeat_u
+        ),
+        suggested_uv_repeat_v=suggest_uv_repeat(
+            uv_min[1], uv_max[1], props.uv_repeat_v
+        ),
+    )
+
+
+class AutoUVRepeatOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_auto_uv_repeat"
+    bl_label = "Auto UV Repeat"
+    bl_description = (
+        "Set the cheapest UV repeat modes for how the UVs of faces using the "
+        "material, or with Shift all Simple Material Helper materials, go out of "
+        "the texture, and report faces out of the N64 texture coordinates range"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    all_materials: bpy.props.BoolProperty(
+        name="All Materials",
+        default=False,
+    )
+
+    def invoke(self, context, event):
+        self.all_materials = event.shift
+        return self.execute(context)
+
+    def execute(self, context):
+        if self.all_materials:
+            materials = [mat for mat in bpy.data.materials if is_simple_material(mat)]
+        else:
+            materials = [context.material] if context.material is not None else []
+
+        changed_materials = []
+        overflowing_faces = 0
+        PROPAGATION_STATE.active = True
+        try:
+            for mat in materials:
+                uv_bounds = analyze_material_uvs(mat)
+                if uv_bounds is None:
+                    continue
+                overflowing_faces += uv_bounds.overflowing_faces or 0
+                props = mat.simple_material_helper  # type: MaterialProperties
+                if (props.uv_repeat_u, props.uv_repeat_v) != (
+                    uv_bounds.suggested_uv_repeat_u,
+                    uv_bounds.suggested_uv_repeat_v,
+                ):
+                    props.uv_repeat_u = uv_bounds.suggested_uv_repeat_u
+                    props.uv_repeat_v = uv_bounds.suggested_uv_repeat_v
+                    changed_materials.append(mat)
+        finally:
+            PROPAGATION_STATE.active = False
+
+        set_simple_materials(changed_materials)
+
+        self.report({"INFO"}, f"Changed {len(changed_materials)} material(s)")
+        if overflowing_faces:
+            self.report(
+                {"WARNING"},
+                f"{overflowing_faces} face(s) go out of the N64 texture coordinates "
+                "range, see the material panel",
+            )
+        return {"FINISHED"}
+
+
+def draw_uv_bounds(layout: bpy.types.UILayout, mat: bpy.types.Material):
+    # only show what is already in memory, stored statistics are loaded by a
+    # timer and analyzing is up to the operator
+    loaded, uv_bounds = get_loaded_material_uvs(mat)
+    if not loaded:
+        UV_BOUNDS_CACHE.request(mat)
+        layout.label(text="UVs not analyzed")
+    elif uv_bounds is not None:
+        layout.label(
+            text=(
+                f"UV range U {uv_bounds.uv_min[0]:.2f}..{uv_bounds.uv_max[0]:.2f}"
+                f"  V {uv_bounds.uv_min[1]:.2f}..{uv_bounds.uv_max[1]:.2f}"
+                f"  ({uv_bounds.faces} faces)"
+            )
+        )
+        if uv_bounds.overflowing_faces:
+            layout.label(
+                text=(
+                    f"{uv_bounds.overflowing_faces} face(s) out of "
+                    "the N64 texture coordinates range"
+                ),
+                icon="ERROR",
+            )
+        props = mat.simple_material_helper  # type: MaterialProperties
+        if (props.uv_repeat_u, props.uv_repeat_v) != (
+            uv_bounds.suggested_uv_repeat_u,
+            uv_bounds.suggested_uv_repeat_v,
+        ):
+            layout.label(
+                text=(
+                    f"Suggested: {uv_bounds.suggested_uv_repeat_u} "
+                    f"{uv_bounds.suggested_uv_repeat_v}"
+                ),
+                icon="INFO",
+            )
+    layout.operator(AutoUVRepeatOperator.bl_idname)
+
+
+# Vertex color lighting bake
+
+
+class BakeLight(typing.NamedTuple):
+    # "SUN" or "POINT"
+    type: str
+    # color times strength
+    color: "tuple[float, float, float]"
+    # world space direction towards the light for SUN, position for POINT
+    vector: "tuple[float, float, float]"
+
+
+def get_bake_lights(objects: "typing.Iterable[bpy.types.Object]") -> "list[BakeLight]":
+    """Sun and point lights among the objects, other lights are ignored"""
+    lights = []
+    for object in objects:
+        if object.type != "LIGHT" or object.data.type not in {"SUN", "POINT"}:
+            continue
+        matrix_world = np.array(object.matrix_world, dtype=np.float32)
+        color = tuple(float(c) * object.data.energy for c in object.data.color)
+        if object.data.type == "SUN":
+            # lights point along their local -Z
+            direction = matrix_world[:3, 2]
+            direction /= np.linalg.norm(direction) or 1
+            lights.append(BakeLight("SUN", color, tuple(map(float, direction))))
+        else:
+            position = matrix_world[:3, 3]
+            lights.append(BakeLight("POINT", color, tuple(map(float, position))))
+    return lights
+
+
+def _bake_vertex_colors_job(
+    positions: "np.ndarray",
+    loop_vertex_indices: "np.ndarray",
+    loop_normals: "np.ndarray",
+    vertex_normals: "np.ndarray",
+    edges: "np.ndarray",
+    lights: "list[BakeLight]",
+    ambient_color: "tuple[float, float, float]",
+    ambient_occlusion: float,
+) -> "np.ndarray":
+    """Compute the RGBA color of each loop from world space mesh data"""
+    light = np.empty((len(loop_vertex_indices), 3), dtype=np.float32)
+    light[:] = ambient_color
+    loop_positions = positions[loop_vertex_indices]
+    for bake_light in lights:
+        if bake_light.type == "SUN":
+            n_dot_l = loop_normals @ np.array(bake_light.vector, dtype=np.float32)
+            light += np.maximum(n_dot_l, 0)[:, np.newaxis] * bake_light.color
+        else:
+            to_light = np.array(bake_light.vector, dtype=np.float32) - loop_positions
+            distances_squared = np.maximum((to_light * to_light).sum(axis=1), 1e-8)
+            n_dot_l = (loop_normals * to_light).sum(axis=1) / np.sqrt(distances_squared)
+            # the energy of point lights is in watts, spread over a sphere
+            light += (np.maximum(n_dot_l, 0) / (4 * np.pi * distances_squared))[
+                :, np.newaxis
+            ] * bake_light.color
+
+    if ambient_occlusion > 0 and len(edges):
+        # cavity approximation: neighbors above a vertex's tangent plane occlude it
+        a, b = edges[:, 0], edges[:, 1]
+        edge_vectors = positions[b] - positions[a]
+        edge_vectors /= np.maximum(np.linalg.norm(edge_vectors, axis=1), 1e-8)[
+            :, np.newaxis
+        ]
+        n_vertices = len(positions)
+        occlusion = np.bincount(
+            a,
+            np.maximum((vertex_normals[a] * edge_vectors).sum(axis=1), 0),
+            n_vertices,
+        ) + np.bincount(
+            b,
+            np.maximum(-(vertex_normals[b] * edge_vectors).sum(axis=1), 0),
+            n_vertices,
+        )
+        n_edges = np.bincount(a, minlength=n_vertices) + np.bincount(
+            b, minlength=n_vertices
+        )
+        occlusion /= np.maximum(n_edges, 1)
+        light *= (1 - ambient_occlusion * occlusion[loop_vertex_indices])[:, np.newaxis]
+
+    colors = np.ones((len(loop_vertex_indices), 4), dtype=np.float32)
+    colors[:, :3] = np.clip(light, 0, 1)
+    return colors
+
+
+def get_mesh_bake_inputs(object: bpy.types.Object) -> "tuple[np.ndarray, ...]":
+    """Read the world space mesh data _bake_vertex_colors_job needs"""
+    mesh: bpy.types.Mesh = object.data
+    n_vertices = len(mesh.vertices)
+    n_loops = len(mesh.loops)
+    n_polygons = len(mesh.polygons)
+
+    positions = np.empty(n_vertices * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", positions)
+    vertex_normals = np.empty(n_vertices * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("normal", vertex_normals)
+    loop_vertex_indices = np.empty(n_loops, dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertex_indices)
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    loop_starts = np.empty(n_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    loop_totals = np.empty(n_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    polygon_normals = np.empty(n_polygons * 3, dtype=np.float32)
+    mesh.polygons.foreach_get("normal", polygon_normals)
+    use_smooth = np.empty(n_polygons, dtype=bool)
+    mesh.polygons.foreach_get("use_smooth", use_smooth)
+
+    # to world space, normals with the inverse transpose
+    matrix_world = np.array(object.matrix_world, dtype=np.float32)
+    normal_matrix = np.linalg.inv(matrix_world[:3, :3]).T
+    positions = positions.reshape(-1, 3) @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+    vertex_normals = vertex_normals.reshape(-1, 3) @ normal_matrix.T
+    polygon_normals = polygon_normals.reshape(-1, 3) @ normal_matrix.T
+    for normals in (vertex_normals, polygon_normals):
+        normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-8)[:, np.newaxis]
+
+    # smooth faces use vertex normals, flat faces the face normal
+    order = np.argsort(loop_starts, kind="stable")
+    loop_polygons = np.repeat(order, loop_totals[order])
+    loop_normals = np.where(
+        use_smooth[loop_polygons][:, np.newaxis],
+        vertex_normals[loop_vertex_indices],
+        polygon_normals[loop_polygons],
+    )
+
+    return (
+        positions,
+        loop_vertex_indices,
+        loop_normals,
+        vertex_normals,
+        edges.reshape(-1, 2),
+    )
+
+
+def average_loop_colors_per_vertex(
+    mesh: bpy.types.Mesh, loop_colors: "np.ndarray"
+) -> "np.ndarray":
+    loop_vertex_indices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertex_indices)
+    n_vertices = len(mesh.vertices)
+    counts = np.maximum(np.bincount(loop_vertex_indices, minlength=n_vertices), 1)
+    return np.stack(
+        [
+            np.bincount(loop_vertex_indices, loop_colors[:, i], n_vertices) / counts
+            for i in range(4)
+        ],
+        axis=1,
+    ).astype(np.float32)
+
+
+def srgb_to_linear(colors: "np.ndarray") -> "np.ndarray":
+    """Convert RGBA colors from sRGB to scene linear, alpha is left as is"""
+    rgb = colors[:, :3]
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return np.concatenate((linear, colors[:, 3:]), axis=1).astype(np.float32)
+
+
+@profiled("bake_vertex_colors")
+def bake_vertex_colors(
+    objects: "typing.Iterable[bpy.types.Object]",
+    lights: "list[BakeLight]",
+    ambient_color=(0.25, 0.25, 0.25),
+    ambient_occlusion=0.5,
+    max_workers: "Optional[int]" = None,
+) -> int:
+    """Bake lighting into the active color layer of the meshes of objects, added
+    if they have none.
+
+    Meshes used by several objects are baked once, with the first object's
+    transform. Returns the number of baked meshes.
+    """
+    objects_by_mesh: "dict[str, bpy.types.Object]" = dict()
+    for object in objects:
+        if object.type == "MESH" and object.data is not None:
+            objects_by_mesh.setdefault(object.data.name, object)
+
+    futures: "dict[concurrent.futures.Future, bpy.types.Mesh]" = dict()
+    with concurrent.futures.ThreadPoolExecutor(
+        get_worker_count(max_workers), thread_name_prefix="SMH bake"
+    ) as executor:
+        for object in objects_by_mesh.values():
+            future = executor.submit(
+                _bake_vertex_colors_job,
+                *get_mesh_bake_inputs(object),
+                lights,
+                tuple(ambient_color),
+                ambient_occlusion,
+            )
+            futures[future] = object.data
+        for future in concurrent.futures.as_completed(futures):
+            mesh = futures[future]
+            provision_color_attributes((mesh,), init_white=False)
+            layer, domain = get_active_color_layer(mesh)
+            colors = future.result()
+            if domain == "POINT":
+                colors = average_loop_colors_per_vertex(mesh, colors)
+            if hasattr(layer, "data_type"):
+                # the bake is in sRGB like legacy vertex colors, which become the
+                # bytes of BYTE_COLOR attributes, while their "color" is linear
+                colors = srgb_to_linear(colors)
+            layer.data.foreach_set("color", colors.reshape(-1))
+            mesh.update()
+
+    return len(futures)
+
+
+class BakeVertexColorsOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_bake_vertex_colors"
+    bl_label = "Bake Vertex Color Lighting"
+    bl_description = (
+        "Bake ambient, sun and point light lighting into the active vertex colors "
+        "of the selected objects, which SMH materials multiply the image with"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    ambient_color: bpy.props.FloatVectorProperty(
+        name="Ambient Color",
+        subtype="COLOR",
+        size=3,
+        min=0,
+        max=1,
+        default=(0.25, 0.25, 0.25),
+    )
+    use_scene_lights: bpy.props.BoolProperty(
+        name="Scene Lights",
+        description="Add the lighting from the sun and point lights in the scene",
+        default=True,
+    )
+    ambient_occlusion: bpy.props.FloatProperty(
+        name="Ambient Occlusion",
+        description="How much concave areas are darkened, 0 to disable",
+        min=0,
+        max=1,
+        default=0.5,
+    )
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        lights = get_bake_lights(context.scene.objects) if self.use_scene_lights else []
+        count = bake_vertex_colors(
+            context.selected_objects,
+            lights,
+            self.ambient_color,
+            self.ambient_occlusion,
+        )
+        self.report({"INFO"}, f"Baked {count} mesh(es) with {len(lights)} light(s)")
+        return {"FINISHED"}
+
+
+# Texture atlases
+
+
+class MaxRectsPacker:
+    """Packs rectangles into a fixed size bin with the MaxRects algorithm,
+    placing each rectangle in the free space leaving the shortest side.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        # maximal free rectangles, as (x, y, width, height)
+        self.free_rects: "list[tuple[int, int, int, int]]" = [(0, 0, width, height)]
+
+    def insert(self, width: int, height: int) -> "Optional[tuple[int, int]]":
+        """Place a rectangle, returns its position or None if it doesn't fit"""
+        best_position = None
+        best_fit = None
+        for free_x, free_y, free_width, free_height in self.free_rects:
+            if width <= free_width and height <= free_height:
+                leftover = free_width - width, free_height - height
+                fit = min(leftover), max(leftover)
+                if best_fit is None or fit < best_fit:
+                    best_fit = fit
+                    best_position = free_x, free_y
+        if best_position is not None:
+            self._split_free_rects(*best_position, width, height)
+        return best_position
+
+    def _split_free_rects(self, x: int, y: int, width: int, height: int):
+        split_rects = []
+        for free_rect in self.free_rects:
+            free_x, free_y, free_width, free_height = free_rect
+            if (
+                x >= free_x + free_width
+                or x + width <= free_x
+                or y >= free_y + free_height
+                or y + height <= free_y
+            ):
+                split_rects.append(free_rect)
+                continue
+            # keep the maximal free rectangles around the placed one
+            if x > free_x:
+                split_rects.append((free_x, free_y, x - free_x, free_height))
+            if x + width < free_x + free_width:
+                split_rects.append(
+                    (x + width, free_y, free_x + free_width - x - width, free_height)
+                )
+            if y > free_y:
+                split_rects.append((free_x, free_y, free_width, y - free_y))
+            if y + height < free_y + free_height:
+                split_rects.append(
+                    (free_x, y + height, free_width, free_y + free_height - y - height)
+                )
+
+        def contains(a, b):
+            return (
+                a[0] <= b[0]
+                and a[1] <= b[1]
+                and a[0] + a[2] >= b[0] + b[2]
+                and a[1] + a[3] >= b[1] + b[3]
+            )
+
+        self.free_rects = [
+            rect
+            for i, rect in enumerate(split_rects)
+            if not any(
+                contains(other, rect) and (other != rect or j < i)
+                for j, other in enumerate(split_rects)
+                if j != i
+            )
+        ]
+
+
+def get_atlas_sizes(format: str) -> "list[tuple[int, int]]":
+    """Power of two atlas sizes fitting in TMEM, largest first"""
+    sizes = [
+        (1 << i, 1 << j)
+        for i in range(2, 11)
+        for j in range(2, 11)
+        if n64_texture_fits_tmem(1 << i, 1 << j, format)
+    ]
+    sizes.sort(key=lambda size: (-size[0] * size[1], abs(size[0] - size[1])))
+    return sizes
+
+
+class AtlasLayout(typing.NamedTuple):
+    width: int
+    height: int
+    # item key -> (x, y) position
+    positions: "dict[typing.Hashable, tuple[int, int]]"
+
+
+def _pack_into(
+    width: int, height: int, items: "list[tuple[typing.Hashable, int, int]]"
+):
+    packer = MaxRectsPacker(width, height)
+    positions = dict()
+    for key, item_width, item_height in items:
+        position = packer.insert(item_width, item_height)
+        if position is not None:
+            positions[key] = position
+    return positions
+
+
+def pack_atlases(
+    sizes: "dict[typing.Hashable, tuple[int, int]]", format: str
+) -> "tuple[list[AtlasLayout], list[typing.Hashable]]":
+    """Pack rectangles of the given sizes into as few atlases fitting in TMEM
+    as possible, each as small as possible.
+
+    Returns the atlases and the keys of the rectangles too large for any atlas.
+    """
+    atlas_sizes = get_atlas_sizes(format)
+    items = []
+    too_large = []
+    for key, (width, height) in sizes.items():
+        if any(width <= w and height <= h for w, h in atlas_sizes):
+            items.append((key, width, height))
+        else:
+            too_large.append(key)
+    # larger first packs tighter
+    items.sort(
+        key=lambda item: (max(item[1], item[2]), item[1] * item[2]), reverse=True
+    )
+    areas = {key: width * height for key, width, height in items}
+
+    layouts = []
+    while items:
+        best = None
+        for width, height in atlas_sizes:
+            positions = _pack_into(width, height, items)
+            packed_area = sum(areas[key] for key in positions)
+            # the most packed, then the smallest atlas
+            score = packed_area, -width * height
+            if positions and (best is None or score > best[0]):
+                best = score, AtlasLayout(width, height, positions)
+        layouts.append(best[1])
+        items = [item for item in items if item[0] not in best[1].positions]
+    return layouts, too_large
+
+
+def remap_atlas_uvs(
+    mesh: bpy.types.Mesh,
+    transforms: "dict[bpy.types.Material, tuple[tuple[float, float], tuple[float, float]]]",
+):
+    """Scale and offset the UVs of the faces using the materials, (u, v) becoming
+    (u * scale_u + offset_u, v * scale_v + offset_v) with (scale, offset) from
+    transforms.
+    """
+    uv_layer = mesh.uv_layers.active
+    n_polygons = len(mesh.polygons)
+    if uv_layer is None or n_polygons == 0:
+        return
+
+    material_indices = np.empty(n_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    loop_starts = np.empty(n_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    loop_totals = np.empty(n_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+
+    # (scale u, scale v, offset u, offset v) by material index
+    n_slots = max(len(mesh.materials), int(material_indices.max(initial=0)) + 1)
+    slot_transforms = np.tile(np.array((1, 1, 0, 0), dtype=np.float32), (n_slots, 1))
+    for mat, (scale, offset) in transforms.items():
+        for i in get_material_slot_indices(mat, mesh):
+            slot_transforms[i] = *scale, *offset
+
+    order = np.argsort(loop_starts, kind="stable")
+    loop_transforms = slot_transforms[
+        np.repeat(material_indices[order], loop_totals[order])
+    ]
+    uvs = np.empty(len(uv_layer.data) * 2, dtype=np.float32)
+    uv_layer.data.foreach_get("uv", uvs)
+    uvs = uvs.reshape(-1, 2) * loop_transforms[:, :2] + loop_transforms[:, 2:]
+    uv_layer.data.foreach_set("uv", uvs.reshape(-1))
+    UV_BOUNDS_CACHE.invalidate_mesh(mesh.name)
+
+
+def get_atlas_problem(mat: bpy.types.Material) -> "Optional[str]":
+    """Why the material can't be merged into an atlas, if it can't"""
+    props = mat.simple_material_helper  # type: MaterialProperties
+    if props.image is None or props.image.size[0] == 0 or props.image.size[1] == 0:
+        return "no image"
+    if props.uv_repeat_u != "CLAMP" or props.uv_repeat_v != "CLAMP":
+        return "UV repeat isn't Clamp"
+    uv_bounds = analyze_material_uvs(mat)
+    if uv_bounds is not None and (
+        min(uv_bounds.uv_min) < -UV_BOUNDS_EPSILON
+        or max(uv_bounds.uv_max) > 1 + UV_BOUNDS_EPSILON
+    ):
+        return "UVs go out of the texture"
+    return None
+
+
+class AtlasResult(typing.NamedTuple):
+    # merged material name -> atlas material
+    remap: "dict[str, bpy.types.Material]"
+    # material name -> why it wasn't merged (see get_atlas_problem)
+    skipped_materials: "dict[str, str]"
+    # names of the images too large for any atlas
+    too_large_images: "list[str]"
+
+
+@profiled("build_atlases")
+def build_atlases(
+    materials: "typing.Iterable[bpy.types.Material]",
+    format="RGBA16",
+    padding=0,
+) -> AtlasResult:
+    """Pack the images of the materials into atlases fitting in TMEM with format,
+    with one new SMH material per atlas, and make the users of the materials use
+    the atlas materials with remapped UVs.
+
+    Only materials with CLAMP UV repeats and UVs within the texture are merged,
+    and only with materials with the same transparency and backface culling
+    settings. Images are extended by padding pixels on each side to avoid
+    bleeding with filtering.
+    """
+    skipped_materials: "dict[str, str]" = dict()
+    groups: "dict[tuple, list[bpy.types.Material]]" = dict()
+    for mat in materials:
+        problem = get_atlas_problem(mat)
+        if problem is not None:
+            skipped_materials[mat.name] = problem
+            continue
+        props = mat.simple_material_helper  # type: MaterialProperties
+        key = (
+            props.use_transparency,
+            props.use_blend_transparency,
+            mat.use_backface_culling,
+        )
+        groups.setdefault(key, []).append(mat)
+
+    remap: "dict[str, bpy.types.Material]" = dict()
+    transforms: "dict[bpy.types.Material, tuple]" = dict()
+    too_large_images: "list[str]" = []
+    for group in groups.values():
+        images = {
+            mat.simple_material_helper.image.name: mat.simple_material_helper.image
+            for mat in group
+        }
+        layouts, too_large = pack_atlases(
+            {
+                image.name: (image.size[0] + 2 * padding, image.size[1] + 2 * padding)
+                for image in images.values()
+            },
+            format,
+        )
+        too_large_images += too_large
+        for mat in group:
+            if mat.simple_material_helper.image.name in too_large:
+                skipped_materials[mat.name] = "image too large for an atlas"
+        for layout in layouts:
+            atlas_materials = [
+                mat
+                for mat in group
+                if mat.simple_material_helper.image.name in layout.positions
+            ]
+            if len(atlas_materials) < 2:
+                continue
+
+            pixels = np.zeros((layout.height, layout.width, 4), dtype=np.float32)
+            for image_name, (x, y) in layout.positions.items():
+                image = images[image_name]
+                width, height = image.size
+                image_pixels = get_image_pixels(image).reshape(height, width, 4)
+                if padding:
+                    image_pixels = np.pad(
+                        image_pixels,
+                        ((padding, padding), (padding, padding), (0, 0)),
+                        mode="edge",
+                    )
+                pixels[y : y + height + 2 * padding, x : x + width + 2 * padding] = (
+                    image_pixels
+                )
+
+            atlas_image = bpy.data.images.new(
+                "SMH Atlas", layout.width, layout.height, alpha=True
+            )
+            atlas_image.pixels.foreach_set(pixels.reshape(-1))
+            # generated images aren't saved otherwise
+            atlas_image.pack()
+
+            atlas_mat = bpy.data.materials.new("SMH Atlas")
+            atlas_props = atlas_mat.simple_material_helper  # type: MaterialProperties
+            first_props = atlas_materials[0].simple_material_helper
+            PROPAGATION_STATE.active = True
+            try:
+                atlas_props.image = atlas_image
+                atlas_props.uv_repeat_u = "CLAMP"
+                atlas_props.uv_repeat_v = "CLAMP"
+                atlas_props.use_transparency = first_props.use_transparency
+                atlas_props.use_blend_transparency = first_props.use_blend_transparency
+            finally:
+                PROPAGATION_STATE.active = False
+            set_simple_material_transparency(atlas_mat, atlas_props)
+            atlas_mat.use_backface_culling = atlas_materials[0].use_backface_culling
+
+            for mat in atlas_materials:
+                image = mat.simple_material_helper.image
+                x, y = layout.positions[image.name]
+                transforms[mat] = (
+                    (image.size[0] / layout.width, image.size[1] / layout.height),
+                    ((x + padding) / layout.width, (y + padding) / layout.height),
+                )
+                remap[mat.name] = atlas_mat
+
+    meshes: "dict[str, bpy.types.Mesh]" = dict()
+    for mat in transforms:
+        for mesh in MATERIAL_USERS_INDEX.get_meshes(mat):
+            meshes[mesh.name] = mesh
+    for mesh in meshes.values():
+        remap_atlas_uvs(mesh, transforms)
+    remap_materials(remap)
+
+    set_simple_materials(set(remap.values()))
+    return AtlasResult(remap, skipped_materials, too_large_images)
+
+
+class AtlasOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_atlas"
+    bl_label = "Pack SMH Textures Into Atlases"
+    bl_description = (
+        "Merge the Simple Material Helper materials of the selected objects with "
+        "Clamp UV repeats into as few materials as possible, with their images "
+        "packed into atlases fitting in TMEM"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    format: bpy.props.EnumProperty(
+        items=[(format, format, "") for format in N64_TEXTURE_FORMAT_BITS],
+        name="Format",
+        description="N64 texture format the atlases must fit in TMEM with",
+        default="RGBA16",
+    )
+    padding: bpy.props.IntProperty(
+        name="Padding",
+        description="Pixels to extend each image by, against bleeding with filtering",
+        min=0,
+        max=4,
+        default=0,
+    )
+    remove_merged: bpy.props.BoolProperty(
+        name="Remove Merged",
+        description="Delete the merged materials once unused",
+        default=True,
+    )
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        materials = get_simple_materials_in_objects(context.selected_objects)
+        result = build_atlases(materials, self.format, self.padding)
+        remap = result.remap
+
+        if self.remove_merged:
+            for mat_name in remap:
+                mat = bpy.data.materials.get(mat_name)
+                if mat is not None and mat.users - int(mat.use_fake_user) == 0:
+                    bpy.data.materials.remove(mat)
+
+        for mat_name, problem in result.skipped_materials.items():
+            self.report({"INFO"}, f"Not merging {mat_name}: {problem}")
+        if result.too_large_images:
+            self.report(
+                {"WARNING"},
+                f"Image(s) too large for a {self.format} atlas: "
+                + ", ".join(result.too_large_images),
+            )
+        self.report(
+            {"INFO"},
+            f"Merged {len(remap)} material(s) into "
+            f"{len(set(remap.values()))} atlas material(s), "
+            f"skipped {len(result.skipped_materials)}",
+        )
+        return {"FINISHED"}
+
+
+# Face ordering by material
+
+TRANSPARENCY_RANKS = {
+    "OPAQUE": 0,
+    "CLIP": 1,
+    "HASHED": 1,
+    "BLEND": 2,
+}
+
+
+def get_transparency_rank(mat: "Optional[bpy.types.Material]") -> int:
+    """Opaque materials first, then alpha clip, then blend"""
+    if mat is None:
+        return 0
+    if is_simple_material(mat):
+        props = mat.simple_material_helper  # type: MaterialProperties
+        if not props.use_transparency:
+            return 0
+        return 2 if props.use_blend_transparency else 1
+    return TRANSPARENCY_RANKS.get(mat.blend_method, 0)
+
+
+def get_slot_groups(object: bpy.types.Object) -> "np.ndarray":
+    """The draw group of each material slot: slots with the same material are in
+    the same group, and groups are numbered in transparency order.
+    """
+    groups: "dict[str, tuple[int, int]]" = dict()
+    slot_group_keys = []
+    for i, material_slot in enumerate(object.material_slots):
+        mat = material_slot.material
+        key = mat.name if mat is not None else f"slot {i}"
+        if key not in groups:
+            groups[key] = get_transparency_rank(mat), i
+        slot_group_keys.append(key)
+    group_ids = {key: i for i, key in enumerate(sorted(groups, key=groups.get))}
+    return np.array([group_ids[key] for key in slot_group_keys] or [0], dtype=np.int32)
+
+
+def count_material_switches(face_groups: "np.ndarray") -> int:
+    return int(np.count_nonzero(face_groups[1:] != face_groups[:-1]))
+
+
+def get_face_groups(object: bpy.types.Object) -> "np.ndarray":
+    mesh: bpy.types.Mesh = object.data
+    material_indices = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_indices)
+    slot_groups = get_slot_groups(object)
+    return slot_groups[np.clip(material_indices, 0, len(slot_groups) - 1)]
+
+
+def sort_mesh_faces(mesh: bpy.types.Mesh, order: "np.ndarray"):
+    """Reorder the faces of the mesh, order[i] being the index of the face to
+    put at i
+    """
+    ranks = np.empty_like(order)
+    ranks[order] = np.arange(len(order), dtype=order.dtype)
+
+    bm = bmesh.new()
+    try:
+        bm.from_mesh(mesh)
+        bm.faces.ensure_lookup_table()
+        for face, rank in zip(bm.faces, ranks.tolist()):
+            face.index = rank
+        bm.faces.sort()
+        bm.to_mesh(mesh)
+    finally:
+        bm.free()
+    mesh.update()
+
+
+@profiled("sort_faces_by_material")
+def sort_faces_by_material(
+    objects: "typing.Iterable[bpy.types.Object]",
+) -> "tuple[int, int]":
+    """Make the faces of the objects' meshes using the same material contiguous,
+    opaque materials first, then alpha clip, then blend.
+
+    Meshes used by several objects are sorted for the first one's materials.
+    Returns the number of material switches between consecutive faces before
+    and after.
+    """
+    objects_by_mesh: "dict[str, bpy.types.Object]" = dict()
+    for object in objects:
+        if object.type == "MESH" and object.data is not None:
+            objects_by_mesh.setdefault(object.data.name, object)
+
+    switches_before = 0
+    switches_after = 0
+    for object in objects_by_mesh.values():
+        face_groups = get_face_groups(object)
+        # stable, to keep the order of faces within a group
+        order = np.argsort(face_groups, kind="stable")
+        switches_before += count_material_switches(face_groups)
+        switches_after += count_material_switches(face_groups[order])
+        if np.any(order != np.arange(len(order))):
+            sort_mesh_faces(object.data, order)
+            UV_BOUNDS_CACHE.invalidate_mesh(object.data.name)
+    return switches_before, switches_after
+
+
+class SortFacesOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_sort_faces"
+    bl_label = "Sort Faces By Material"
+    bl_description = (
+        "Reorder the faces of the selected objects so faces using the same material "
+        "are drawn together, opaque materials first, then alpha clip, then blend"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    join_objects: bpy.props.BoolProperty(
+        name="Join Objects",
+        description="Join the selected objects into the active one first",
+        default=False,
+    )
+
+    def execute(self, context):
+        if context.mode != "OBJECT":
+            self.report({"ERROR"}, "Faces can only be sorted in Object Mode")
+            return {"CANCELLED"}
+
+        if self.join_objects:
+            mesh_objects = [
+                object for object in context.selected_objects if object.type == "MESH"
+            ]
+            if len(mesh_objects) > 1 and context.active_object in mesh_objects:
+                bpy.ops.object.join()
+
+        switches_before, switches_after = sort_faces_by_material(
+            context.selected_objects
+        )
+        self.report(
+            {"INFO"},
+            f"Material switches: {switches_before} before, {switches_after} after",
+        )
+        return {"FINISHED"}
+
+
+# Image deduplication
+
+
+def get_image_dedupe_key(image: bpy.types.Image) -> tuple:
+    """Images with equal keys have the same contents and settings"""
+    file_hash = get_image_file_hash(image)
+    if file_hash is not None:
+        content_key = "FILE", file_hash
+    else:
+        content_key = "PIXELS", get_image_content_hash(image)
+    return (
+        content_key,
+        tuple(image.size),
+        image.colorspace_settings.name,
+        image.alpha_mode,
+    )
+
+
+def find_duplicate_images(
+    images: "typing.Iterable[bpy.types.Image]",
+) -> "list[list[bpy.types.Image]]":
+    """Group images with the same contents and settings, only returning groups
+    of two or more images. The first image of each group is the one to keep:
+    preferably not packed, with the shortest name.
+    """
+    groups: "dict[tuple, list[bpy.types.Image]]" = dict()
+    for image in images:
+        if image.size[0] == 0 or image.size[1] == 0:
+            continue
+        groups.setdefault(get_image_dedupe_key(image), []).append(image)
+    return [
+        sorted(
+            group,
+            key=lambda image: (
+                image.packed_file is not None,
+                len(image.name),
+                image.name,
+            ),
+        )
+        for group in groups.values()
+        if len(group) > 1
+    ]
+
+
+@profiled("dedupe_images")
+def dedupe_images(dry_run=False) -> "list[list[bpy.types.Image]]":
+    """Make SMH materials use a single image for each group of images with the
+    same contents, see find_duplicate_images. Returns the groups.
+
+    Materials linked from libraries keep their images.
+    """
+    materials = [
+        mat
+        for mat in bpy.data.materials
+        if is_editable(mat) and mat.simple_material_helper.image is not None
+    ]
+    images = {
+        mat.simple_material_helper.image.name: mat.simple_material_helper.image
+        for mat in materials
+    }
+    groups = find_duplicate_images(images.values())
+    if dry_run:
+        return groups
+
+    remap = {image.name: group[0] for group in groups for image in group[1:]}
+    changed_materials = []
+    PROPAGATION_STATE.active = True
+    try:
+        for mat in materials:
+            props = mat.simple_material_helper  # type: MaterialProperties
+            canonical_image = remap.get(props.image.name)
+            if canonical_image is not None:
+                props.image = canonical_image
+                changed_materials.append(mat)
+    finally:
+        PROPAGATION_STATE.active = False
+
+    # also points the image texture nodes to the kept images
+    set_simple_materials(changed_materials)
+    return groups
+
+
+class DedupeImagesOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_dedupe_images"
+    bl_label = "Merge Duplicate Images"
+    bl_description = (
+        "Make Simple Material Helper materials use a single image for each group "
+        "of images with the same contents (file, packed data or pixels)"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    dry_run: bpy.props.BoolProperty(
+        name="Dry Run",
+        description="Only report the duplicate images, without merging them",
+        default=False,
+    )
+    remove_duplicates: bpy.props.BoolProperty(
+        name="Remove Duplicates",
+        description="Delete the merged images once unused",
+        default=True,
+    )
+
+    def execute(self, context):
+        groups = dedupe_images(self.dry_run)
+        n_duplicates = sum(len(group) - 1 for group in groups)
+
+        verb = "Would merge" if self.dry_run else "Merging"
+        for group in groups:
+            names = ", ".join(image.name for image in group[1:])
+            self.report({"INFO"}, f"{verb} {names} into {group[0].name}")
+
+        if self.dry_run:
+            self.report(
+                {"INFO"},
+                f"{n_duplicates} image(s) can be merged into {len(groups)} image(s)",
+            )
+            return {"FINISHED"}
+
+        n_removed = 0
+        if self.remove_duplicates:
+            for group in groups:
+                for image in group[1:]:
+                    if image.users - int(image.use_fake_user) == 0:
+                        bpy.data.images.remove(image)
+                        n_removed += 1
+
+        self.report(
+            {"INFO"},
+            f"Merged {n_duplicates} image(s) into {len(groups)} image(s), "
+            f"removed {n_removed}",
+        )
+        return {"FINISHED"}
+
+
+# Material library import
+
+MATERIAL_IMPORT_IMAGE_EXTENSIONS = {".png", ".bmp", ".tga", ".jpg", ".jpeg"}
+
+MATERIAL_IMPORT_UV_REPEATS = ("WRAP", "MIRROR", "CLAMP")
+
+# transparency mode (as Material.blend_method) -> (use_transparency,
+#                                                  use_blend_transparency)
+MATERIAL_IMPORT_TRANSPARENCIES = {
+    "OPAQUE": (False, False),
+    "CLIP": (True, False),
+    "HASHED": (True, False),
+    "BLEND": (True, True),
+}
+
+
+class ImageHeader(typing.NamedTuple):
+    format: str
+    width: int
+    height: int
+
+
+def read_image_header(path: Path) -> "Optional[ImageHeader]":
+    """Read the format and size of an image file from its header,
+    None if it isn't a supported image file.
+    """
+    with path.open("rb") as f:
+        header = f.read(32)
+        if (
+            header[:8] == b"\x89PNG\r\n\x1a\n"
+            and header[12:16] == b"IHDR"
+            and len(header) >= 24
+        ):
+            width, height = np.frombuffer(header[16:24], dtype=">u4").tolist()
+            return ImageHeader("PNG", width, height)
+        if header[:2] == b"BM" and len(header) >= 26:
+            width, height = np.frombuffer(header[18:26], dtype="<i4").tolist()
+            return ImageHeader("BMP", width, abs(height))
+        if header[:3] == b"\xff\xd8\xff":
+            # the size is in the start of frame segment
+            f.seek(2)
+            while True:
+                marker = f.read(4)
+                if len(marker) < 4 or marker[0] != 0xFF:
+                    return None
+                length = int.from_bytes(marker[2:4], "big")
+                if length < 2:
+                    return None
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in {0xC4, 0xC8, 0xCC}:
+                    data = f.read(5)
+                    if len(data) < 5:
+                        return None
+                    height, width = np.frombuffer(data[1:5], dtype=">u2").tolist()
+                    return ImageHeader("JPEG", width, height)
+                f.seek(length - 2, 1)
+        if path.suffix.lower() == ".tga" and len(header) >= 18:
+            # TGA has no signature, check the image type
+            if header[2] not in {1, 2, 3, 9, 10, 11}:
+                return None
+            width, height = np.frombuffer(header[12:16], dtype="<u2").tolist()
+            return ImageHeader("TGA", width, height)
+    return None
+
+
+class MaterialImportEntry(typing.NamedTuple):
+    name: str
+    image_path: Path
+    uv_repeat_u: str = "WRAP"
+    uv_repeat_v: str = "WRAP"
+    # see MATERIAL_IMPORT_TRANSPARENCIES
+    transparency: str = "OPAQUE"
+
+
+def _parse_material_import_entry(data: dict, base_directory: Path):
+    image_path = data.get("image_path") or data.get("image")
+    if not image_path:
+        return None
+    image_path = base_directory / image_path
+    entry = MaterialImportEntry(
+        name=data.get("name") or image_path.stem,
+        image_path=image_path,
+        uv_repeat_u=(data.get("uv_repeat_u") or "WRAP").upper(),
+        uv_repeat_v=(data.get("uv_repeat_v") or "WRAP").upper(),
+        transparency=(data.get("transparency") or "OPAQUE").upper(),
+    )
+    for value, allowed in (
+        (entry.uv_repeat_u, MATERIAL_IMPORT_UV_REPEATS),
+        (entry.uv_repeat_v, MATERIAL_IMPORT_UV_REPEATS),
+        (entry.transparency, MATERIAL_IMPORT_TRANSPARENCIES),
+    ):
+        if value not in allowed:
+            raise ValueError(
+                f"{entry.name}: {value!r} isn't one of {', '.join(allowed)}"
+            )
+    return entry
+
+
+def get_material_import_entries(
+    path: Path,
+    recursive=False,
+    file_names: "Optional[typing.Iterable[str]]" = None,
+) -> "list[MaterialImportEntry]":
+    """Get the materials to import from a directory (one per image file, with
+    default settings, only those in file_names if given) or a manifest.
+
+    Manifests are JSON (a list of objects, or an object with a "materials" list),
+    JSON lines as written by export_material_manifest, or CSV with a header row.
+    Objects and rows have the keys image_path (or image, relative to the manifest),
+    and optionally name, uv_repeat_u, uv_repeat_v and transparency.
+    """
+    if path.is_dir():
+        if file_names is not None:
+            image_paths = (path / file_name for file_name in file_names)
+        elif recursive:
+            image_paths = path.rglob("*")
+        else:
+            image_paths = path.iterdir()
+        return [
+            MaterialImportEntry(image_path.stem, image_path)
+            for image_path in sorted(image_paths)
+            if image_path.suffix.lower() in MATERIAL_IMPORT_IMAGE_EXTENSIONS
+            and image_path.is_file()
+        ]
+
+    with path.open(encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(f))
+        elif path.suffix.lower() == ".jsonl":
+            rows = [json.loads(line) for line in f if line.strip()]
+            # skip the header line
+            rows = [row for row in rows if "version" not in row]
+        else:
+            rows = json.load(f)
+            if isinstance(rows, dict):
+                rows = rows["materials"]
+    entries = (_parse_material_import_entry(row, path.parent) for row in rows)
+    return [entry for entry in entries if entry is not None]
+
+
+def _scan_import_image_job(path: Path):
+    """Validate the header of an image file and hash it, runs in a thread"""
+    try:
+        header = read_image_header(path)
+        if header is None:
+            return None, None, "not a supported image file"
+        if header.width == 0 or header.height == 0:
+            return None, None, "empty image"
+        return header, hash_file(path), None
+    except OSError as e:
+        return None, None, e.strerror or str(e)
+
+
+class MaterialImportResult(typing.NamedTuple):
+    materials: "list[bpy.types.Material]"
+    images_loaded: int
+    images_reused: int
+    # (image path, reason)
+    skipped: "list[tuple[str, str]]"
+
+
+@profiled("import_materials")
+def import_materials(
+    path,
+    recursive=False,
+    max_workers: "Optional[int]" = None,
+    window_manager: "Optional[bpy.types.WindowManager]" = None,
+    file_names: "Optional[typing.Iterable[str]]" = None,
+) -> MaterialImportResult:
+    """Create or update SMH materials from a directory of images (or only the
+    image files in it named in file_names) or a manifest,
+    see get_material_import_entries.
+
+    Image files are validated and hashed in a thread pool, and each distinct
+    image is loaded once, reusing images already in the file with the same
+    contents. Materials with the name of an entry are updated instead of created.
+    """
+    path = Path(bpy.path.abspath(str(path)))
+    entries = get_material_import_entries(path, recursive, file_names)
+
+    image_paths = list(dict.fromkeys(entry.image_path.resolve() for entry in entries))
+    images_by_hash: "dict[str, bpy.types.Image]" = dict()
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers, thread_name_prefix="SMH import"
+    ) as executor:
+        scan_results = executor.map(_scan_import_image_job, image_paths)
+
+        # hash the images already in the file meanwhile (see get_image_file_hash),
+        # as (image, known hash or future, file stat to cache the hash with)
+        existing_hashes = []
+        for image in bpy.data.images:
+            if image.packed_file is not None:
+                future = executor.submit(hash_bytes, image.packed_file.data)
+                existing_hashes.append((image, future, None))
+                continue
+            file_stat = get_image_file_stat(image)
+            if file_stat is None:
+                continue
+            read_image_cache(image)
+            file_hash = get_cached_file_hash(*file_stat)
+            if file_hash is not None:
+                existing_hashes.append((image, file_hash, None))
+            else:
+                future = executor.submit(hash_file, file_stat[0])
+                existing_hashes.append((image, future, file_stat))
+        for image, file_hash, file_stat in existing_hashes:
+            if isinstance(file_hash, concurrent.futures.Future):
+                file_hash = file_hash.result()
+                if file_stat is not None:
+                    set_cached_file_hash(*file_stat, file_hash)
+            images_by_hash.setdefault(file_hash, image)
+
+        scans = dict(zip(image_paths, scan_results))
+
+    images_loaded = 0
+    images_reused = 0
+    skipped = []
+    materials: "dict[str, bpy.types.Material]" = dict()
+    PROPAGATION_STATE.active = True
+    try:
+        for entry in entries:
+            header, file_hash, problem = scans[entry.image_path.resolve()]
+            if problem is not None:
+                skipped.append((str(entry.image_path), problem))
+                continue
+            image = images_by_hash.get(file_hash)
+            if image is None:
+                image = bpy.data.images.load(str(entry.image_path), check_existing=True)
+                images_by_hash[file_hash] = image
+                images_loaded += 1
+            else:
+                images_reused += 1
+
+            mat = bpy.data.materials.get(entry.name)
+            if mat is None:
+                mat = bpy.data.materials.new(entry.name)
+            props = mat.simple_material_helper  # type: MaterialProperties
+            use_transparency, use_blend_transparency = MATERIAL_IMPORT_TRANSPARENCIES[
+                entry.transparency
+            ]
+            for prop_name, value in (
+                ("image", image),
+                ("uv_repeat_u", entry.uv_repeat_u),
+                ("uv_repeat_v", entry.uv_repeat_v),
+                ("use_transparency", use_transparency),
+                ("use_blend_transparency", use_blend_transparency),
+            ):
+                if getattr(props, prop_name) != value:
+                    setattr(props, prop_name, value)
+            materials[mat.name] = mat
+    finally:
+        PROPAGATION_STATE.active = False
+
+    # the graph of each material is built once, with all its settings
+    set_simple_materials(materials.values(), window_manager)
+    for mat in materials.values():
+        set_simple_material_transparency(mat, mat.simple_material_helper)
+
+    if PROFILER.enabled:
+        PROFILER.count("import entries", len(entries))
+
+    return MaterialImportResult(
+        list(materials.values()), images_loaded, images_reused, skipped
+    )
+
+
+class ImportMaterialsOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_import_materials"
+    bl_label = "Import Materials"
+    bl_description = (
+        "Create Simple Material Helper materials for the selected images, all the "
+        "images of the directory if none is selected, or from a JSON, JSON lines "
+        "or CSV manifest"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    filepath: bpy.props.StringProperty(subtype="FILE_PATH")
+    directory: bpy.props.StringProperty(subtype="DIR_PATH")
+    files: bpy.props.CollectionProperty(
+        type=bpy.types.OperatorFileListElement,
+        options={"HIDDEN", "SKIP_SAVE"},
+    )
+    filter_glob: bpy.props.StringProperty(
+        default="*.json;*.jsonl;*.csv;*.png;*.bmp;*.tga;*.jpg;*.jpeg",
+        options={"HIDDEN"},
+    )
+    recursive: bpy.props.BoolProperty(
+        name="Include Subdirectories",
+        description=(
+            "When importing a directory without selecting images, also import "
+            "images in subdirectories"
+        ),
+        default=False,
     )
 
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        # with a manifest selected import it, otherwise import the selected
+        # images, or the whole directory if none is selected
+        path = Path(bpy.path.abspath(self.filepath))
+        file_names = None
+        if path.suffix.lower() not in {".json", ".jsonl", ".csv"}:
+            path = Path(bpy.path.abspath(self.directory))
+            file_names = [file.name for file in self.files if file.name] or None
+        try:
+            result = import_materials(
+                path,
+                self.recursive,
+                window_manager=context.window_manager,
+                file_names=file_names,
+            )
+        except (OSError, ValueError, KeyError) as e:
+            self.report({"ERROR"}, f"Could not import {path}: {e}")
+            return {"CANCELLED"}
+        for image_path, problem in result.skipped:
+            self.report({"INFO"}, f"Skipped {image_path}: {problem}")
+        self.report(
+            {"WARNING"} if result.skipped else {"INFO"},
+            f"Imported {len(result.materials)} material(s), "
+            f"{result.images_loaded} image(s) loaded, "
+            f"{result.images_reused} reused, {len(result.skipped)} skipped",
+        )
+        return {"FINISHED"}
 
-class MaterialNodes:
-    shader_node: bpy.types.ShaderNodeBsdfPrincipled
-    image: bpy.types.ShaderNodeTexImage
-    uv_repeat_type_u: bpy.types.ShaderNodeValue
-    uv_repeat_type_v: bpy.types.ShaderNodeValue
 
+# Validation
 
-def ensure_setup_and_get_nodes(material: bpy.types.Material):
-    node_tree = material.node_tree
 
-    # ensure vertex colors data exists
+class ValidationIssue(typing.NamedTuple):
+    # "MATERIAL", "MESH", "OBJECT" or "IMAGE"
+    kind: str
+    # name of the datablock
+    name: str
+    code: str
+    message: str
 
-    for mesh in bpy.data.meshes:
-        mesh: bpy.types.Mesh
-        if material in mesh.materials.values():
-            if mesh.vertex_colors.active is None:
-                mesh.vertex_colors.new(do_init=False)
 
-    for object in bpy.data.objects:
-        object: bpy.types.Object
-        if object.type == "MESH" and material in (
-            material_slot.material for material_slot in object.material_slots.values()
-        ):
-            if object.data.vertex_colors.active is None:
-                object.data.vertex_colors.new(do_init=False)
+def is_power_of_two(n: int):
+    return n > 0 and n & (n - 1) == 0
 
-    # output node
 
-    output_node_name = "SMH Output Material"
-    output_node = node_tree.nodes.get(output_node_name)
-    if output_node is None:
-        output_node = node_tree.nodes.new("ShaderNodeOutputMaterial")
-        output_node.name = output_node_name
-        output_node.location = -200, 0
+def get_material_stale_node_count(mat: bpy.types.Material) -> int:
+    """Count what set_simple_material would change in the material's nodes"""
+    props = mat.simple_material_helper  # type: MaterialProperties
+    node_specs, link_specs = get_material_graph_spec(
+        props.image is not None,
+        props.uv_repeat_u,
+        props.uv_repeat_v,
+        CONFIG.use_specialized_uv_nodes,
+        has_uv_scroll(props),
+    )
+    differences = reconcile_node_tree(
+        mat.node_tree, node_specs, link_specs, dry_run=True
+    ).differences
+    image_node = mat.node_tree.nodes.get("SMH Image Texture")
+    # the preview image isn't checked, getting it may generate it
+    if (
+        image_node is not None
+        and not props.preview_quantized
+        and image_node.image != props.image
+    ):
+        differences += 1
+    uv_repeat_node = mat.node_tree.nodes.get("SMH UV Repeat")
+    if uv_repeat_node is not None and uv_repeat_node.bl_idname == "ShaderNodeGroup":
+        for socket_name, uv_repeat in (
+            ("Repeat U", props.uv_repeat_u),
+            ("Repeat V", props.uv_repeat_v),
+        ):
+            socket = uv_repeat_node.inputs.get(socket_name)
+            if (
+                socket is not None
+                and socket.default_value != SMH_UV_REPEAT_VALUES[uv_repeat]
+            ):
+                differences += 1
+    return differences
+
+
+def check_material(mat: bpy.types.Material) -> "list[ValidationIssue]":
+    if not is_simple_material(mat):
+        return []
+    issues = []
+    if has_legacy_graph(mat):
+        issues.append(
+            ValidationIssue(
+                "MATERIAL", mat.name, "LEGACY_GRAPH", "Uses legacy UV repeat nodes"
+            )
+        )
+    elif (
+        mat.node_tree is None or mat.node_tree.nodes.get("SMH Output Material") is None
+    ):
+        issues.append(
+            ValidationIssue("MATERIAL", mat.name, "NOT_SET_UP", "Nodes not set up")
+        )
+    elif get_material_stale_node_count(mat):
+        issues.append(
+            ValidationIssue("MATERIAL", mat.name, "STALE_NODES", "Nodes out of date")
+        )
+    return issues
+
+
+def check_mesh(mesh: bpy.types.Mesh) -> "list[ValidationIssue]":
+    if not has_color_attribute(mesh) and any(
+        mat is not None and is_simple_material(mat) for mat in mesh.materials
+    ):
+        return [
+            ValidationIssue("MESH", mesh.name, "NO_VERTEX_COLORS", "No vertex colors")
+        ]
+    return []
+
+
+def check_object(object: bpy.types.Object) -> "list[ValidationIssue]":
+    # materials of the mesh itself are checked with the mesh
+    if object.type != "MESH" or object.data is None:
+        return []
+    if not has_color_attribute(object.data) and any(
+        material_slot.link == "OBJECT"
+        and material_slot.material is not None
+        and is_simple_material(material_slot.material)
+        for material_slot in object.material_slots
+    ):
+        return [
+            ValidationIssue(
+                "OBJECT", object.name, "NO_VERTEX_COLORS", "No vertex colors on mesh"
+            )
+        ]
+    return []
+
+
+def get_image_tmem_format(image: bpy.types.Image) -> str:
+    """The format to check the image against TMEM with, the best one if the image
+    was analyzed, otherwise RGBA16
+    """
+    analysis = TEXTURE_ANALYZER.get(image)
+    if analysis is not None:
+        return analysis.best_near_lossless_format
+    return "RGBA16"
+
+
+def check_image(image: bpy.types.Image) -> "list[ValidationIssue]":
+    width, height = image.size
+    if width == 0 or height == 0:
+        return []
+    issues = []
+    if not is_power_of_two(width) or not is_power_of_two(height):
+        issues.append(
+            ValidationIssue(
+                "IMAGE",
+                image.name,
+                "NOT_POWER_OF_TWO",
+                f"Size {width}x{height} isn't a power of two",
+            )
+        )
+    format = get_image_tmem_format(image)
+    if not n64_texture_fits_tmem(width, height, format):
+        issues.append(
+            ValidationIssue(
+                "IMAGE", image.name, "TOO_BIG_FOR_TMEM", f"Too big for TMEM as {format}"
+            )
+        )
+    return issues
+
+
+class ValidationIndex:
+    """Issues of the datablocks of the file, kept up to date incrementally.
+
+    Everything is checked once the panel is first shown (again after loading a
+    file or undoing), then only the datablocks reported changed by depsgraph
+    updates are checked again. Checks run from a timer, a few milliseconds at a
+    time, so the UI never waits on them.
+    """
+
+    TIME_BUDGET = 0.005
+    INTERVAL = 0.05
+
+    def __init__(self):
+        self.valid = False
+        # set when issues are added, changed or removed, cleared on redraw
+        self.issues_changed = False
+        # (kind, name) -> issues
+        self._issues: "dict[tuple[str, str], list[ValidationIssue]]" = dict()
+        self._dirty: "set[tuple[str, str]]" = set()
+        # image name -> names of the SMH materials using it, as of their last check
+        self._image_users: "dict[str, set[str]]" = dict()
+
+    def invalidate(self):
+        """Forget all issues, the panel requests checking again when drawn"""
+        self.cancel()
+        tag_redraw_properties()
+
+    def cancel(self):
+        self.valid = False
+        self._issues.clear()
+        self._dirty.clear()
+        self._image_users.clear()
+        if bpy.app.timers.is_registered(on_validation_timer):
+            bpy.app.timers.unregister(on_validation_timer)
+
+    def request(self):
+        """Schedule checking everything, if not done yet"""
+        if not self.valid:
+            self._schedule()
+
+    def _schedule(self):
+        if not bpy.app.timers.is_registered(on_validation_timer):
+            bpy.app.timers.register(on_validation_timer, first_interval=self.INTERVAL)
+
+    def mark_dirty(self, id: bpy.types.ID):
+        if not self.valid:
+            return
+        if isinstance(id, bpy.types.Material):
+            self._dirty.add(("MATERIAL", id.name))
+        elif isinstance(id, bpy.types.Mesh):
+            self._dirty.add(("MESH", id.name))
+        elif isinstance(id, bpy.types.Object):
+            self._dirty.add(("OBJECT", id.name))
+            if id.type == "MESH" and id.data is not None:
+                self._dirty.add(("MESH", id.data.name))
+        elif isinstance(id, bpy.types.Image):
+            self._dirty.add(("IMAGE", id.name))
+        else:
+            return
+        self._schedule()
+
+    def _rebuild(self):
+        self._issues.clear()
+        self._image_users.clear()
+        self._dirty = {
+            (kind, id.name)
+            for kind, id_collection in (
+                ("MATERIAL", bpy.data.materials),
+                ("MESH", bpy.data.meshes),
+                ("OBJECT", bpy.data.objects),
+            )
+            for id in id_collection
+        }
+        self.valid = True
+
+    def _check(self, kind: str, name: str):
+        if kind == "MATERIAL":
+            mat = bpy.data.materials.get(name)
+            for material_names in self._image_users.values():
+                material_names.discard(name)
+            if mat is None:
+                return []
+            image = mat.simple_material_helper.image
+            if image is not None and is_simple_material(mat):
+                self._image_users.setdefault(image.name, set()).add(name)
+                self._dirty.add(("IMAGE", image.name))
+            return check_material(mat)
+        if kind == "MESH":
+            mesh = bpy.data.meshes.get(name)
+            return check_mesh(mesh) if mesh is not None else []
+        if kind == "OBJECT":
+            object = bpy.data.objects.get(name)
+            return check_object(object) if object is not None else []
+        assert kind == "IMAGE"
+        image = bpy.data.images.get(name)
+        # only images used by SMH materials matter
+        if image is None or not self._image_users.get(name):
+            return []
+        return check_image(image)
+
+    @profiled("ValidationIndex.process")
+    def process(self) -> bool:
+        """Check dirty datablocks for a while, returns True if some are left"""
+        if not self.valid:
+            self._rebuild()
+        end = time.perf_counter() + self.TIME_BUDGET
+        n_checked = 0
+        while self._dirty and time.perf_counter() < end:
+            key = self._dirty.pop()
+            issues = self._check(*key)
+            if issues != self._issues.get(key, []):
+                self.issues_changed = True
+            if issues:
+                self._issues[key] = issues
+            else:
+                self._issues.pop(key, None)
+            n_checked += 1
+        if PROFILER.enabled:
+            PROFILER.count("datablocks validated", n_checked)
+        return bool(self._dirty)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty) if self.valid else -1
+
+    def get_issues(self) -> "list[ValidationIssue]":
+        return [issue for key in sorted(self._issues) for issue in self._issues[key]]
+
+
+VALIDATION_INDEX = ValidationIndex()
+
+
+def on_validation_timer():
+    has_more = VALIDATION_INDEX.process()
+    # also redraw once done, for the panel to stop showing "Checking..."
+    if VALIDATION_INDEX.issues_changed or not has_more:
+        VALIDATION_INDEX.issues_changed = False
+        tag_redraw_properties()
+    return ValidationIndex.INTERVAL if has_more else None
+
+
+def fix_validation_issue(issue: ValidationIssue) -> bool:
+    """Fix the issue if possible, returns whether it was"""
+    if issue.kind == "MATERIAL":
+        mat = bpy.data.materials.get(issue.name)
+        if mat is None:
+            return False
+        if issue.code == "LEGACY_GRAPH":
+            migrate_legacy_graphs()
+        else:
+            set_simple_material(mat)
+        return True
+    if issue.kind in {"MESH", "OBJECT"}:
+        if issue.kind == "MESH":
+            mesh = bpy.data.meshes.get(issue.name)
+        else:
+            object = bpy.data.objects.get(issue.name)
+            mesh = object.data if object is not None else None
+        if mesh is None:
+            return False
+        provision_color_attributes((mesh,))
+        return True
+    assert issue.kind == "IMAGE"
+    image = bpy.data.images.get(issue.name)
+    if image is None:
+        return False
+    width, height = image.size
+    # scale down, to the power of two below
+    width = 1 << (width.bit_length() - 1)
+    height = 1 << (height.bit_length() - 1)
+    if issue.code == "TOO_BIG_FOR_TMEM":
+        format = get_image_tmem_format(image)
+        while not n64_texture_fits_tmem(width, height, format):
+            if width >= height:
+                width //= 2
+            else:
+                height //= 2
+    if (width, height) != tuple(image.size):
+        image.scale(width, height)
+    return True
+
+
+class FixIssueOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_fix_issue"
+    bl_label = "Fix"
+    bl_description = (
+        "Fix the issue (images are scaled down, and need saving to keep the change)"
+    )
+    bl_options = {"REGISTER", "UNDO", "INTERNAL"}
 
-    other_output_nodes = [
-        node
-        for node in node_tree.nodes
-        if node.bl_idname == "ShaderNodeOutputMaterial" and node != output_node
-    ]
-    for other_output_node in other_output_nodes:
-        node_tree.nodes.remove(other_output_node)
+    kind: bpy.props.StringProperty()
+    name: bpy.props.StringProperty()
+    code: bpy.props.StringProperty()
 
-    # shader node
-
-    shader_node_name = "SMH Principled BSDF"
-    shader_node = node_tree.nodes.get(shader_node_name)
-    if shader_node is None:
-        shader_node = node_tree.nodes.new("ShaderNodeBsdfPrincipled")
-        shader_node.name = shader_node_name
-        shader_node.location = -500, 0
-
-    shader_node.inputs["Specular"].default_value = 0
-
-    # image node
-
-    image_node_name = "SMH Image Texture"
-    image_node = node_tree.nodes.get(image_node_name)
-    if image_node is None:
-        image_node = node_tree.nodes.new("ShaderNodeTexImage")
-        image_node.name = image_node_name
-        image_node.location = -1300, 0
-
-    # vertex color node
-
-    vertex_color_node_name = "SMH Vertex Color"
-    vertex_color_node = node_tree.nodes.get(vertex_color_node_name)
-    if vertex_color_node is None:
-        vertex_color_node = node_tree.nodes.new("ShaderNodeVertexColor")
-        vertex_color_node.name = vertex_color_node_name
-        vertex_color_node.location = -1300, -500
-
-    # multiply image color and vertex color node
-
-    multiply_image_color_and_vertex_color_node_name = "SMH Image Color * Vertex Color"
-    multiply_image_color_and_vertex_color_node = node_tree.nodes.get(
-        multiply_image_color_and_vertex_color_node_name
-    )
-    if multiply_image_color_and_vertex_color_node is None:
-        multiply_image_color_and_vertex_color_node = node_tree.nodes.new(
-            "ShaderNodeVectorMath"
-        )
-        multiply_image_color_and_vertex_color_node.name = (
-            multiply_image_color_and_vertex_color_node_name
-        )
-        multiply_image_color_and_vertex_color_node.location = -800, 0
-    multiply_image_color_and_vertex_color_node: bpy.types.ShaderNodeVectorMath
-    multiply_image_color_and_vertex_color_node.operation = "MULTIPLY"
-
-    # multiply image alpha and vertex alpha node
-
-    multiply_image_alpha_and_vertex_alpha_node_name = "SMH Image Alpha * Vertex Alpha"
-    multiply_image_alpha_and_vertex_alpha_node = node_tree.nodes.get(
-        multiply_image_alpha_and_vertex_alpha_node_name
-    )
-    if multiply_image_alpha_and_vertex_alpha_node is None:
-        multiply_image_alpha_and_vertex_alpha_node = node_tree.nodes.new(
-            "ShaderNodeMath"
-        )
-        multiply_image_alpha_and_vertex_alpha_node.name = (
-            multiply_image_alpha_and_vertex_alpha_node_name
-        )
-        multiply_image_alpha_and_vertex_alpha_node.location = -800, -300
-    multiply_image_alpha_and_vertex_alpha_node: bpy.types.ShaderNodeMath
-    multiply_image_alpha_and_vertex_alpha_node.operation = "MULTIPLY"
-
-    # uv map node
-
-    uv_map_node_name = "SMH UV Map"
-    uv_map_node = node_tree.nodes.get(uv_map_node_name)
-    if uv_map_node is None:
-        uv_map_node = node_tree.nodes.new("ShaderNodeUVMap")
-        uv_map_node.name = uv_map_node_name
-        uv_map_node.location = -2900, -400
-
-    # separate uv components node
-
-    uv_separate_node_name = "SMH Separate UV"
-    uv_separate_node = node_tree.nodes.get(uv_separate_node_name)
-    if uv_separate_node is None:
-        uv_separate_node = node_tree.nodes.new("ShaderNodeSeparateXYZ")
-        uv_separate_node.name = uv_separate_node_name
-        uv_separate_node.location = -2700, -400
-
-    # uv mirror u node
-
-    uv_mirror_u_node_name = "SMH UV Mirror U"
-    uv_mirror_u_node = node_tree.nodes.get(uv_mirror_u_node_name)
-    if uv_mirror_u_node is None:
-        uv_mirror_u_node = node_tree.nodes.new("ShaderNodeMath")
-        uv_mirror_u_node.name = uv_mirror_u_node_name
-        uv_mirror_u_node.location = -2400, 0
-    uv_mirror_u_node: bpy.types.ShaderNodeMath
-    uv_mirror_u_node.operation = "PINGPONG"
-    uv_mirror_u_node.inputs[1].default_value = 1
-
-    # uv mirror v node
-
-    uv_mirror_v_node_name = "SMH UV Mirror V"
-    uv_mirror_v_node = node_tree.nodes.get(uv_mirror_v_node_name)
-    if uv_mirror_v_node is None:
-        uv_mirror_v_node = node_tree.nodes.new("ShaderNodeMath")
-        uv_mirror_v_node.name = uv_mirror_v_node_name
-        uv_mirror_v_node.location = -2400, -200
-    uv_mirror_v_node: bpy.types.ShaderNodeMath
-    uv_mirror_v_node.operation = "PINGPONG"
-    uv_mirror_v_node.inputs[1].default_value = 1
-
-    # uv clamp u node
-
-    uv_clamp_u_node_name = "SMH UV Clamp U"
-    uv_clamp_u_node = node_tree.nodes.get(uv_clamp_u_node_name)
-    if uv_clamp_u_node is None:
-        uv_clamp_u_node = node_tree.nodes.new("ShaderNodeClamp")
-        uv_clamp_u_node.name = uv_clamp_u_node_name
-        uv_clamp_u_node.location = -2400, -500
-    uv_clamp_u_node: bpy.types.ShaderNodeClamp
-    uv_clamp_u_node.clamp_type = "MINMAX"
-    uv_clamp_u_node.inputs["Min"].default_value = 0
-    uv_clamp_u_node.inputs["Max"].default_value = 1
-
-    # uv clamp v node
-
-    uv_clamp_v_node_name = "SMH UV Clamp V"
-    uv_clamp_v_node = node_tree.nodes.get(uv_clamp_v_node_name)
-    if uv_clamp_v_node is None:
-        uv_clamp_v_node = node_tree.nodes.new("ShaderNodeClamp")
-        uv_clamp_v_node.name = uv_clamp_v_node_name
-        uv_clamp_v_node.location = -2400, -700
-    uv_clamp_v_node: bpy.types.ShaderNodeClamp
-    uv_clamp_v_node.clamp_type = "MINMAX"
-    uv_clamp_v_node.inputs["Min"].default_value = 0
-    uv_clamp_v_node.inputs["Max"].default_value = 1
-
-    # uv repeat type u node
-
-    uv_repeat_type_u_name = "SMH UV Repeat Type U"
-    uv_repeat_type_u = node_tree.nodes.get(uv_repeat_type_u_name)
-    if uv_repeat_type_u is None:
-        uv_repeat_type_u = node_tree.nodes.new("ShaderNodeValue")
-        uv_repeat_type_u.name = uv_repeat_type_u_name
-        uv_repeat_type_u.location = -2200, 0
-
-    # uv repeat pick u 1 node (picks wrap/mirror)
-
-    uv_repeat_pick1_u_name = "SMH UV Pick U 1"
-    uv_repeat_pick1_u = node_tree.nodes.get(uv_repeat_pick1_u_name)
-    if uv_repeat_pick1_u is None:
-        uv_repeat_pick1_u = node_tree.nodes.new("ShaderNodeMapRange")
-        uv_repeat_pick1_u.name = uv_repeat_pick1_u_name
-        uv_repeat_pick1_u.location = -2000, -200
-    uv_repeat_pick1_u.inputs["From Min"].default_value = 0
-    uv_repeat_pick1_u.inputs["From Max"].default_value = 1
-
-    # uv repeat pick u 2 node (picks pick1/clamp)
-
-    uv_repeat_pick2_u_name = "SMH UV Pick U 2"
-    uv_repeat_pick2_u = node_tree.nodes.get(uv_repeat_pick2_u_name)
-    if uv_repeat_pick2_u is None:
-        uv_repeat_pick2_u = node_tree.nodes.new("ShaderNodeMapRange")
-        uv_repeat_pick2_u.name = uv_repeat_pick2_u_name
-        uv_repeat_pick2_u.location = -1700, -200
-    uv_repeat_pick2_u.inputs["From Min"].default_value = 1
-    uv_repeat_pick2_u.inputs["From Max"].default_value = 2
-
-    # uv repeat type v node
-
-    uv_repeat_type_v_name = "SMH UV Repeat Type V"
-    uv_repeat_type_v = node_tree.nodes.get(uv_repeat_type_v_name)
-    if uv_repeat_type_v is None:
-        uv_repeat_type_v = node_tree.nodes.new("ShaderNodeValue")
-        uv_repeat_type_v.name = uv_repeat_type_v_name
-        uv_repeat_type_v.location = -2200, -600
-
-    # uv repeat pick v 1 node (picks wrap/mirror)
-
-    uv_repeat_pick1_v_name = "SMH UV Pick V 1"
-    uv_repeat_pick1_v = node_tree.nodes.get(uv_repeat_pick1_v_name)
-    if uv_repeat_pick1_v is None:
-        uv_repeat_pick1_v = node_tree.nodes.new("ShaderNodeMapRange")
-        uv_repeat_pick1_v.name = uv_repeat_pick1_v_name
-        uv_repeat_pick1_v.location = -2000, -800
-    uv_repeat_pick1_v.inputs["From Min"].default_value = 0
-    uv_repeat_pick1_v.inputs["From Max"].default_value = 1
-
-    # uv repeat pick v 2 node (picks pick1/clamp)
-
-    uv_repeat_pick2_v_name = "SMH UV Pick V 2"
-    uv_repeat_pick2_v = node_tree.nodes.get(uv_repeat_pick2_v_name)
-    if uv_repeat_pick2_v is None:
-        uv_repeat_pick2_v = node_tree.nodes.new("ShaderNodeMapRange")
-        uv_repeat_pick2_v.name = uv_repeat_pick2_v_name
-        uv_repeat_pick2_v.location = -1700, -800
-    uv_repeat_pick2_v.inputs["From Min"].default_value = 1
-    uv_repeat_pick2_v.inputs["From Max"].default_value = 2
-
-    # combine uv components node
-
-    uv_combine_node_name = "SMH Combine UV"
-    uv_combine_node = node_tree.nodes.get(uv_combine_node_name)
-    if uv_combine_node is None:
-        uv_combine_node = node_tree.nodes.new("ShaderNodeCombineXYZ")
-        uv_combine_node.name = uv_combine_node_name
-        uv_combine_node.location = -1500, -400
-
-    # Node links
+    def execute(self, context):
+        issue = ValidationIssue(self.kind, self.name, self.code, "")
+        if not fix_validation_issue(issue):
+            self.report({"WARNING"}, f"Could not fix {self.name}")
+            return {"CANCELLED"}
+        return {"FINISHED"}
 
-    # UV wrap, mirror, clamp
 
-    node_tree.links.new(
-        uv_separate_node.inputs[0],
-        uv_map_node.outputs["UV"],
-        verify_limits=True,
-    )
+class FixAllIssuesOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_fix_all_issues"
+    bl_label = "Fix All"
+    bl_description = "Fix all the issues found by Simple Material Helper validation"
+    bl_options = {"REGISTER", "UNDO"}
 
-    node_tree.links.new(
-        uv_mirror_u_node.inputs[0],
-        uv_separate_node.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_mirror_v_node.inputs[0],
-        uv_separate_node.outputs[1],
-        verify_limits=True,
+    include_images: bpy.props.BoolProperty(
+        name="Include Images",
+        description="Also scale down images",
+        default=False,
     )
 
-    node_tree.links.new(
-        uv_clamp_u_node.inputs[0],
-        uv_separate_node.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_clamp_v_node.inputs[0],
-        uv_separate_node.outputs[1],
-        verify_limits=True,
-    )
+    def execute(self, context):
+        issues = VALIDATION_INDEX.get_issues()
+        n_fixed = sum(
+            fix_validation_issue(issue)
+            for issue in issues
+            if issue.kind != "IMAGE" or self.include_images
+        )
+        self.report({"INFO"}, f"Fixed {n_fixed} issue(s)")
+        return {"FINISHED"}
 
-    # Pick U
 
-    node_tree.links.new(
-        uv_repeat_pick1_u.inputs["Value"],
-        uv_repeat_type_u.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_repeat_pick1_u.inputs["To Min"],
-        uv_separate_node.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_repeat_pick1_u.inputs["To Max"],
-        uv_mirror_u_node.outputs[0],
-        verify_limits=True,
-    )
+class ValidationPanel(bpy.types.Panel):
+    bl_label = "Simple Material Helper Validation"
+    bl_idname = "SCENE_PT_simple_material_helper_validation"
+    bl_space_type = "PROPERTIES"
+    bl_region_type = "WINDOW"
+    bl_context = "scene"
+    bl_options = {"DEFAULT_CLOSED"}
 
-    node_tree.links.new(
-        uv_repeat_pick2_u.inputs["Value"],
-        uv_repeat_type_u.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_repeat_pick2_u.inputs["To Min"],
-        uv_repeat_pick1_u.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_repeat_pick2_u.inputs["To Max"],
-        uv_clamp_u_node.outputs[0],
-        verify_limits=True,
-    )
+    MAX_ISSUES_SHOWN = 100
 
-    # Pick V
+    def draw(self, context):
+        layout = self.layout
+        # only check the file once the panel is shown
+        VALIDATION_INDEX.request()
+        issues = VALIDATION_INDEX.get_issues()
+        pending = VALIDATION_INDEX.pending
+
+        row = layout.row()
+        if pending != 0:
+            row.label(text="Checking...", icon="TIME")
+        elif issues:
+            row.label(text=f"{len(issues)} issue(s)", icon="ERROR")
+        else:
+            row.label(text="No issues", icon="CHECKMARK")
+        if issues:
+            row.operator(FixAllIssuesOperator.bl_idname)
+
+        icons = {
+            "MATERIAL": "MATERIAL",
+            "MESH": "MESH_DATA",
+            "OBJECT": "OBJECT_DATA",
+            "IMAGE": "IMAGE_DATA",
+        }
+        for issue in issues[: self.MAX_ISSUES_SHOWN]:
+            row = layout.row()
+            row.label(text=f"{issue.name}: {issue.message}", icon=icons[issue.kind])
+            op = row.operator(FixIssueOperator.bl_idname)
+            op.kind = issue.kind
+            op.name = issue.name
+            op.code = issue.code
+        if len(issues) > self.MAX_ISSUES_SHOWN:
+            layout.label(text=f"and {len(issues) - self.MAX_ISSUES_SHOWN} more")
+
+
+# Animated textures
+
+# Makes the image node show the file numbered 1 + frame_offset whatever the
+# current frame, so the flipbook frame rate is independent of the scene's
+SMH_FLIPBOOK_IMAGE_USER_SETTINGS = (
+    ("frame_duration", 1),
+    ("frame_start", 1),
+    ("use_cyclic", True),
+    ("use_auto_refresh", True),
+)
 
-    node_tree.links.new(
-        uv_repeat_pick1_v.inputs["Value"],
-        uv_repeat_type_v.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_repeat_pick1_v.inputs["To Min"],
-        uv_separate_node.outputs[1],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_repeat_pick1_v.inputs["To Max"],
-        uv_mirror_v_node.outputs[0],
-        verify_limits=True,
-    )
+# How much UVs can be offset by without changing the result, per UV repeat type,
+# scroll offsets are wrapped to it to keep float precision on long timelines
+SMH_UV_SCROLL_PERIODS = {
+    "WRAP": 1.0,
+    "MIRROR": 2.0,
+    "CLAMP": float("inf"),
+}
 
-    node_tree.links.new(
-        uv_repeat_pick2_v.inputs["Value"],
-        uv_repeat_type_v.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_repeat_pick2_v.inputs["To Min"],
-        uv_repeat_pick1_v.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_repeat_pick2_v.inputs["To Max"],
-        uv_clamp_v_node.outputs[0],
-        verify_limits=True,
-    )
 
-    # UV output
+def has_uv_scroll(
+    props,  # type: MaterialProperties
+) -> bool:
+    return props.scroll_u != 0 or props.scroll_v != 0
 
-    node_tree.links.new(
-        uv_combine_node.inputs[0],
-        uv_repeat_pick2_u.outputs[0],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        uv_combine_node.inputs[1],
-        uv_repeat_pick2_v.outputs[0],
-        verify_limits=True,
-    )
 
-    node_tree.links.new(
-        image_node.inputs[0],
-        uv_combine_node.outputs[0],
-        verify_limits=True,
-    )
+def has_flipbook(
+    image: "Optional[bpy.types.Image]",
+    props,  # type: MaterialProperties
+) -> bool:
+    return props.use_flipbook and image is not None and image.source == "SEQUENCE"
 
-    # Color
 
-    node_tree.links.new(
-        multiply_image_color_and_vertex_color_node.inputs[0],
-        image_node.outputs["Color"],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        multiply_image_color_and_vertex_color_node.inputs[1],
-        vertex_color_node.outputs["Color"],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        shader_node.inputs["Base Color"],
-        multiply_image_color_and_vertex_color_node.outputs[0],
-        verify_limits=True,
+def get_uv_scroll_periods(
+    props,  # type: MaterialProperties
+) -> "tuple[float, float]":
+    return (
+        SMH_UV_SCROLL_PERIODS[props.uv_repeat_u],
+        SMH_UV_SCROLL_PERIODS[props.uv_repeat_v],
     )
 
-    # Alpha
 
-    node_tree.links.new(
-        multiply_image_alpha_and_vertex_alpha_node.inputs[0],
-        image_node.outputs["Alpha"],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        multiply_image_alpha_and_vertex_alpha_node.inputs[1],
-        vertex_color_node.outputs["Alpha"],
-        verify_limits=True,
-    )
-    node_tree.links.new(
-        shader_node.inputs["Alpha"],
-        multiply_image_alpha_and_vertex_alpha_node.outputs[0],
-        verify_limits=True,
-    )
+def get_image_sequence_first_frame(image: bpy.types.Image) -> int:
+    """The number in the file name of the image sequence, e.g. 1 for water_0001.png"""
+    stem = Path(image.filepath).stem
+    n_digits = len(stem) - len(stem.rstrip("0123456789"))
+    return int(stem[-n_digits:]) if n_digits != 0 else 1
 
-    # Output
 
-    node_tree.links.new(
-        output_node.inputs["Surface"],
-        shader_node.outputs["BSDF"],
-        verify_limits=True,
-    )
+def get_scene_time(scene: bpy.types.Scene) -> float:
+    """Seconds since the start frame of the scene"""
+    render = scene.render
+    frame = scene.frame_current + getattr(scene, "frame_subframe", 0.0)
+    return (frame - scene.frame_start) * render.fps_base / render.fps
 
-    # return nodes
 
-    nodes = MaterialNodes()
-    nodes.shader_node = shader_node
-    nodes.image = image_node
-    nodes.uv_repeat_type_u = uv_repeat_type_u
-    nodes.uv_repeat_type_v = uv_repeat_type_v
+def get_uv_scroll_offsets(
+    speeds: "np.ndarray", periods: "np.ndarray", seconds: float
+) -> "np.ndarray":
+    return np.fmod(speeds * seconds, periods)
 
-    return nodes
 
+def get_flipbook_frame_offsets(
+    first_frames: "np.ndarray",
+    frame_counts: "np.ndarray",
+    fps: "np.ndarray",
+    seconds: float,
+) -> "np.ndarray":
+    frames = np.floor(fps * seconds).astype(np.int64) % np.maximum(frame_counts, 1)
+    return first_frames - 1 + frames
 
-def set_simple_material(mat: bpy.types.Material):
-    props: MaterialProperties = mat.simple_material_helper
 
-    nodes = ensure_setup_and_get_nodes(mat)
+def is_material_type_updated(depsgraph: bpy.types.Depsgraph) -> bool:
+    """Whether materials or node trees were changed, added or removed"""
+    return any(
+        depsgraph.id_type_updated(id_type) for id_type in ("MATERIAL", "NODETREE")
+    )
 
-    set_simple_material_image(mat, nodes, props)
 
-    set_simple_material_uv_repeats(nodes, props)
+class AnimatedMaterials:
+    """The nodes of SMH materials animated by scroll and flipbook settings.
+
+    They are looked up once, so the frame change handler only computes the values
+    for all materials at once and writes those which changed.
+    Invalidated when the node graphs may change (set_simple_materials, undo, load)
+    and on any material or node tree change reported by the depsgraph, except
+    the values written for the frame, as removed data would leave references to
+    freed memory.
+    """
+
+    def __init__(self):
+        self._valid = False
+        # pointers of the materials and node trees written to for the frame
+        self._frame_written: "set[int]" = set()
+
+        self._scroll_sockets: "list[bpy.types.NodeSocketVector]" = []
+        # (material pointer, node tree pointer) of each socket
+        self._scroll_ids: "list[tuple[int, int]]" = []
+        self._scroll_speeds = np.zeros((0, 2))
+        self._scroll_periods = np.zeros((0, 2))
+        self._scroll_written = np.zeros((0, 2))
+
+        self._image_users: "list[bpy.types.ImageUser]" = []
+        self._flipbook_ids: "list[tuple[int, int]]" = []
+        self._first_frames = np.zeros(0, dtype=np.int64)
+        self._frame_counts = np.zeros(0, dtype=np.int64)
+        self._fps = np.zeros(0)
+        self._frame_offsets_written = np.zeros(0, dtype=np.int64)
+
+    def invalidate(self):
+        self._valid = False
+        self._scroll_sockets = []
+        self._scroll_ids = []
+        self._image_users = []
+        self._flipbook_ids = []
+
+    def is_frame_update(self, id: bpy.types.ID) -> bool:
+        """Whether a depsgraph update of id is only from the values written for
+        the frame being changed to.
+        """
+        return id.as_pointer() in self._frame_written
+
+    def on_depsgraph_update(self, depsgraph: bpy.types.Depsgraph):
+        if not self._valid:
+            return
+        if self._frame_written:
+            changed = any(
+                isinstance(
+                    update.id.original, (bpy.types.Material, bpy.types.ShaderNodeTree)
+                )
+                and not self.is_frame_update(update.id.original)
+                for update in depsgraph.updates
+            )
+        else:
+            # removed materials have no update, only their type is tagged
+            changed = is_material_type_updated(depsgraph)
+        if changed:
+            self.invalidate()
+
+    def end_frame(self):
+        self._frame_written.clear()
+
+    @profiled("AnimatedMaterials.rebuild")
+    def rebuild(self):
+        scroll_sockets = []
+        scroll_ids = []
+        scroll_speeds = []
+        scroll_periods = []
+        image_users = []
+        flipbook_ids = []
+        flipbooks = []
+        n_animated = 0
+        for mat in bpy.data.materials:
+            node_tree = mat.node_tree
+            if node_tree is None:
+                continue
+            props: MaterialProperties = mat.simple_material_helper
+            ids = mat.as_pointer(), node_tree.as_pointer()
+            is_animated = False
+            if has_uv_scroll(props):
+                node = node_tree.nodes.get("SMH UV Scroll")
+                if node is not None:
+                    scroll_sockets.append(node.inputs[1])
+                    scroll_ids.append(ids)
+                    scroll_speeds.append((props.scroll_u, props.scroll_v))
+                    scroll_periods.append(get_uv_scroll_periods(props))
+                    is_animated = True
+            if props.use_flipbook:
+                node = node_tree.nodes.get("SMH Image Texture")
+                if node is not None and has_flipbook(node.image, props):
+                    image_users.append(node.image_user)
+                    flipbook_ids.append(ids)
+                    flipbooks.append(
+                        (
+                            get_image_sequence_first_frame(node.image),
+                            node.image.frame_duration,
+                            props.flipbook_fps,
+                        )
+                    )
+                    is_animated = True
+            n_animated += is_animated
+
+        self._scroll_sockets = scroll_sockets
+        self._scroll_ids = scroll_ids
+        self._scroll_speeds = np.array(scroll_speeds, dtype=float).reshape(-1, 2)
+        self._scroll_periods = np.array(scroll_periods, dtype=float).reshape(-1, 2)
+        self._scroll_written = np.full((len(scroll_sockets), 2), np.nan)
+        self._image_users = image_users
+        self._flipbook_ids = flipbook_ids
+        flipbooks = np.array(flipbooks, dtype=float).reshape(-1, 3)
+        self._first_frames = flipbooks[:, 0].astype(np.int64)
+        self._frame_counts = flipbooks[:, 1].astype(np.int64)
+        self._fps = flipbooks[:, 2]
+        self._frame_offsets_written = np.full(len(image_users), -1, dtype=np.int64)
+        self._valid = True
+
+        if PROFILER.enabled:
+            PROFILER.count("animated materials", n_animated)
+
+    @profiled("AnimatedMaterials.update")
+    def update(
+        self,
+        scene: bpy.types.Scene,
+        depsgraph: "Optional[bpy.types.Depsgraph]" = None,
+    ):
+        """Set the scroll offsets and flipbook frames for the current frame"""
+        self._frame_written.clear()
+        if depsgraph is not None and is_material_type_updated(depsgraph):
+            # changed since the last depsgraph update, not evaluated yet
+            self.invalidate()
+        if not self._valid:
+            self.rebuild()
+        if not self._scroll_sockets and not self._image_users:
+            return
+
+        seconds = get_scene_time(scene)
+
+        offsets = get_uv_scroll_offsets(
+            self._scroll_speeds, self._scroll_periods, seconds
+        )
+        changed_scrolls = np.flatnonzero((offsets != self._scroll_written).any(axis=1))
+        for i, (u, v) in zip(
+            changed_scrolls.tolist(), offsets[changed_scrolls].tolist()
+        ):
+            self._scroll_sockets[i].default_value = (u, v, 0.0)
+            self._frame_written.update(self._scroll_ids[i])
+        self._scroll_written = offsets
 
+        frame_offsets = get_flipbook_frame_offsets(
+            self._first_frames, self._frame_counts, self._fps, seconds
+        )
+        changed_frames = np.flatnonzero(frame_offsets != self._frame_offsets_written)
+        for i, frame_offset in zip(
+            changed_frames.tolist(), frame_offsets[changed_frames].tolist()
+        ):
+            self._image_users[i].frame_offset = frame_offset
+            self._frame_written.update(self._flipbook_ids[i])
+        self._frame_offsets_written = frame_offsets
 
-def set_simple_material_image(
-    mat: bpy.types.Material,
-    nodes: MaterialNodes,
-    props,  # type: MaterialProperties
-):
-    nodes.image.image = props.image
+        if PROFILER.enabled:
+            PROFILER.count(
+                "animated values written", len(changed_scrolls) + len(changed_frames)
+            )
 
-    if props.image is None:
-        mat.node_tree.links.remove(nodes.shader_node.inputs["Base Color"].links[0])
-        nodes.shader_node.inputs["Base Color"].default_value = 1, 0, 1, 1
-        mat.node_tree.links.remove(nodes.shader_node.inputs["Alpha"].links[0])
-        nodes.shader_node.inputs["Alpha"].default_value = 1
 
+ANIMATED_MATERIALS = AnimatedMaterials()
 
-def set_simple_material_uv_repeats(
-    nodes: MaterialNodes,
-    props,  # type: MaterialProperties
-):
-    values = {
-        "WRAP": 0,
-        "MIRROR": 1,
-        "CLAMP": 2,
-    }
-    nodes.uv_repeat_type_u.outputs[0].default_value = values[props.uv_repeat_u]
-    nodes.uv_repeat_type_v.outputs[0].default_value = values[props.uv_repeat_v]
 
+class PropagationState:
+    # Set while copying a property to other materials, for their update callbacks
+    # to do nothing as the materials are then updated together
+    active = False
 
-def on_material_image_update(self, context):
-    mat: bpy.types.Material = context.material
 
-    set_simple_material(mat)
+PROPAGATION_STATE = PropagationState()
 
 
-def on_material_use_transparency_update(self, context):
-    mat: bpy.types.Material = context.material
+def propagate_to_selected_materials(
+    props,  # type: MaterialProperties
+    context: bpy.types.Context,
+    prop_name: str,
+) -> "list[bpy.types.Material]":
+    """Copy a property to the materials of the selected objects if editing them
+    all is enabled, and return the materials to update (including props' one).
+    """
+    mat: bpy.types.Material = props.id_data
+
+    if not context.window_manager.simple_material_helper_edit_selected:
+        return [mat]
+
+    selected_objects = getattr(context, "selected_objects", None) or ()
+    materials = [mat] + [
+        other_mat
+        for other_mat in get_simple_materials_in_objects(
+            selected_objects, include_all=True
+        )
+        if other_mat != mat
+    ]
 
-    props: MaterialProperties = mat.simple_material_helper
+    value = getattr(props, prop_name)
+    PROPAGATION_STATE.active = True
+    try:
+        for other_mat in materials[1:]:
+            other_props: MaterialProperties = other_mat.simple_material_helper
+            if getattr(other_props, prop_name) != value:
+                setattr(other_props, prop_name, value)
+    finally:
+        PROPAGATION_STATE.active = False
+
+    return materials
 
+
+def set_simple_material_transparency(
+    mat: bpy.types.Material,
+    props,  # type: MaterialProperties
+):
     if props.use_transparency:
         if props.use_blend_transparency:
             mat.blend_method = "BLEND"
@@ -519,14 +5249,126 @@ def on_material_use_transparency_update(self, context):
         mat.use_backface_culling = False
 
 
+@profiled("on_material_image_update")
+def on_material_image_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "image")
+
+    UPDATE_SCHEDULER.schedule(materials)
+
+
+@profiled("on_material_use_transparency_update")
+def on_material_use_transparency_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "use_transparency")
+
+    for mat in materials:
+        set_simple_material_transparency(mat, mat.simple_material_helper)
+
+
+@profiled("on_material_use_blend_transparency_update")
 def on_material_use_blend_transparency_update(self, context):
-    on_material_use_transparency_update(self, context)
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "use_blend_transparency")
+
+    for mat in materials:
+        set_simple_material_transparency(mat, mat.simple_material_helper)
+
+
+@profiled("on_material_uv_repeat_u_update")
+def on_material_uv_repeat_u_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "uv_repeat_u")
+
+    UPDATE_SCHEDULER.schedule(materials)
 
 
-def on_material_uv_repeat_update(self, context):
-    mat: bpy.types.Material = context.material
+@profiled("on_material_uv_repeat_v_update")
+def on_material_uv_repeat_v_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
 
-    set_simple_material(mat)
+    materials = propagate_to_selected_materials(self, context, "uv_repeat_v")
+
+    UPDATE_SCHEDULER.schedule(materials)
+
+
+@profiled("on_material_preview_quantized_update")
+def on_material_preview_quantized_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "preview_quantized")
+
+    UPDATE_SCHEDULER.schedule(materials)
+
+
+@profiled("on_material_preview_format_update")
+def on_material_preview_format_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "preview_format")
+
+    UPDATE_SCHEDULER.schedule(materials)
+
+
+@profiled("on_material_preview_dither_update")
+def on_material_preview_dither_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "preview_dither")
+
+    UPDATE_SCHEDULER.schedule(materials)
+
+
+@profiled("on_material_scroll_u_update")
+def on_material_scroll_u_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "scroll_u")
+
+    UPDATE_SCHEDULER.schedule(materials)
+
+
+@profiled("on_material_scroll_v_update")
+def on_material_scroll_v_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "scroll_v")
+
+    UPDATE_SCHEDULER.schedule(materials)
+
+
+@profiled("on_material_use_flipbook_update")
+def on_material_use_flipbook_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "use_flipbook")
+
+    UPDATE_SCHEDULER.schedule(materials)
+
+
+@profiled("on_material_flipbook_fps_update")
+def on_material_flipbook_fps_update(self, context):
+    if PROPAGATION_STATE.active:
+        return
+
+    materials = propagate_to_selected_materials(self, context, "flipbook_fps")
+
+    UPDATE_SCHEDULER.schedule(materials)
 
 
 class MaterialProperties(bpy.types.PropertyGroup):
@@ -586,7 +5428,7 @@ class MaterialProperties(bpy.types.PropertyGroup):
         name="UV Repeat U",
         description="How to repeat the image along the U component of UVs",
         default="WRAP",
-        update=on_material_uv_repeat_update,
+        update=on_material_uv_repeat_u_update,
     )
     uv_repeat_v: bpy.props.EnumProperty(
         items=[
@@ -616,7 +5458,65 @@ class MaterialProperties(bpy.types.PropertyGroup):
         name="UV Repeat V",
         description="How to repeat the image along the V component of UVs",
         default="WRAP",
-        update=on_material_uv_repeat_update,
+        update=on_material_uv_repeat_v_update,
+    )
+
+    preview_quantized: bpy.props.BoolProperty(
+        name="Preview Palette",
+        description=(
+            "Should the material show the image reduced to a palette, "
+            "as it will look in-game with a CI4 or CI8 texture format"
+        ),
+        default=False,
+        update=on_material_preview_quantized_update,
+    )
+    preview_format: bpy.props.EnumProperty(
+        items=[
+            ("CI4", "CI4", "16 colors palette"),
+            ("CI8", "CI8", "256 colors palette"),
+        ],
+        name="Palette Format",
+        description="Texture format to preview the image with",
+        default="CI8",
+        update=on_material_preview_format_update,
+    )
+    preview_dither: bpy.props.BoolProperty(
+        name="Dither",
+        description="Should the palette reduction use ordered dithering",
+        default=False,
+        update=on_material_preview_dither_update,
+    )
+
+    scroll_u: bpy.props.FloatProperty(
+        name="Scroll U",
+        description="How fast the image scrolls along U, in UV units per second",
+        default=0,
+        step=1,
+        update=on_material_scroll_u_update,
+    )
+    scroll_v: bpy.props.FloatProperty(
+        name="Scroll V",
+        description="How fast the image scrolls along V, in UV units per second",
+        default=0,
+        step=1,
+        update=on_material_scroll_v_update,
+    )
+    use_flipbook: bpy.props.BoolProperty(
+        name="Flipbook",
+        description=(
+            "Should the material cycle through the frames of the image, "
+            "which must be an image sequence"
+        ),
+        default=False,
+        update=on_material_use_flipbook_update,
+    )
+    flipbook_fps: bpy.props.FloatProperty(
+        name="Flipbook FPS",
+        description="How many frames of the image sequence are shown per second",
+        default=20,
+        min=0,
+        soft_max=60,
+        update=on_material_flipbook_fps_update,
     )
 
 
@@ -639,8 +5539,18 @@ class MaterialPanel(bpy.types.Panel):
         mat: bpy.types.Material = context.material
         props: MaterialProperties = mat.simple_material_helper
 
+        layout.prop(context.window_manager, "simple_material_helper_edit_selected")
+
         layout.label(text="Image:")
         layout.template_ID(props, "image", open="image.open")
+        if props.image is not None:
+            draw_texture_analysis(layout, props.image)
+            row = layout.row()
+            row.prop(props, "preview_quantized")
+            sub = row.row()
+            sub.active = props.preview_quantized
+            sub.prop(props, "preview_format", text="")
+            sub.prop(props, "preview_dither")
 
         if props.use_transparency:
             box = layout.box()
@@ -656,6 +5566,34 @@ class MaterialPanel(bpy.types.Panel):
 
         layout.prop(props, "uv_repeat_u")
         layout.prop(props, "uv_repeat_v")
+        draw_uv_bounds(layout, mat)
+
+        layout.prop(props, "scroll_u")
+        layout.prop(props, "scroll_v")
+        row = layout.row()
+        row.prop(props, "use_flipbook")
+        sub = row.row()
+        sub.active = props.use_flipbook
+        sub.prop(props, "flipbook_fps", text="FPS")
+        if (
+            props.use_flipbook
+            and props.image is not None
+            and props.image.source != "SEQUENCE"
+        ):
+            layout.label(text="The image is not an image sequence", icon="ERROR")
+
+        row = layout.row()
+        row.operator_menu_enum(ApplyOperator.bl_idname, "scope")
+        row.operator(DedupeOperator.bl_idname)
+        row.operator(DedupeImagesOperator.bl_idname)
+        row = layout.row()
+        row.operator(ImportMaterialsOperator.bl_idname)
+        row.operator(ExportTexturesOperator.bl_idname)
+        row.operator(ExportManifestOperator.bl_idname)
+        row = layout.row()
+        row.operator(BakeVertexColorsOperator.bl_idname)
+        row.operator(AtlasOperator.bl_idname)
+        layout.operator(SortFacesOperator.bl_idname)
 
 
 class Config:
@@ -665,6 +5603,11 @@ class Config:
 
     # Saved
     use_own_panel = False
+    use_specialized_uv_nodes = False
+    enable_profiling = False
+    vertex_color_domain = "CORNER"
+    vertex_color_type = "BYTE_COLOR"
+    vertex_color_init_white = True
 
     def read(self):
         try:
@@ -676,10 +5619,28 @@ class Config:
             pass
         else:
             self.use_own_panel = data.get("use_own_panel", self.use_own_panel)
+            self.use_specialized_uv_nodes = data.get(
+                "use_specialized_uv_nodes", self.use_specialized_uv_nodes
+            )
+            self.enable_profiling = data.get("enable_profiling", self.enable_profiling)
+            self.vertex_color_domain = data.get(
+                "vertex_color_domain", self.vertex_color_domain
+            )
+            self.vertex_color_type = data.get(
+                "vertex_color_type", self.vertex_color_type
+            )
+            self.vertex_color_init_white = data.get(
+                "vertex_color_init_white", self.vertex_color_init_white
+            )
 
     def write(self):
         data = {
             "use_own_panel": self.use_own_panel,
+            "use_specialized_uv_nodes": self.use_specialized_uv_nodes,
+            "enable_profiling": self.enable_profiling,
+            "vertex_color_domain": self.vertex_color_domain,
+            "vertex_color_type": self.vertex_color_type,
+            "vertex_color_init_white": self.vertex_color_init_white,
         }
         with self.register_params_path.open("w") as f:
             json.dump(data, f)
@@ -694,6 +5655,103 @@ def on_use_own_panel_update(self, context):
     CONFIG.write()
 
 
+def on_use_specialized_uv_nodes_update(self, context):
+    CONFIG.use_specialized_uv_nodes = self.use_specialized_uv_nodes
+    CONFIG.write()
+    set_simple_materials(
+        mat
+        for mat in bpy.data.materials
+        if is_editable(mat) and is_simple_material(mat)
+    )
+
+
+def on_enable_profiling_update(self, context):
+    CONFIG.enable_profiling = self.enable_profiling
+    CONFIG.write()
+    PROFILER.enabled = self.enable_profiling
+
+
+def on_vertex_color_settings_update(self, context):
+    CONFIG.vertex_color_domain = self.vertex_color_domain
+    CONFIG.vertex_color_type = self.vertex_color_type
+    CONFIG.vertex_color_init_white = self.vertex_color_init_white
+    CONFIG.write()
+
+
+class ProvisionVertexColorsOperator(bpy.types.Operator):
+    bl_idname = "material.simple_material_helper_provision_vertex_colors"
+    bl_label = "Add Missing Vertex Colors"
+    bl_description = (
+        "Add vertex colors to all meshes using Simple Material Helper materials "
+        "which have none, with the domain and type from the preferences"
+    )
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        meshes: "dict[str, bpy.types.Mesh]" = dict()
+        for mat in bpy.data.materials:
+            if is_simple_material(mat):
+                for mesh in MATERIAL_USERS_INDEX.get_meshes(mat):
+                    meshes[mesh.name] = mesh
+        count = provision_color_attributes(meshes.values())
+        self.report({"INFO"}, f"Added vertex colors to {count} mesh(es)")
+        return {"FINISHED"}
+
+
+class ProfilingResetOperator(bpy.types.Operator):
+    bl_idname = "preferences.simple_material_helper_profiling_reset"
+    bl_label = "Reset Statistics"
+    bl_description = "Clear the Simple Material Helper profiling statistics"
+
+    def execute(self, context):
+        PROFILER.reset()
+        return {"FINISHED"}
+
+
+class ProfilingExportOperator(bpy.types.Operator):
+    bl_idname = "preferences.simple_material_helper_profiling_export"
+    bl_label = "Export Statistics"
+    bl_description = "Write the Simple Material Helper profiling statistics to json"
+
+    filepath: bpy.props.StringProperty(subtype="FILE_PATH")
+    filter_glob: bpy.props.StringProperty(default="*.json", options={"HIDDEN"})
+
+    def invoke(self, context, event):
+        if not self.filepath:
+            self.filepath = "smh_profiling.json"
+        context.window_manager.fileselect_add(self)
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        with open(self.filepath, "w") as f:
+            json.dump(PROFILER.to_dict(), f, indent=1)
+        self.report({"INFO"}, f"Wrote {self.filepath}")
+        return {"FINISHED"}
+
+
+def draw_profiling_stats(layout: bpy.types.UILayout):
+    box = layout.box()
+    row = box.row()
+    row.operator(ProfilingResetOperator.bl_idname)
+    row.operator(ProfilingExportOperator.bl_idname)
+
+    if not PROFILER.stats and not PROFILER.counters:
+        box.label(text="Nothing recorded yet")
+        return
+
+    grid = box.grid_flow(row_major=True, columns=4, even_columns=False)
+    for text in ("Operation", "Calls", "Total (ms)", "Max (ms)"):
+        grid.label(text=text)
+    for name, stats in sorted(PROFILER.stats.items()):
+        grid.label(text=name)
+        grid.label(text=str(stats.calls))
+        grid.label(text=f"{stats.total_duration * 1000:.2f}")
+        grid.label(text=f"{stats.max_duration * 1000:.2f}")
+
+    for name, n in sorted(PROFILER.counters.items()):
+        box.label(text=f"{name}: {n}")
+
+
 class AddonProperties(bpy.types.AddonPreferences):
     bl_idname = __name__
 
@@ -707,6 +5765,60 @@ class AddonProperties(bpy.types.AddonPreferences):
         default=False,
         update=on_use_own_panel_update,
     )
+    use_specialized_uv_nodes: bpy.props.BoolProperty(
+        name="Minimal UV Nodes",
+        description=(
+            "Should materials only have the nodes needed by their UV repeat types, "
+            "instead of using a node group picking between wrap, mirror and clamp.\n"
+            "Makes shaders cheaper, but changing a repeat type changes the nodes"
+        ),
+        default=False,
+        update=on_use_specialized_uv_nodes_update,
+    )
+    enable_profiling: bpy.props.BoolProperty(
+        name="Profiling",
+        description=(
+            "Record how many times and for how long the addon's operations run, "
+            "to find what makes things slow"
+        ),
+        default=False,
+        update=on_enable_profiling_update,
+    )
+    vertex_color_domain: bpy.props.EnumProperty(
+        items=[
+            ("CORNER", "Face Corner", "A color per face corner, allows sharp edges"),
+            ("POINT", "Vertex", "A color per vertex, uses less memory"),
+        ],
+        name="Vertex Colors Domain",
+        description=(
+            "Domain of the vertex colors added to meshes using SMH materials "
+            "(Blender 3.2+)"
+        ),
+        default="CORNER",
+        update=on_vertex_color_settings_update,
+    )
+    vertex_color_type: bpy.props.EnumProperty(
+        items=[
+            ("BYTE_COLOR", "Byte", "8 bits per channel, like N64 vertex colors"),
+            ("FLOAT_COLOR", "Float", "32 bits per channel"),
+        ],
+        name="Vertex Colors Type",
+        description=(
+            "Data type of the vertex colors added to meshes using SMH materials "
+            "(Blender 3.2+)"
+        ),
+        default="BYTE_COLOR",
+        update=on_vertex_color_settings_update,
+    )
+    vertex_color_init_white: bpy.props.BoolProperty(
+        name="Initialize Vertex Colors to White",
+        description=(
+            "Fill added vertex colors with white, so they don't change how materials "
+            "look (Blender 3.2+)"
+        ),
+        default=True,
+        update=on_vertex_color_settings_update,
+    )
 
     def draw(self, context):
         layout = self.layout
@@ -715,12 +5827,40 @@ class AddonProperties(bpy.types.AddonPreferences):
             layout.label(text="Restart Blender to apply changes", icon="ERROR")
             layout.alert = False
         layout.prop(self, "use_own_panel")
+        layout.prop(self, "use_specialized_uv_nodes")
+        layout.prop(self, "enable_profiling")
+        if PROFILER.enabled:
+            draw_profiling_stats(layout)
+        layout.operator(MigrateOperator.bl_idname)
+        row = layout.row()
+        row.prop(self, "vertex_color_domain", text="")
+        row.prop(self, "vertex_color_type", text="")
+        row.prop(self, "vertex_color_init_white", text="White")
+        layout.operator(ProvisionVertexColorsOperator.bl_idname)
 
 
 classes = (
     AddonProperties,
     MaterialProperties,
     MaterialPanel,
+    MigrateOperator,
+    ApplyOperator,
+    DedupeOperator,
+    ProfilingResetOperator,
+    ProfilingExportOperator,
+    AnalyzeTexturesOperator,
+    ExportTexturesOperator,
+    ExportManifestOperator,
+    AutoUVRepeatOperator,
+    BakeVertexColorsOperator,
+    AtlasOperator,
+    SortFacesOperator,
+    DedupeImagesOperator,
+    ImportMaterialsOperator,
+    ProvisionVertexColorsOperator,
+    FixIssueOperator,
+    FixAllIssuesOperator,
+    ValidationPanel,
 )
 
 
@@ -745,6 +5885,8 @@ def register():
         MaterialPanel.bl_idname = "MATERIAL_PT_simple_material_helper_top"
         MaterialPanel.bl_options.add("HIDE_HEADER")
 
+    PROFILER.enabled = CONFIG.enable_profiling
+
     for clazz in classes:
         try:
             bpy.utils.register_class(clazz)
@@ -754,9 +5896,36 @@ def register():
     bpy.types.Material.simple_material_helper = bpy.props.PointerProperty(
         type=MaterialProperties,
     )
+    bpy.types.WindowManager.simple_material_helper_edit_selected = (
+        bpy.props.BoolProperty(
+            name="Edit All Selected",
+            description=(
+                "Should changes to the image, transparency and UV repeat settings "
+                "also apply to the materials of all selected objects"
+            ),
+            default=False,
+        )
+    )
+
+    for handler_list, handler in handlers:
+        if handler not in handler_list:
+            handler_list.append(handler)
 
 
 def unregister():
+    for handler_list, handler in handlers:
+        if handler in handler_list:
+            handler_list.remove(handler)
+
+    MATERIAL_USERS_INDEX.invalidate()
+    UPDATE_SCHEDULER.cancel()
+    TEXTURE_ANALYZER.shutdown()
+    UV_BOUNDS_CACHE.clear()
+    VALIDATION_INDEX.cancel()
+    ANIMATED_MATERIALS.invalidate()
+
+    del bpy.types.WindowManager.simple_material_helper_edit_selected
+
     for clazz in reversed(classes):
         try:
             bpy.utils.unregister_class(clazz)
@@ -765,5 +5934,136 @@ def unregister():
             traceback.print_exception()
 
 
+# Command line
+
+CLI_RESULT_PREFIX = "SMH_RESULT "
+
+
+def parse_command_line(argv: "list[str]"):
+    parser = argparse.ArgumentParser(
+        prog="blender -b file.blend --python simple_material_helper.py --",
+        description="Process the Simple Material Helper materials of a .blend file",
+    )
+    # Commands changing the file take --save after the command name
+    save_parser = argparse.ArgumentParser(add_help=False)
+    save_parser.add_argument(
+        "--save", action="store_true", help="save the .blend file afterwards"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "refresh", parents=[save_parser], help="set up or refresh all SMH materials"
+    )
+    subparsers.add_parser(
+        "migrate",
+        parents=[save_parser],
+        help="convert materials from older versions of the addon",
+    )
+    subparsers.add_parser("validate", help="report problems with SMH materials")
+    export_textures_parser = subparsers.add_parser(
+        "export-textures", help="export the images as N64 textures"
+    )
+    export_textures_parser.add_argument(
+        "directory",
+        help="output directory, {blend} is replaced with the .blend file name",
+    )
+    export_textures_parser.add_argument("--force", action="store_true")
+    export_manifest_parser = subparsers.add_parser(
+        "export-manifest", help="export the material manifest"
+    )
+    export_manifest_parser.add_argument(
+        "filepath",
+        help="output file, {blend} is replaced with the .blend file name",
+    )
+    import_materials_parser = subparsers.add_parser(
+        "import-materials",
+        parents=[save_parser],
+        help="create materials from a directory of images or a manifest",
+    )
+    import_materials_parser.add_argument(
+        "path",
+        help="directory or manifest, {blend} is replaced with the .blend file name",
+    )
+    import_materials_parser.add_argument("--recursive", action="store_true")
+    return parser.parse_args(argv)
+
+
+def run_command_line(argv: "list[str]") -> int:
+    """Run a batch command on the open .blend file, see parse_command_line.
+
+    Prints a result line (CLI_RESULT_PREFIX followed by json) for the batch
+    driver script to gather, and returns the exit code.
+    """
+    try:
+        args = parse_command_line(argv)
+    except SystemExit as e:
+        # argparse printed the usage error (or the help), still print a result
+        result = {"file": bpy.data.filepath, "command": argv[0] if argv else None}
+        if e.code:
+            result["error"] = "invalid arguments: " + " ".join(argv)
+        print(CLI_RESULT_PREFIX + json.dumps(result), flush=True)
+        return 2 if e.code else 0
+
+    blend_name = Path(bpy.data.filepath).stem
+    result = {"file": bpy.data.filepath, "command": args.command}
+    exit_code = 0
+
+    materials = [mat for mat in bpy.data.materials if is_simple_material(mat)]
+    try:
+        if args.command == "refresh":
+            set_simple_materials(materials)
+            result["refreshed"] = len(materials)
+        elif args.command == "migrate":
+            result["migrated"] = migrate_legacy_graphs()
+        elif args.command == "validate":
+            problems = {
+                mat.name: mat_problems
+                for mat in materials
+                for mat_problems in (get_material_problems(mat),)
+                if mat_problems
+            }
+            result["checked"] = len(materials)
+            result["problems"] = problems
+            if problems:
+                exit_code = 1
+        elif args.command == "export-textures":
+            export_result = export_n64_textures(
+                args.directory.format(blend=blend_name), force=args.force
+            )
+            result["exported"] = len(export_result.exported)
+            result["skipped"] = len(export_result.skipped)
+        elif args.command == "export-manifest":
+            manifest_result = export_material_manifest(
+                args.filepath.format(blend=blend_name)
+            )
+            result["written"] = len(manifest_result.written)
+            result["unchanged"] = len(manifest_result.unchanged)
+        else:
+            assert args.command == "import-materials"
+            import_result = import_materials(
+                args.path.format(blend=blend_name), args.recursive
+            )
+            result["imported"] = len(import_result.materials)
+            result["images_loaded"] = import_result.images_loaded
+            result["images_reused"] = import_result.images_reused
+            result["skipped"] = dict(import_result.skipped)
+
+        if getattr(args, "save", False):
+            bpy.ops.wm.save_mainfile()
+            result["saved"] = True
+    except Exception as e:
+        traceback.print_exc()
+        result["error"] = f"{type(e).__name__}: {e}"
+        exit_code = 2
+
+    print(CLI_RESULT_PREFIX + json.dumps(result), flush=True)
+    return exit_code
+
+
 if __name__ == "__main__":
     register()
+
+    # blender -b file.blend --python simple_material_helper.py -- <command>
+    if bpy.app.background and "--" in sys.argv:
+        exit_code = run_command_line(sys.argv[sys.argv.index("--") + 1 :])
+        unregister()
+        sys.exit(exit_code)
@@ -0,0 +1,31 @@
+"""Run the tests against the recording bpy stand-in (benchmarks/recording_bpy.py):
+
+python -m pytest tests
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(REPO_DIR / "benchmarks"))
+sys.path.insert(0, str(REPO_DIR))
+
+import recording_bpy
+
+bpy = recording_bpy.install()
+
+import simple_material_helper
+
+
+@pytest.fixture
+def addon():
+    """The addon registered on empty data"""
+    recording_bpy.reset_data()
+    # also forgets what the caches hold from other tests
+    simple_material_helper.on_load_post()
+    simple_material_helper.register()
+    yield simple_material_helper
+    simple_material_helper.unregister()
@@ -0,0 +1,97 @@
+import itertools
+
+import pytest
+
+import simple_material_helper as smh
+
+
+def assert_no_overlap(rects):
+    for (x1, y1, w1, h1), (x2, y2, w2, h2) in itertools.combinations(rects, 2):
+        assert x1 + w1 <= x2 or x2 + w2 <= x1 or y1 + h1 <= y2 or y2 + h2 <= y1
+
+
+def assert_within(rects, width, height):
+    for x, y, w, h in rects:
+        assert 0 <= x and 0 <= y and x + w <= width and y + h <= height
+
+
+def test_max_rects_packer_fills_bin():
+    packer = smh.MaxRectsPacker(32, 32)
+    rects = []
+    for _ in range(4):
+        position = packer.insert(16, 16)
+        assert position is not None
+        rects.append((*position, 16, 16))
+    assert_no_overlap(rects)
+    assert_within(rects, 32, 32)
+    assert packer.insert(1, 1) is None
+
+
+def test_max_rects_packer_mixed_sizes():
+    packer = smh.MaxRectsPacker(64, 64)
+    rects = []
+    for width, height in [(32, 32), (32, 16), (16, 32), (16, 16), (8, 8), (8, 4)]:
+        position = packer.insert(width, height)
+        assert position is not None
+        rects.append((*position, width, height))
+    assert_no_overlap(rects)
+    assert_within(rects, 64, 64)
+
+
+def test_max_rects_packer_too_large():
+    packer = smh.MaxRectsPacker(16, 16)
+    assert packer.insert(32, 8) is None
+    # nothing was placed
+    assert packer.insert(16, 16) == (0, 0)
+
+
+def get_rects(layout, sizes):
+    return [(x, y, *sizes[key]) for key, (x, y) in layout.positions.items()]
+
+
+def test_pack_atlases_single_atlas():
+    sizes = {"a": (16, 16), "b": (16, 16), "c": (32, 16), "d": (32, 32)}
+    layouts, too_large = smh.pack_atlases(sizes, "RGBA16")
+    assert too_large == []
+    assert len(layouts) == 1
+    (layout,) = layouts
+    assert set(layout.positions) == set(sizes)
+    # as small as possible
+    assert layout.width * layout.height == sum(w * h for w, h in sizes.values())
+    assert smh.n64_texture_fits_tmem(layout.width, layout.height, "RGBA16")
+    rects = get_rects(layout, sizes)
+    assert_no_overlap(rects)
+    assert_within(rects, layout.width, layout.height)
+
+
+def test_pack_atlases_several_atlases():
+    # RGBA16 atlases hold at most 2048 texels
+    sizes = {i: (32, 32) for i in range(5)}
+    layouts, too_large = smh.pack_atlases(sizes, "RGBA16")
+    assert too_large == []
+    assert sorted(key for layout in layouts for key in layout.positions) == list(
+        range(5)
+    )
+    assert len(layouts) == 3
+    for layout in layouts:
+        assert smh.n64_texture_fits_tmem(layout.width, layout.height, "RGBA16")
+        rects = get_rects(layout, sizes)
+        assert_no_overlap(rects)
+        assert_within(rects, layout.width, layout.height)
+
+
+@pytest.mark.parametrize("format", ["RGBA16", "CI8", "I4"])
+def test_pack_atlases_too_large(format):
+    sizes = {"small": (8, 8), "huge": (2048, 2048)}
+    layouts, too_large = smh.pack_atlases(sizes, format)
+    assert too_large == ["huge"]
+    assert [set(layout.positions) for layout in layouts] == [{"small"}]
+
+
+def test_get_atlas_sizes_fit_tmem():
+    sizes = smh.get_atlas_sizes("RGBA32")
+    assert sizes
+    for width, height in sizes:
+        assert smh.n64_texture_fits_tmem(width, height, "RGBA32")
+    areas = [width * height for width, height in sizes]
+    assert areas == sorted(areas, reverse=True)
@@ -0,0 +1,64 @@
+import struct
+
+import pytest
+
+import simple_material_helper as smh
+
+PNG_HEADER = (
+    b"\x89PNG\r\n\x1a\n"
+    + struct.pack(">I", 13)
+    + b"IHDR"
+    + struct.pack(">IIBBBBB", 64, 32, 8, 6, 0, 0, 0)
+)
+
+BMP_HEADER = b"BM" + bytes(16) + struct.pack("<ii", 16, -8) + struct.pack("<HH", 1, 32)
+
+JPEG_HEADER = (
+    b"\xff\xd8"
+    # APP0 segment, skipped
+    + b"\xff\xe0"
+    + struct.pack(">H", 16)
+    + b"JFIF\x00"
+    + bytes(9)
+    # start of frame: precision, height, width
+    + b"\xff\xc0"
+    + struct.pack(">HBHH", 17, 8, 24, 48)
+)
+
+TGA_HEADER = bytes((0, 0, 2)) + bytes(9) + struct.pack("<HH", 128, 256) + b"\x20\x00"
+
+
+@pytest.mark.parametrize(
+    "name, data, header",
+    [
+        ("a.png", PNG_HEADER, smh.ImageHeader("PNG", 64, 32)),
+        ("a.bmp", BMP_HEADER, smh.ImageHeader("BMP", 16, 8)),
+        ("a.jpg", JPEG_HEADER, smh.ImageHeader("JPEG", 48, 24)),
+        ("a.tga", TGA_HEADER, smh.ImageHeader("TGA", 128, 256)),
+    ],
+)
+def test_read_image_header(tmp_path, name, data, header):
+    path = tmp_path / name
+    path.write_bytes(data + bytes(100))
+    assert smh.read_image_header(path) == header
+
+
+@pytest.mark.parametrize(
+    "name, data",
+    [
+        ("empty.png", b""),
+        ("text.png", b"not an image at all, just some text"),
+        # signature and IHDR, cut before the size
+        ("truncated.png", PNG_HEADER[:20]),
+        ("truncated.bmp", BMP_HEADER[:20]),
+        ("truncated.jpg", JPEG_HEADER[:-4]),
+        # segment length below 2
+        ("broken.jpg", b"\xff\xd8\xff\xe0\x00\x00" + bytes(20)),
+        ("truncated.tga", TGA_HEADER[:10]),
+        ("colormap.tga", bytes((0, 0, 7)) + TGA_HEADER[3:]),
+    ],
+)
+def test_read_image_header_unsupported(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    assert smh.read_image_header(path) is None
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+import simple_material_helper as smh
+
+
+def make_pixels(rows):
+    """Float RGBA pixels as from Image.pixels, from rows of 8-bit RGBA colors
+    listed top to bottom
+    """
+    colors = np.array(rows, dtype=np.float32) / 255
+    height, width = colors.shape[:2]
+    # Blender stores rows bottom to top
+    return colors[::-1].reshape(-1), width, height
+
+
+RED = (255, 0, 0, 255)
+TRANSPARENT_BLUE = (0, 0, 255, 0)
+HALF_TRANSPARENT_GREEN = (0, 255, 0, 128)
+WHITE = (255, 255, 255, 255)
+BLACK = (0, 0, 0, 255)
+
+COLORS = make_pixels([[RED, TRANSPARENT_BLUE], [HALF_TRANSPARENT_GREEN, WHITE]])
+
+
+@pytest.mark.parametrize(
+    "format, texels",
+    [
+        ("RGBA32", "ff0000ff" "0000ff00" "00ff0080" "ffffffff"),
+        ("RGBA16", "f801" "003e" "07c1" "ffff"),
+        ("IA16", "55ff" "5500" "5580" "ffff"),
+        ("IA8", "5f" "50" "58" "ff"),
+        ("IA4", "54" "5f"),
+        ("I8", "55" "55" "55" "ff"),
+        ("I4", "55" "5f"),
+    ],
+)
+def test_encode_n64_texture(format, texels):
+    data, tlut = smh.encode_n64_texture(*COLORS, format)
+    assert data.hex() == texels
+    assert tlut is None
+
+
+@pytest.mark.parametrize("format", ["CI4", "CI8"])
+def test_encode_n64_texture_palette(format):
+    data, tlut = smh.encode_n64_texture(*COLORS, format)
+    palette = np.frombuffer(tlut, dtype=">u2")
+    indices = np.frombuffer(data, dtype=np.uint8)
+    if format == "CI4":
+        indices = np.stack((indices >> 4, indices & 0xF), axis=1).reshape(-1)
+    rgba16, _ = smh.encode_n64_texture(*COLORS, "RGBA16")
+    np.testing.assert_array_equal(palette[indices], np.frombuffer(rgba16, ">u2"))
+
+
+def test_encode_n64_texture_sizes():
+    pixels, width, height = make_pixels(np.zeros((4, 8, 4)))
+    bits = {
+        "RGBA32": 32,
+        "RGBA16": 16,
+        "IA16": 16,
+        "IA8": 8,
+        "IA4": 4,
+        "I8": 8,
+        "I4": 4,
+        "CI8": 8,
+        "CI4": 4,
+    }
+    for format, format_bits in bits.items():
+        data, _ = smh.encode_n64_texture(pixels, width, height, format)
+        assert len(data) == width * height * format_bits // 8, format
+
+
+def test_encode_n64_texture_unknown_format():
+    with pytest.raises(ValueError):
+        smh.encode_n64_texture(*COLORS, "YUV16")
+
+
+def test_format_inc_c_pads_to_words():
+    assert smh.format_inc_c(bytes(range(10))) == (
+        "0x0001020304050607, 0x0809000000000000,\n"
+    )
+
+
+def test_analyze_pixels_grayscale():
+    analysis = smh.analyze_pixels(*make_pixels([[WHITE, BLACK], [BLACK, WHITE]]))
+    assert analysis.unique_colors == 2
+    assert analysis.alpha == "OPAQUE"
+    assert analysis.grayscale
+    assert analysis.best_lossless_format == "I4"
+    assert analysis.best_near_lossless_format == "I4"
+
+
+def test_analyze_pixels_colors():
+    analysis = smh.analyze_pixels(*COLORS)
+    assert (analysis.width, analysis.height) == (2, 2)
+    assert analysis.unique_colors == 4
+    assert analysis.alpha == "FULL"
+    assert not analysis.grayscale
+    assert analysis.format_errors["RGBA32"] == 0
+    assert analysis.format_errors["RGBA16"] > 0
+    assert analysis.best_lossless_format == "RGBA32"
+
+
+def test_analyze_pixels_binary_alpha():
+    analysis = smh.analyze_pixels(*make_pixels([[RED, TRANSPARENT_BLUE]]))
+    assert analysis.alpha == "BINARY"
+
+
+def test_n64_texture_fits_tmem():
+    assert smh.n64_texture_fits_tmem(64, 32, "RGBA16")
+    assert not smh.n64_texture_fits_tmem(64, 64, "RGBA16")
+    assert smh.n64_texture_fits_tmem(32, 32, "RGBA32")
+    assert not smh.n64_texture_fits_tmem(64, 32, "RGBA32")
+
+
+@pytest.mark.parametrize("format", ["CI4", "CI8"])
+@pytest.mark.parametrize("dither", [False, True])
+def test_quantize_pixels(format, dither):
+    rng = np.random.default_rng(0)
+    width, height = 16, 16
+    pixels = rng.random(width * height * 4).astype(np.float32)
+    indices, palette = smh.quantize_pixels(pixels, width, height, format, dither)
+    assert indices.shape == (width * height,)
+    assert len(palette) <= smh.N64_PALETTE_SIZES[format]
+    assert indices.max() < len(palette)
+    # N64 palettes are RGBA16 colors
+    np.testing.assert_array_equal(smh.to_rgba5551(palette), palette)
+
+
+def test_quantize_pixels_keeps_few_colors():
+    pixels, width, height = COLORS
+    indices, palette = smh.quantize_pixels(pixels, width, height, "CI4", False)
+    rgba8 = np.rint(pixels.reshape(-1, 4) * 255).astype(np.uint8)
+    np.testing.assert_array_equal(palette[indices], smh.to_rgba5551(rgba8))
@@ -0,0 +1,78 @@
+import pytest
+
+import simple_material_helper as smh
+
+NODE_SPECS = (
+    smh.NodeSpec(
+        "SMH Math",
+        "ShaderNodeMath",
+        (0, 0),
+        properties=(("operation", "MULTIPLY"),),
+        inputs=((1, 2.0),),
+    ),
+    smh.NodeSpec("SMH Output", "ShaderNodeOutputMaterial", (300, 0)),
+)
+
+LINK_SPECS = (smh.LinkSpec("SMH Math", "Value", "SMH Output", "Surface"),)
+
+
+@pytest.fixture
+def node_tree(addon):
+    return addon.bpy.data.node_groups.new("Nodes", "ShaderNodeTree")
+
+
+def reconcile(node_tree, dry_run=False):
+    return smh.reconcile_node_tree(node_tree, NODE_SPECS, LINK_SPECS, dry_run=dry_run)
+
+
+def test_reconcile_node_tree(node_tree):
+    result = reconcile(node_tree)
+    assert result.differences > 0
+    assert sorted(result.nodes) == ["SMH Math", "SMH Output"]
+    math = node_tree.nodes["SMH Math"]
+    assert result.nodes["SMH Math"] == math
+    assert math.operation == "MULTIPLY"
+    assert math.inputs[1].default_value == 2.0
+    (link,) = node_tree.links
+    assert (link.from_node, link.to_node) == (math, node_tree.nodes["SMH Output"])
+
+    assert reconcile(node_tree).differences == 0
+
+
+def test_reconcile_node_tree_dry_run_empty(node_tree):
+    result = reconcile(node_tree, dry_run=True)
+    # a missing node counts once
+    assert result == smh.ReconcileResult(nodes=dict(), differences=2)
+    assert len(node_tree.nodes) == 0
+
+
+def test_reconcile_node_tree_dry_run(node_tree):
+    reconcile(node_tree)
+    assert reconcile(node_tree, dry_run=True).differences == 0
+
+    math = node_tree.nodes["SMH Math"]
+    math.operation = "ADD"
+    math.inputs[1].default_value = 0.5
+    node_tree.nodes.new("ShaderNodeMath").name = "SMH Stale"
+    node_tree.links.remove(next(iter(node_tree.links)))
+
+    result = reconcile(node_tree, dry_run=True)
+    assert result.differences == 4
+    assert sorted(result.nodes) == ["SMH Math", "SMH Output"]
+    # nothing changed
+    assert math.operation == "ADD"
+    assert math.inputs[1].default_value == 0.5
+    assert len(node_tree.nodes) == 3
+    assert len(node_tree.links) == 0
+
+    assert reconcile(node_tree).differences == 4
+    assert math.operation == "MULTIPLY"
+    assert len(node_tree.nodes) == 2
+    assert len(node_tree.links) == 1
+
+
+def test_reconcile_node_tree_keeps_other_nodes(node_tree):
+    node_tree.nodes.new("ShaderNodeMath").name = "User Math"
+    reconcile(node_tree)
+    assert node_tree.nodes.get("User Math") is not None
+    assert reconcile(node_tree, dry_run=True).differences == 0
@@ -0,0 +1,89 @@
+import numpy as np
+
+import simple_material_helper as smh
+
+
+def make_uv_data(faces):
+    """(material index, [(u, v) of each loop]) of faces -> see read_mesh_uv_data"""
+    material_indices = np.array([index for index, _ in faces], dtype=np.int32)
+    loop_totals = [len(uvs) for _, uvs in faces]
+    loop_starts = np.array([0, *np.cumsum(loop_totals)[:-1]], dtype=np.int32)
+    uvs = np.array([uv for _, face_uvs in faces for uv in face_uvs], dtype=np.float32)
+    return material_indices, loop_starts, uvs
+
+
+QUAD = [(0, 0), (1, 0), (1, 1), (0, 1)]
+
+
+def test_compute_mesh_uv_stats():
+    stats = smh.compute_mesh_uv_stats(
+        make_uv_data(
+            [
+                (0, QUAD),
+                (1, [(1, -2), (3, -2), (3, 0)]),
+                (0, [(0.5, 0.5), (0.75, 0.5), (0.75, 2)]),
+            ]
+        )
+    )
+    assert sorted(stats) == [0, 1]
+    np.testing.assert_allclose(stats[0].uv_min, (0, 0))
+    np.testing.assert_allclose(stats[0].uv_max, (1, 2))
+    np.testing.assert_allclose(stats[0].face_span_max, (1, 1.5))
+    np.testing.assert_allclose(stats[0].face_abs_max, [(1, 1), (0.75, 2)])
+    np.testing.assert_allclose(stats[1].uv_min, (1, -2))
+    np.testing.assert_allclose(stats[1].uv_max, (3, 0))
+    np.testing.assert_allclose(stats[1].face_abs_max, [(3, 2)])
+
+
+def test_compute_mesh_uv_stats_unordered_loops():
+    # the loops of the first face come after those of the second one
+    material_indices = np.array((0, 1), dtype=np.int32)
+    loop_starts = np.array((3, 0), dtype=np.int32)
+    uvs = np.array(((5, 5), (6, 6), (5, 6), (0, 0), (1, 1), (0, 1)), dtype=np.float32)
+    stats = smh.compute_mesh_uv_stats((material_indices, loop_starts, uvs))
+    np.testing.assert_allclose(stats[0].uv_max, (1, 1))
+    np.testing.assert_allclose(stats[1].uv_min, (5, 5))
+
+
+def test_compute_mesh_uv_stats_no_uvs():
+    assert smh.compute_mesh_uv_stats(None) == dict()
+
+
+def test_suggest_uv_repeat():
+    assert smh.suggest_uv_repeat(0, 1, "WRAP") == "CLAMP"
+    assert smh.suggest_uv_repeat(-1e-5, 1 + 1e-5, "MIRROR") == "CLAMP"
+    assert smh.suggest_uv_repeat(0, 2, "MIRROR") == "MIRROR"
+    assert smh.suggest_uv_repeat(-1, 1, "CLAMP") == "WRAP"
+
+
+def make_material_mesh(bpy, image_size=(32, 32)):
+    image = bpy.data.images.new("Texture", *image_size)
+    mat = bpy.data.materials.new("Material")
+    mat.simple_material_helper.image = image
+    mesh = bpy.data.meshes.new("Mesh")
+    mesh.materials.append(mat)
+    uvs = [*QUAD, (0, 0), (40, 0), (40, 0.5), (0, 0.5)]
+    mesh.set_faces([4, 4], [0, 0], [c for uv in uvs for c in uv])
+    return mat
+
+
+def test_analyze_material_uvs(addon):
+    mat = make_material_mesh(addon.bpy)
+    uv_bounds = addon.analyze_material_uvs(mat)
+    assert uv_bounds.faces == 2
+    assert uv_bounds.uv_min == (0, 0)
+    assert uv_bounds.uv_max == (40, 1)
+    # 40 * 32 texels is past the 1024 texels limit
+    assert uv_bounds.overflowing_faces == 1
+    assert (uv_bounds.suggested_uv_repeat_u, uv_bounds.suggested_uv_repeat_v) == (
+        "WRAP",
+        "CLAMP",
+    )
+
+
+def test_get_loaded_material_uvs(addon):
+    mat = make_material_mesh(addon.bpy)
+    # drawing never analyzes
+    assert addon.get_loaded_material_uvs(mat) == (False, None)
+    uv_bounds = addon.analyze_material_uvs(mat)
+    assert addon.get_loaded_material_uvs(mat) == (True, uv_bounds)
@@ -0,0 +1,132 @@
+"""Run a Simple Material Helper command on many .blend files,
+with several background Blender processes in parallel.
+
+    python tools/smh_batch.py --blender /path/to/blender -j 8 rooms/ -- refresh --save
+
+Directories are searched for .blend files recursively. The arguments after
+"--" are the command line of simple_material_helper.py, see
+
+    blender -b --python simple_material_helper.py -- --help
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ADDON_PATH = Path(__file__).resolve().parent.parent / "simple_material_helper.py"
+CLI_RESULT_PREFIX = "SMH_RESULT "
+
+
+def parse_args(argv):
+    if "--" in argv:
+        i = argv.index("--")
+        argv, command = argv[:i], argv[i + 1 :]
+    else:
+        command = []
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="+", type=Path, help=".blend files or folders")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="number of Blender processes at once (default: number of cores)",
+    )
+    parser.add_argument("--addon", type=Path, default=ADDON_PATH)
+    parser.add_argument("--json", type=Path, help="also write the results to a file")
+    args = parser.parse_args(argv)
+    if not command:
+        parser.error("missing command after --")
+    args.command = command
+    return args
+
+
+def find_blend_files(paths):
+    blend_files = []
+    for path in paths:
+        if path.is_dir():
+            blend_files.extend(sorted(path.rglob("*.blend")))
+        else:
+            blend_files.append(path)
+    return blend_files
+
+
+def process_file(args, blend_file: Path):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [
+            args.blender,
+            "-b",
+            # don't load the addon if installed, the script registers it
+            "--factory-startup",
+            str(blend_file),
+            "--python",
+            str(args.addon),
+            "--",
+            *args.command,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    result = {"file": str(blend_file)}
+    for line in completed.stdout.splitlines():
+        if line.startswith(CLI_RESULT_PREFIX):
+            result = json.loads(line[len(CLI_RESULT_PREFIX) :])
+    result["file"] = str(blend_file)
+    result["exit_code"] = completed.returncode
+    result["seconds"] = time.perf_counter() - start
+    if completed.returncode != 0:
+        result["output"] = completed.stdout
+    return result
+
+
+def main(argv):
+    args = parse_args(argv)
+    blend_files = find_blend_files(args.paths)
+
+    results = []
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        futures = [
+            executor.submit(process_file, args, blend_file)
+            for blend_file in blend_files
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            summary = {
+                key: value
+                for key, value in result.items()
+                if key not in {"file", "command", "exit_code", "seconds", "output"}
+            }
+            status = "ok" if result["exit_code"] == 0 else "FAILED"
+            print(
+                f"[{len(results)}/{len(blend_files)}] {status} {result['file']} "
+                f"({result['seconds']:.1f}s) {json.dumps(summary)}"
+            )
+            if "error" in result or ("output" in result and "problems" not in result):
+                print(result.get("output", ""))
+
+    failed = [result for result in results if result["exit_code"] != 0]
+    print(
+        f"{len(results) - len(failed)}/{len(results)} files ok "
+        f"in {time.perf_counter() - start:.1f}s with {args.jobs} jobs"
+    )
+
+    if args.json:
+        results.sort(key=lambda result: result["file"])
+        with args.json.open("w") as f:
+            json.dump(results, f, indent=1)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))